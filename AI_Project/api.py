@@ -0,0 +1,452 @@
+# api.py
+"""
+Headless SmartTrack HTTP API.
+
+A small asyncio HTTP/1.1 server (keep-alive, JSON responses) in front of the
+SmartTrack core. Lookups are dictionary hits served on the event loop; QR decoding,
+dataset loading and tracking reads run on a fixed thread pool. Each pool thread
+keeps its own SQLite connection, so the pool doubles as the connection pool.
+
+    GET  /health                        loaded datasets and their content hashes
+    PUT  /datasets/{customers|locations|hubs|road_nodes}   CSV body; returns its content hash
+    PUT  /datasets/road_edges           edge list (src,dst,km per line)
+    GET  /orders/{order_id}
+    GET  /orders/{order_id}/eta
+    GET  /orders/{order_id}/tracking    ?history=1 adds the event history
+    POST /qr/decode                     image body (PNG/JPG); matched order ids included
+
+Datasets are kept by content hash (the last MAX_VERSIONS per kind). Order, ETA and
+QR requests use the most recent upload of each kind unless they name versions,
+e.g. ?customers=<hash>&locations=<hash>&road_edges= (empty = not used); a named
+version the server no longer has gets a 503 with "missing": <kind>, and the
+client uploads it again.
+
+    python api.py --customers Customer.csv --locations Location.csv --port 8080
+"""
+import argparse
+import asyncio
+import copy
+import json
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, quote, unquote, urlsplit
+
+import requests
+
+from roads import RoadNetwork, load_road_network, read_road_edges, read_road_nodes, road_km_by_postcode
+from smarttrack import (
+    DEFAULT_HUBS, HUB_HOME_KMH, PORT, PORT_HUB_KMH, assign_hubs_cached, build_order_index,
+    build_postcode_index, content_hash, decode_qr_bytes, eta_hours, haversine,
+    read_customers, read_hubs, read_locations,
+)
+from tracking import STATUSES, TrackingStore
+
+MAX_BODY = 64 * 1024 * 1024
+READERS = {"customers": read_customers, "locations": read_locations, "hubs": read_hubs,
+           "road_edges": read_road_edges, "road_nodes": read_road_nodes}
+INDEX_SOURCES = {"orders": "customers", "postcodes": "locations"}
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+# Versions kept per dataset kind, and indexed views (one per combination of versions)
+MAX_VERSIONS = 8
+MAX_VIEWS = 8
+
+
+class DatasetMissing(RuntimeError):
+    """A request named a dataset version the server does not hold (never uploaded, or evicted)."""
+
+    def __init__(self, kind: str, key: str):
+        super().__init__(f"{kind} dataset {key} not loaded")
+        self.kind = kind
+        self.key = key
+
+# =====================================================
+# SERVICE
+# =====================================================
+class SmartTrackService:
+    """
+    Datasets by content hash plus lookup indexes for the combinations in use. Views are
+    immutable once built, so readers never see a half-built index, and sessions that
+    upload different files never replace each other's data.
+    """
+
+    def __init__(self, store: TrackingStore = None):
+        self.store = store or TrackingStore()
+        self._lock = threading.Lock()
+        self._build_lock = threading.Lock()
+        hubs_hash = content_hash(DEFAULT_HUBS.to_csv(index=False).encode("utf-8"))
+        self._versions: Dict[str, "OrderedDict[str, Any]"] = {kind: OrderedDict() for kind in READERS}
+        self._versions["hubs"][hubs_hash] = DEFAULT_HUBS
+        self._latest: Dict[str, str] = {"hubs": hubs_hash}
+        self._views: "OrderedDict[Tuple[Tuple[str, str], ...], Dict[str, Any]]" = OrderedDict()
+        self._networks: "OrderedDict[str, RoadNetwork]" = OrderedDict()
+
+    def _road_network(self, tables: Dict[str, Tuple[str, Any]]) -> Optional[RoadNetwork]:
+        """The network for the selected road tables, rebuilt only when they change."""
+        if "road_edges" not in tables or "road_nodes" not in tables:
+            return None
+        (edges_hash, graph), (nodes_hash, nodes) = tables["road_edges"], tables["road_nodes"]
+        key = f"{edges_hash}.{nodes_hash}"
+        if key not in self._networks:
+            self._networks[key] = load_road_network(edges_hash, graph, nodes_hash, nodes)
+            while len(self._networks) > 2:
+                self._networks.popitem(last=False)
+        self._networks.move_to_end(key)
+        return self._networks[key]
+
+    def _build(self, tables: Dict[str, Tuple[str, Any]]) -> Dict[str, Any]:
+        view: Dict[str, Any] = {"hashes": {kind: key for kind, (key, _) in tables.items()}}
+        if "customers" in tables:
+            cust_df = tables["customers"][1]
+            view["cust_df"] = cust_df
+            view["orders"] = build_order_index(cust_df)
+        if "locations" in tables and "hubs" in tables:
+            (loc_hash, loc_df), (hubs_hash, hubs_df) = tables["locations"], tables["hubs"]
+            view["postcodes"] = build_postcode_index(loc_df)
+            hub_map = assign_hubs_cached(loc_hash, loc_df, hubs_hash, hubs_df)
+            view["hubs"] = dict(zip(hub_map.index.tolist(), zip(
+                hub_map["hub_id"].tolist(), hub_map["hub_latitude"].tolist(),
+                hub_map["hub_longitude"].tolist(), hub_map["hub_km"].tolist())))
+            network = self._road_network(tables)
+            if network is not None:
+                road_km = road_km_by_postcode(network, loc_df, hub_map).dropna()
+                view["road_km"] = dict(zip(road_km.index.tolist(), road_km.tolist()))
+        return view
+
+    def load(self, kind: str, data: bytes) -> Dict[str, Any]:
+        """Parse and store an uploaded CSV under its content hash. Raises LookupError/ValueError on bad input."""
+        if kind not in READERS:
+            raise LookupError(f"Unknown dataset: {kind}")
+        key = content_hash(data)
+        with self._lock:
+            df = self._versions[kind].get(key)
+        if df is None:
+            key, df = READERS[kind](data)
+        with self._lock:
+            versions = self._versions[kind]
+            versions[key] = df
+            versions.move_to_end(key)
+            self._latest[kind] = key
+            while len(versions) > MAX_VERSIONS:
+                old, _ = versions.popitem(last=False)
+                for combo in [c for c in self._views if (kind, old) in c]:
+                    del self._views[combo]
+        self.view()  # index the newest combination here, on the loading thread
+        return {"dataset": kind, "hash": key, "rows": len(df)}
+
+    def _resolve(self, selection: Optional[Dict[str, str]]) -> Tuple[Tuple[Tuple[str, str], ...], Dict[str, Tuple[str, Any]]]:
+        """(view key, kind -> (hash, table)) for a selection; kinds not named use the latest upload."""
+        selection = selection or {}
+        tables = {}
+        with self._lock:
+            for kind, versions in self._versions.items():
+                # Named explicitly (an empty value means "not used"), else the latest upload
+                key = selection[kind] if kind in selection else self._latest.get(kind)
+                if not key:
+                    continue
+                if key not in versions:
+                    raise DatasetMissing(kind, key)
+                versions.move_to_end(key)
+                tables[kind] = (key, versions[key])
+        return tuple(sorted((kind, key) for kind, (key, _) in tables.items())), tables
+
+    def cached_view(self, selection: Optional[Dict[str, str]] = None) -> Optional[Dict[str, Any]]:
+        """The already-built view for a selection, or None (cheap enough for the event loop)."""
+        combo, _ = self._resolve(selection)
+        with self._lock:
+            view = self._views.get(combo)
+            if view is not None:
+                self._views.move_to_end(combo)
+            return view
+
+    def view(self, selection: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Indexes over the selected dataset versions (kind -> content hash), built on first
+        use. Raises DatasetMissing for a version the server does not hold.
+        """
+        view = self.cached_view(selection)
+        if view is not None:
+            return view
+        with self._build_lock:  # concurrent first requests for a combination build it once
+            view = self.cached_view(selection)
+            if view is None:
+                combo, tables = self._resolve(selection)
+                view = self._build(tables)
+                with self._lock:
+                    self._views[combo] = view
+                    while len(self._views) > MAX_VIEWS:
+                        self._views.popitem(last=False)
+        return view
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            versions = {kind: list(v) for kind, v in self._versions.items() if v}
+            return {"status": "ok", "datasets": dict(self._latest), "versions": versions}
+
+    def _current(self, selection: Optional[Dict[str, str]], *indexes: str) -> Dict[str, Any]:
+        """The selected view; RuntimeError if a dataset behind one of `indexes` is missing."""
+        view = self.view(selection)
+        for key in indexes:
+            if key not in view:
+                raise RuntimeError(f"{INDEX_SOURCES[key]} dataset not loaded")
+        return view
+
+    def order(self, order_id: str, selection: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        view = self._current(selection, "orders")
+        pos = view["orders"].get(order_id)
+        if pos is None:
+            raise LookupError(f"Order not found: {order_id}")
+        return view["cust_df"].iloc[pos].to_dict()
+
+    def eta(self, order_id: str, selection: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        view = self._current(selection, "orders", "postcodes")
+        postcode = str(self.order(order_id, selection)["postal code"])
+        loc = view["postcodes"].get(postcode)
+        if loc is None:
+            raise LookupError(f"Latitude/Longitude not found for postcode: {postcode}")
+        area, lat, lon = loc
+        hub_id, hub_lat, hub_lon, hub_km = view["hubs"][postcode]
+        road_km = view.get("road_km", {}).get(postcode)
+        if road_km is None:
+            eta = float(eta_hours(lat, lon, hub=(hub_lat, hub_lon)))
+        else:
+            eta = float(haversine(*PORT, hub_lat, hub_lon)) / PORT_HUB_KMH + road_km / HUB_HOME_KMH
+        return {
+            "order id": order_id, "postal code": postcode, "area": area,
+            "latitude": lat, "longitude": lon,
+            "hub_id": hub_id, "hub_km": hub_km, "road_km": road_km,
+            "eta_hours": eta,
+        }
+
+    def tracking(self, order_id: str, history: bool = False) -> Dict[str, Any]:
+        latest = self.store.latest(order_id)
+        status, ts = latest if latest else (0, None)
+        out = {"order id": order_id, "status": status, "status_name": STATUSES[status], "ts": ts}
+        if history:
+            out["history"] = self.store.history(order_id)
+        return out
+
+    def decode(self, data: bytes, multi: bool = True, selection: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        values, stage = decode_qr_bytes(data, multi=multi)
+        orders = self.view(selection).get("orders", {})
+        return {"values": values, "stage": stage, "orders": [v for v in values if v in orders]}
+
+# =====================================================
+# HTTP
+# =====================================================
+async def read_message(reader: asyncio.StreamReader) -> Optional[Tuple[str, Dict[str, str], bytes]]:
+    """One HTTP/1.1 message (request or response): (start line, lower-cased headers, body)."""
+    line = await reader.readline()
+    if not line:
+        return None
+    headers: Dict[str, str] = {}
+    while True:
+        h = await reader.readline()
+        if h in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = h.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ValueError("Body too large")
+    body = await reader.readexactly(length) if length else b""
+    return line.decode("latin-1").rstrip("\r\n"), headers, body
+
+
+def _json_default(obj):
+    return obj.item() if hasattr(obj, "item") else str(obj)
+
+
+class ApiServer:
+    def __init__(self, service: SmartTrackService, workers: int = 16):
+        self.service = service
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="smarttrack-api")
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, Any]:
+        url = urlsplit(target)
+        parts = [unquote(p) for p in url.path.strip("/").split("/") if p]
+        query = parse_qs(url.query, keep_blank_values=True)
+        svc = self.service
+        loop = asyncio.get_running_loop()
+
+        def blocking(fn, *args):
+            return loop.run_in_executor(self.pool, fn, *args)
+
+        # Dataset versions named in the query (kind=<content hash>)
+        selection = {kind: values[0] for kind, values in query.items() if kind in READERS}
+
+        try:
+            if parts == ["health"] and method == "GET":
+                return 200, svc.health()
+            if len(parts) == 2 and parts[0] == "datasets" and method == "PUT":
+                return 200, await blocking(svc.load, parts[1], body)
+            if parts == ["qr", "decode"] and method == "POST":
+                multi = query.get("multi", ["1"])[0] != "0"
+                return 200, await blocking(svc.decode, body, multi, selection)
+            if len(parts) >= 2 and parts[0] == "orders" and method == "GET":
+                if parts[2:] in ([], ["eta"]) and svc.cached_view(selection) is None:
+                    await blocking(svc.view, selection)  # first request for these versions
+                if len(parts) == 2:
+                    return 200, svc.order(parts[1], selection)
+                if parts[2:] == ["eta"]:
+                    return 200, svc.eta(parts[1], selection)
+                if parts[2:] == ["tracking"]:
+                    history = query.get("history", ["0"])[0] == "1"
+                    return 200, await blocking(svc.tracking, parts[1], history)
+            return 404, {"error": f"No route for {method} {url.path}"}
+        except LookupError as e:
+            return 404, {"error": str(e.args[0] if e.args else e)}
+        except ValueError as e:
+            return 400, {"error": str(e)}
+        except DatasetMissing as e:
+            return 503, {"error": str(e), "missing": e.kind}
+        except RuntimeError as e:
+            return 503, {"error": str(e)}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                msg = await read_message(reader)
+                if msg is None:
+                    break
+                start, headers, body = msg
+                method, target, _ = start.split(" ", 2)
+                try:
+                    code, payload = await self.dispatch(method, target, body)
+                except Exception as e:  # keep the connection usable after a handler bug
+                    code, payload = 500, {"error": repr(e)}
+                data = json.dumps(payload, default=_json_default).encode("utf-8")
+                close = headers.get("connection", "").lower() == "close"
+                writer.write(
+                    f"HTTP/1.1 {code} {REASONS.get(code, '')}\r\n"
+                    f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n"
+                    f"Connection: {'close' if close else 'keep-alive'}\r\n\r\n".encode("latin-1") + data
+                )
+                await writer.drain()
+                if close:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8080) -> asyncio.AbstractServer:
+        return await asyncio.start_server(self.handle, host, port, backlog=1024)
+
+
+def start_background(service: SmartTrackService, host: str = "127.0.0.1", port: int = 0,
+                     workers: int = 16) -> str:
+    """Serve the API from a daemon thread (port 0 = any free port). Returns the base URL."""
+    started = threading.Event()
+    bound: Dict[str, int] = {}
+
+    async def run():
+        server = await ApiServer(service, workers).start(host, port)
+        bound["port"] = server.sockets[0].getsockname()[1]
+        started.set()
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True, name="smarttrack-api").start()
+    if not started.wait(10):
+        raise RuntimeError("SmartTrack API did not start")
+    return f"http://{host}:{bound['port']}"
+
+# =====================================================
+# CLIENT
+# =====================================================
+class SmartTrackClient:
+    """
+    Blocking client over one keep-alive session; lookups return None on 404.
+    A client from using() names its own dataset versions on every lookup and
+    uploads one again if the server has dropped it.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.datasets: Dict[str, Tuple[str, bytes]] = {}
+
+    def using(self, datasets: Dict[str, Tuple[str, bytes]]) -> "SmartTrackClient":
+        """Client bound to kind -> (content hash, raw upload); kinds left out are not used. Shares the session."""
+        client = copy.copy(self)
+        client.datasets = dict(datasets)
+        return client
+
+    def _selection(self) -> str:
+        if not self.datasets:
+            return ""
+        return "&".join(f"{kind}={self.datasets[kind][0] if kind in self.datasets else ''}" for kind in READERS)
+
+    def _call(self, method: str, path: str, data: bytes = None, select: bool = False) -> Optional[Dict[str, Any]]:
+        url = self.base_url + path
+        if select and self.datasets:
+            url += ("&" if "?" in path else "?") + self._selection()
+        for attempt in range(2):
+            r = self.session.request(method, url, data=data, timeout=self.timeout)
+            if r.status_code == 404:
+                return None
+            if r.status_code == 503 and not attempt and r.json().get("missing") in self.datasets:
+                kind = r.json()["missing"]
+                self.put_dataset(kind, self.datasets[kind][1])
+                continue
+            if r.status_code >= 400:
+                raise RuntimeError(r.json().get("error", r.text))
+            return r.json()
+
+    def health(self) -> Dict[str, Any]:
+        return self._call("GET", "/health")
+
+    def put_dataset(self, kind: str, data: bytes) -> Dict[str, Any]:
+        return self._call("PUT", f"/datasets/{kind}", data)
+
+    def order(self, order_id: str) -> Optional[Dict[str, Any]]:
+        return self._call("GET", f"/orders/{quote(order_id, safe='')}", select=True)
+
+    def eta(self, order_id: str) -> Optional[Dict[str, Any]]:
+        return self._call("GET", f"/orders/{quote(order_id, safe='')}/eta", select=True)
+
+    def tracking(self, order_id: str, history: bool = False) -> Dict[str, Any]:
+        return self._call("GET", f"/orders/{quote(order_id, safe='')}/tracking?history={int(history)}")
+
+    def decode_qr(self, image: bytes, multi: bool = True) -> Dict[str, Any]:
+        return self._call("POST", f"/qr/decode?multi={int(multi)}", image, select=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers")
+    parser.add_argument("--locations")
+    parser.add_argument("--hubs")
+    parser.add_argument("--road-edges", help="Edge list: src,dst,km per line")
+    parser.add_argument("--road-nodes", help="CSV: node, latitude, longitude")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--workers", type=int, default=16, help="Thread pool / SQLite connection pool size")
+    parser.add_argument("--db", default=None, help="Tracking event store (default: cache dir)")
+    args = parser.parse_args(argv)
+
+    service = SmartTrackService(TrackingStore(args.db) if args.db else None)
+    for kind in ("hubs", "road_edges", "road_nodes", "customers", "locations"):
+        path = getattr(args, kind)
+        if path:
+            with open(path, "rb") as fh:
+                print(json.dumps(service.load(kind, fh.read())), flush=True)
+
+    async def run():
+        server = await ApiServer(service, args.workers).start(args.host, args.port)
+        print(f"SmartTrack API on http://{args.host}:{args.port}", flush=True)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
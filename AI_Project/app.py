@@ -1,11 +1,19 @@
 import streamlit as st
-import pandas as pd
-import cv2
-import numpy as np
-from PIL import Image
-import qrcode
 import io
-from math import radians, sin, cos, sqrt, asin
+import os
+import tempfile
+from datetime import datetime
+
+import requests
+
+from smarttrack import (
+    read_customers, read_locations, read_hubs, compute_etas, assign_hubs_cached, content_hash, DEFAULT_HUBS,
+    qr_png, write_qr_zip, write_qr_pdf,
+)
+from api import SmartTrackClient, SmartTrackService, start_background
+from routing import plan_routes
+from roads import read_road_edges, read_road_nodes, load_road_network, road_km_by_postcode
+from tracking import STATUSES, DELIVERED, TrackingStore, TrackingSimulator
 
 # =====================================================
 # PAGE CONFIG
@@ -15,45 +23,74 @@ st.set_page_config("SmartTrack Logistics", "📦", layout="wide")
 # =====================================================
 # SESSION STATE
 # =====================================================
-for k in ["cust_df", "loc_df", "order", "verified"]:
+for k in ["cust_df", "loc_df", "cust_hash", "loc_hash", "cust_data", "loc_data", "cust_file", "loc_file",
+          "hubs_file", "road_edges", "road_nodes", "road_edges_file", "road_nodes_file", "order", "verified"]:
     if k not in st.session_state:
         st.session_state[k] = None if k != "verified" else False
+if "hubs_df" not in st.session_state:
+    st.session_state.hubs_df = DEFAULT_HUBS
+    st.session_state.hubs_data = DEFAULT_HUBS.to_csv(index=False).encode("utf-8")
+    st.session_state.hubs_hash = content_hash(st.session_state.hubs_data)
 
 # =====================================================
 # UTILS
 # =====================================================
-def normalize_cols(df):
-    df.columns = df.columns.str.strip().str.lower()
-    return df
-
-def haversine(lat1, lon1, lat2, lon2):
-    R = 6371
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    dlat, dlon = lat2 - lat1, lon2 - lon1
-    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
-    return 2 * R * asin(sqrt(a))
-
 def generate_qr(text):
-    buf = io.BytesIO()
-    qrcode.make(text).save(buf)
-    buf.seek(0)
-    return buf
+    return io.BytesIO(qr_png(text))
+
+def fmt_time(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M")
 
 def decode_qr(upload):
+    """
+    (decoded QR values in the uploaded image, those that match a known order, error).
+    error is None when the API answered, so empty values then mean no QR was found.
+    """
     try:
-        pil_img = Image.open(upload).convert("L")
-        img = np.array(pil_img)
-
-        # Upscale + threshold (critical for Streamlit QR decoding)
-        img = cv2.resize(img, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
-        _, img = cv2.threshold(img, 150, 255, cv2.THRESH_BINARY)
-
-        detector = cv2.QRCodeDetector()
-        val, _, _ = detector.detectAndDecode(img)
-
-        return val.strip() if val else None
-    except Exception:
-        return None
+        result = api.decode_qr(upload.getvalue())
+    except (requests.ConnectionError, requests.Timeout) as e:
+        return [], [], f"SmartTrack API unreachable ({type(e).__name__}). Please try again."
+    except (RuntimeError, requests.RequestException) as e:
+        return [], [], f"SmartTrack API error while decoding: {e}"
+    if result is None:
+        return [], [], "SmartTrack API has no QR decoding endpoint (404)."
+    return result["values"], result["orders"], None
+
+# Order lookup, QR verify, ETA and tracking go through the SmartTrack API
+# (SMARTTRACK_API=http://host:port); without it an in-process server is started once.
+@st.cache_resource
+def api_client():
+    url = os.environ.get("SMARTTRACK_API") or start_background(SmartTrackService(tracking_store()))
+    return SmartTrackClient(url)
+
+@st.cache_resource(max_entries=32)
+def api_dataset(kind, data_hash, _data):
+    """Send a raw upload to the API once per content hash (the server keeps datasets by hash)."""
+    return api_client().put_dataset(kind, _data)
+
+@st.cache_resource(max_entries=4)
+def hub_map(loc_hash, hubs_hash, _loc_df, _hubs_df):
+    return assign_hubs_cached(loc_hash, _loc_df, hubs_hash, _hubs_df)
+
+@st.cache_resource(max_entries=2)
+def road_network(edges_hash, nodes_hash, _graph, _nodes):
+    return load_road_network(edges_hash, _graph, nodes_hash, _nodes)
+
+@st.cache_resource
+def tracking_store():
+    return TrackingStore()
+
+@st.cache_resource(max_entries=2)
+def tracking_simulator(cust_hash, _cust_df):
+    return TrackingSimulator(tracking_store(), _cust_df["order id"])
+
+@st.cache_resource(max_entries=2)
+def eta_report(cust_hash, loc_hash, hubs_hash, road_keys, _cust_df, _loc_df, _hubs_df, _roads=None):
+    hubs = hub_map(loc_hash, hubs_hash, _loc_df, _hubs_df)
+    # One shortest-path tree per hub (cached), then a lookup per postcode
+    road_km = road_km_by_postcode(_roads, _loc_df, hubs) if _roads is not None else None
+    report = compute_etas(_cust_df, _loc_df, hubs, road_km=road_km)
+    return report, report.to_csv(index=False).encode("utf-8")
 
 # =====================================================
 # SIDEBAR UPLOADS
@@ -61,16 +98,65 @@ def decode_qr(upload):
 with st.sidebar:
     st.header("📂 Upload CSV Files")
 
+    # Parsed once per upload (Parquet-cached by content hash); reruns reuse session state
     cust = st.file_uploader("Customer.csv", type="csv")
-    if cust:
-        st.session_state.cust_df = normalize_cols(pd.read_csv(cust))
+    if cust and st.session_state.cust_file != cust.file_id:
+        try:
+            st.session_state.cust_hash, st.session_state.cust_df = read_customers(cust.getvalue())
+            st.session_state.cust_data = cust.getvalue()
+            st.session_state.cust_file = cust.file_id
+        except ValueError as e:
+            st.session_state.cust_df = None
+            st.error(f"Customer.csv: {e}")
+    if cust and st.session_state.cust_df is not None:
         st.success("Customer loaded")
 
     loc = st.file_uploader("Postcode + Location.csv", type="csv")
-    if loc:
-        st.session_state.loc_df = normalize_cols(pd.read_csv(loc))
+    if loc and st.session_state.loc_file != loc.file_id:
+        try:
+            st.session_state.loc_hash, st.session_state.loc_df = read_locations(loc.getvalue())
+            st.session_state.loc_data = loc.getvalue()
+            st.session_state.loc_file = loc.file_id
+        except ValueError as e:
+            st.session_state.loc_df = None
+            st.error(f"Location CSV: {e}")
+    if loc and st.session_state.loc_df is not None:
         st.success("Postcode & Location loaded")
 
+    hubs = st.file_uploader("Hubs.csv (optional: hub_id, latitude, longitude)", type="csv")
+    if hubs and st.session_state.hubs_file != hubs.file_id:
+        try:
+            st.session_state.hubs_hash, st.session_state.hubs_df = read_hubs(hubs.getvalue())
+            st.session_state.hubs_data = hubs.getvalue()
+            st.session_state.hubs_file = hubs.file_id
+        except ValueError as e:
+            st.error(f"Hubs CSV: {e}")
+    st.caption(f"{len(st.session_state.hubs_df)} hub(s) registered; orders go to the nearest hub.")
+
+    with st.expander("🛣️ Road network (optional)"):
+        edges = st.file_uploader("Road edges (src,dst,km per line)", type=["txt", "csv"])
+        if edges and st.session_state.road_edges_file != edges.file_id:
+            try:
+                data = edges.getvalue()
+                st.session_state.road_edges = (*read_road_edges(data), data)
+                st.session_state.road_edges_file = edges.file_id
+            except ValueError as e:
+                st.session_state.road_edges = None
+                st.error(f"Road edges: {e}")
+        nodes = st.file_uploader("Road nodes.csv (node, latitude, longitude)", type="csv")
+        if nodes and st.session_state.road_nodes_file != nodes.file_id:
+            try:
+                data = nodes.getvalue()
+                st.session_state.road_nodes = (*read_road_nodes(data), data)
+                st.session_state.road_nodes_file = nodes.file_id
+            except ValueError as e:
+                st.session_state.road_nodes = None
+                st.error(f"Road nodes: {e}")
+        if st.session_state.road_edges and st.session_state.road_nodes:
+            st.caption(f"ETAs use road distances ({len(st.session_state.road_edges[1]):,} nodes).")
+        else:
+            st.caption("Without both files ETAs use straight-line distances.")
+
 # =====================================================
 # VALIDATION
 # =====================================================
@@ -83,24 +169,50 @@ if (
 
 cust_df = st.session_state.cust_df
 loc_df = st.session_state.loc_df
+hubs_df = st.session_state.hubs_df
+hub_keys = (st.session_state.cust_hash, st.session_state.loc_hash, st.session_state.hubs_hash)
+road_keys, roads = None, None
+if st.session_state.road_edges and st.session_state.road_nodes:
+    road_keys = (st.session_state.road_edges[0], st.session_state.road_nodes[0])
+    roads = road_network(*road_keys, st.session_state.road_edges[1], st.session_state.road_nodes[1])
+# The API keeps every upload by content hash; this session's client names its own
+# versions on each request, so other sessions' uploads never replace them
+datasets = {kind: (key, data) for kind, key, data in zip(
+    ("customers", "locations", "hubs"), hub_keys,
+    (st.session_state.cust_data, st.session_state.loc_data, st.session_state.hubs_data))}
+if road_keys:
+    datasets["road_edges"] = (road_keys[0], st.session_state.road_edges[2])
+    datasets["road_nodes"] = (road_keys[1], st.session_state.road_nodes[2])
+for kind, (key, data) in datasets.items():
+    api_dataset(kind, key, data)
+api = api_client().using(datasets)
 
 # =====================================================
-# COLUMN SAFETY CHECKS
+# TRACKING SIMULATOR
 # =====================================================
-required_customer = {"order id", "customer name", "postal code", "state"}
-if not required_customer.issubset(cust_df.columns):
-    st.error("Customer.csv must contain: order id, customer name, postal code, state")
-    st.stop()
-
-required_loc = {"postcode", "city_name", "latitude", "longitude"}
-if not required_loc.issubset(loc_df.columns):
-    st.error("Location CSV must contain: postcode, city_name, latitude, longitude")
-    st.stop()
+with st.sidebar:
+    st.header("🚚 Tracking Events")
+    store = tracking_store()
+    sim = tracking_simulator(st.session_state.cust_hash, cust_df)
+    sim.rate = st.number_input("Events per second", 1, 100_000, int(sim.rate), step=100, disabled=sim.running)
+    sim.speedup = st.number_input("Simulated seconds per real second", 1, 1_000_000, int(sim.speedup),
+                                  step=600, disabled=sim.running)
+    c1, c2 = st.columns(2)
+    if c1.button("▶ Start", disabled=sim.running, use_container_width=True):
+        sim.start()
+    if c2.button("⏹ Stop", disabled=not sim.running, use_container_width=True):
+        sim.stop()
+    if st.button("🗑 Clear event log", disabled=sim.running, use_container_width=True):
+        store.clear()
+    counts = store.status_counts()
+    st.caption(f"{'Running' if sim.running else 'Stopped'} · {store.event_count():,} events logged")
+    for i, name in enumerate(STATUSES):
+        st.caption(f"{name}: {counts.get(i, 0):,}")
 
 # =====================================================
 # TABS
 # =====================================================
-tab1, tab2 = st.tabs(["🛒 Buy & Track", "🚚 Tracking Progress"])
+tab1, tab2, tab3, tab4 = st.tabs(["🛒 Buy & Track", "🚚 Tracking Progress", "📊 ETA Report", "🗺️ Route Planner"])
 
 # =====================================================
 # TAB 1 – BUY & TRACK
@@ -119,6 +231,21 @@ with tab1:
         st.image(qr)
         st.download_button("Download QR", qr, f"{oid}.png")
 
+    with st.expander("📦 Bulk dispatch labels"):
+        label_fmt = st.radio("Format", ["ZIP of PNGs", "Multi-page PDF"], horizontal=True)
+        if st.button(f"Generate labels for all {len(cust_df):,} orders"):
+            # Rendered in a process pool and streamed to disk, not held in memory
+            suffix = ".zip" if label_fmt == "ZIP of PNGs" else ".pdf"
+            out = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+            with st.spinner("Rendering labels..."), out:
+                writer = write_qr_zip if suffix == ".zip" else write_qr_pdf
+                n = writer(cust_df["order id"].astype(str), out)
+            st.session_state.labels = (out.name, suffix, n)
+        if st.session_state.get("labels"):
+            path, suffix, n = st.session_state.labels
+            with open(path, "rb") as fh:
+                st.download_button(f"Download {n:,} labels", fh, f"labels{suffix}")
+
     upload = st.file_uploader(
         "Upload QR",
         type=["png", "jpg"],
@@ -126,15 +253,22 @@ with tab1:
     )
 
     if upload:
-        decoded = decode_qr(upload)
+        decoded_values, known, error = decode_qr(upload)
 
-        if decoded is None:
-            st.error("❌ Unable to read QR code. Please upload a clear QR image.")
+        if error:
+            st.error(f"❌ {error}")
+        elif not decoded_values:
+            st.error("❌ No QR code found in this image. Please upload a clear QR image.")
         else:
-            row = cust_df[cust_df["order id"].astype(str) == decoded]
-
-            if not row.empty:
-                st.session_state.order = row.iloc[0]
+            decoded = known[0] if known else decoded_values[0]
+            if len(decoded_values) > 1:
+                st.caption(f"{len(decoded_values)} QR codes detected in this image.")
+                if len(known) > 1:
+                    decoded = st.selectbox("Select parcel", known)
+            found = api.order(decoded)
+
+            if found is not None:
+                st.session_state.order = found
                 st.session_state.verified = True
                 st.success("QR verified successfully ✅")
 
@@ -153,6 +287,73 @@ with tab1:
                 Please return to **Buy & Track** and place a new order.
                 """)
 
+# =====================================================
+# TAB 3 – ETA REPORT (rendered before tab 2, which may st.stop())
+# =====================================================
+with tab3:
+    st.header("ETA Report – All Orders")
+
+    if st.button("Compute ETAs"):
+        st.session_state.eta_report = True
+
+    if st.session_state.get("eta_report"):
+        report, report_csv = eta_report(*hub_keys, road_keys, cust_df, loc_df, hubs_df, roads)
+        missing = int(report["eta_hours"].isna().sum())
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Orders", f"{len(report):,}")
+        c2.metric("Mean ETA (h)", f"{report['eta_hours'].mean():.2f}")
+        c3.metric("Unknown postcode", f"{missing:,}")
+        st.dataframe(report.head(1000), use_container_width=True, hide_index=True)
+        st.download_button("Download ETA report (CSV)", report_csv, "eta_report.csv", "text/csv")
+
+# =====================================================
+# TAB 4 – ROUTE PLANNER
+# =====================================================
+with tab4:
+    st.header("Multi-stop Van Routes from Hub")
+
+    hub_ids = hubs_df["hub_id"].astype(str).tolist()
+    hub_id = st.selectbox("Hub", hub_ids)
+    c1, c2, c3 = st.columns(3)
+    capacity = c1.number_input("Parcels per van", min_value=1, value=60, step=5)
+    max_vans = c2.number_input("Max vans (0 = unlimited)", min_value=0, value=0, step=1)
+    max_stops = c3.number_input("Orders to plan", min_value=1, value=1000, step=100)
+
+    if st.button("Plan routes"):
+        report, _ = eta_report(*hub_keys, road_keys, cust_df, loc_df, hubs_df, roads)
+        stops = report[report["hub_id"] == hub_id].dropna(subset=["latitude", "longitude"])
+        stops = stops.head(int(max_stops)).reset_index(drop=True)
+        hub_row = hubs_df.iloc[hub_ids.index(hub_id)]
+        try:
+            with st.spinner(f"Routing {len(stops):,} stops..."):
+                plan = plan_routes(stops["latitude"], stops["longitude"],
+                                   depot=(float(hub_row["latitude"]), float(hub_row["longitude"])),
+                                   capacity=capacity, max_vehicles=int(max_vans) or None)
+            stops["van"] = plan["stop_route"] + 1
+            stops["eta_hours"] = plan["stop_eta_hours"]
+            stops["sequence"] = 0
+            for r in plan["routes"]:
+                stops.loc[r, "sequence"] = range(1, len(r) + 1)
+            st.session_state.route_plan = (plan, stops.sort_values(["van", "sequence"]))
+        except ValueError as e:
+            st.error(str(e))
+
+    if st.session_state.get("route_plan"):
+        plan, stops = st.session_state.route_plan
+        m1, m2, m3 = st.columns(3)
+        m1.metric("Vans", len(plan["routes"]))
+        m2.metric("Total distance (km)", f"{plan['total_km']:,.1f}")
+        m3.metric("Latest ETA (h)", f"{stops['eta_hours'].max():.2f}")
+        st.dataframe(
+            [{"Van": v + 1, "Stops": len(r), "Distance (km)": round(km, 1),
+              "Last drop ETA (h)": round(float(stops.loc[stops["van"] == v + 1, "eta_hours"].max()), 2)}
+             for v, (r, km) in enumerate(zip(plan["routes"], plan["route_km"]))],
+            use_container_width=True, hide_index=True,
+        )
+        st.map(stops, latitude="latitude", longitude="longitude")
+        st.download_button("Download route sheet (CSV)", stops.to_csv(index=False).encode("utf-8"),
+                           "routes.csv", "text/csv")
+
 # =====================================================
 # TAB 2 – TRACKING
 # =====================================================
@@ -164,45 +365,41 @@ with tab2:
         st.stop()
 
     order = st.session_state.order
-    postcode = str(order["postal code"])
+    oid = str(order["order id"])
 
-    loc_row = loc_df[loc_df["postcode"].astype(str) == postcode]
-    if loc_row.empty:
-        st.error(f"Latitude/Longitude not found for postcode: {postcode}")
+    est = api.eta(oid)
+    if est is None:
+        st.error(f"Latitude/Longitude not found for postcode: {order['postal code']}")
         st.stop()
 
-    area = loc_row.iloc[0]["city_name"]
-    home_lat = loc_row.iloc[0]["latitude"]
-    home_lon = loc_row.iloc[0]["longitude"]
-
-    port = (3.9767, 103.4242)   # Port Kuantan
-    hub = (3.8168, 103.3317)    # Hub
-
-    eta = (
-        haversine(*port, *hub) / 70 +
-        haversine(*hub, home_lat, home_lon) / 40
-    )
-
-    steps = [
-        "📦 Order Confirmed",
-        "🚚 Picked Up from Port",
-        "🏭 At Hub",
-        "🛵 Out for Delivery",
-        "✅ Delivered"
-    ]
+    icons = ["📦", "🚚", "🏭", "🛵", "✅"]
+    steps = [f"{icon} {name}" for icon, name in zip(icons, STATUSES)]
 
-    current = 2
+    st.button("🔄 Refresh")
+    tracking = api.tracking(oid, history=True)
+    current, updated = tracking["status"], tracking["ts"]
     for i, s in enumerate(steps):
         st.markdown(
-            f"🔵 **{s}** _(Current)_" if i == current else
-            f"✅ **{s}**" if i < current else
+            f"🔵 **{s}** _(Current)_" if i == current and current != DELIVERED else
+            f"✅ **{s}**" if i <= current else
             f"⚪ {s}"
         )
+    if updated is None:
+        st.caption("No tracking events for this order yet; start the simulator in the sidebar.")
+    else:
+        st.caption(f"Last update: {fmt_time(updated)} (simulated clock)")
+        with st.expander("Event history"):
+            st.dataframe(
+                [{"status": STATUSES[status], "time": fmt_time(ts)}
+                 for status, ts in tracking["history"]],
+                use_container_width=True,
+            )
 
     st.markdown("---")
     st.info(f"""
-    **Order ID:** {order['order id']}  
-    **Area:** {area}  
-    **Home Location:** ({home_lat:.5f}, {home_lon:.5f})  
-    **ETA:** ⏱ {eta:.2f} hours  
+    **Order ID:** {oid}  
+    **Area:** {est['area']}  
+    **Hub:** {est['hub_id']} ({est['hub_km']:.1f} km away{'' if est['road_km'] is None else f", {est['road_km']:.1f} km by road"})  
+    **Home Location:** ({est['latitude']:.5f}, {est['longitude']:.5f})  
+    **ETA:** ⏱ {est['eta_hours']:.2f} hours  
     """)
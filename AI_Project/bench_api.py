@@ -0,0 +1,151 @@
+# bench_api.py
+"""
+Load test for the SmartTrack API: N concurrent keep-alive clients issue a mix of
+order, ETA, tracking and QR-decode requests; reports throughput and p50/p99 latency.
+
+Without --url a server is started in a subprocess on synthetic data (orders,
+postcodes, tracking events and QR images are generated first).
+
+    python bench_api.py --concurrency 300 --requests 30000
+    python bench_api.py --url http://127.0.0.1:8080 --customers Customer.csv
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List, Tuple
+from urllib.parse import quote, urlsplit
+
+import numpy as np
+
+from api import SmartTrackClient, read_message
+from bench_eta import synthetic_tables
+from smarttrack import qr_png, read_customers
+from tracking import TrackingStore, run_simulation, simulate_events
+
+# Share of requests per endpoint
+MIX = {"order": 0.3, "eta": 0.3, "tracking": 0.3, "qr": 0.1}
+
+
+async def client(host: str, port: int, jobs: List[Tuple[str, str, bytes]],
+                 results: Dict[str, List[float]], errors: Dict[str, int]):
+    """One keep-alive connection working through its share of the requests."""
+    reader, writer = await asyncio.open_connection(host, port)
+    for kind, target, body in jobs:
+        method = "POST" if body else "GET"
+        t0 = time.perf_counter()
+        writer.write(f"{method} {target} HTTP/1.1\r\nHost: {host}\r\n"
+                     f"Content-Length: {len(body)}\r\n\r\n".encode("latin-1") + body)
+        await writer.drain()
+        start, _, _ = await read_message(reader)
+        results[kind].append(time.perf_counter() - t0)
+        if not start.split(" ")[1].startswith("2"):
+            errors[kind] += 1
+    writer.close()
+
+
+async def run_load(url: str, jobs: List[Tuple[str, str, bytes]], concurrency: int):
+    parts = urlsplit(url)
+    results: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(client(parts.hostname, parts.port, jobs[i::concurrency], results, errors)
+                           for i in range(concurrency)))
+    return time.perf_counter() - t0, results, errors
+
+
+def build_jobs(order_ids: List[str], n: int, qr_images: int, seed: int = 0) -> List[Tuple[str, str, bytes]]:
+    rng = random.Random(seed)
+    images = [qr_png(oid) for oid in rng.sample(order_ids, min(qr_images, len(order_ids)))]
+    kinds = rng.choices(list(MIX), weights=list(MIX.values()), k=n)
+    jobs = []
+    for kind in kinds:
+        oid = quote(rng.choice(order_ids), safe="")
+        if kind == "order":
+            jobs.append((kind, f"/orders/{oid}", b""))
+        elif kind == "eta":
+            jobs.append((kind, f"/orders/{oid}/eta", b""))
+        elif kind == "tracking":
+            jobs.append((kind, f"/orders/{oid}/tracking", b""))
+        else:
+            jobs.append((kind, "/qr/decode", rng.choice(images)))
+    return jobs
+
+
+def start_server(tmp: str, orders: int, postcodes: int, port: int) -> Tuple[subprocess.Popen, List[str]]:
+    cust_df, loc_df = synthetic_tables(orders, postcodes)
+    cust_csv, loc_csv, db = (os.path.join(tmp, name) for name in ("customers.csv", "locations.csv", "tracking.sqlite3"))
+    cust_df.to_csv(cust_csv, index=False)
+    loc_df.to_csv(loc_csv, index=False)
+    order_ids = cust_df["order id"].tolist()
+    run_simulation(TrackingStore(db), simulate_events(order_ids), batch=5000, limit=orders * 3)
+
+    env = {**os.environ, "SMARTTRACK_CACHE": os.path.join(tmp, "cache")}
+    proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "api.py"),
+                             "--customers", cust_csv, "--locations", loc_csv, "--db", db, "--port", str(port)],
+                            env=env, stdout=subprocess.DEVNULL)
+    client = SmartTrackClient(f"http://127.0.0.1:{port}", timeout=2)
+    for _ in range(600):
+        try:
+            if "locations" in client.health()["datasets"]:
+                return proc, order_ids
+        except Exception:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("API server did not start")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=None, help="Existing server (default: start one on synthetic data)")
+    parser.add_argument("--customers", default=None, help="Order ids for --url")
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--postcodes", type=int, default=5000)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--qr-images", type=int, default=50)
+    parser.add_argument("--qr-share", type=float, default=MIX["qr"],
+                        help="Fraction of requests that upload an image for decoding (CPU heavy)")
+    args = parser.parse_args()
+    MIX["qr"] = args.qr_share
+    if args.url and not args.customers:
+        parser.error("--customers is required with --url")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = None
+        if args.url:
+            with open(args.customers, "rb") as fh:
+                order_ids = read_customers(fh.read())[1]["order id"].astype(str).tolist()
+            url = args.url
+        else:
+            proc, order_ids = start_server(tmp, args.orders, args.postcodes, args.port)
+            url = f"http://127.0.0.1:{args.port}"
+        try:
+            jobs = build_jobs(order_ids, args.requests, args.qr_images)
+            elapsed, results, errors = asyncio.run(run_load(url, jobs, args.concurrency))
+        finally:
+            if proc is not None:
+                proc.terminate()
+                proc.wait()
+
+    total = sum(len(v) for v in results.values())
+    print(f"{total:,} requests, {args.concurrency} concurrent clients, {elapsed:.2f} s "
+          f"({total / elapsed:,.0f} req/s)")
+    print(f"{'endpoint':<10}{'count':>8}{'errors':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for kind in list(MIX) + ["all"]:
+        lat = [x for v in results.values() for x in v] if kind == "all" else results[kind]
+        err = sum(errors.values()) if kind == "all" else errors[kind]
+        if lat:
+            ms = np.array(lat) * 1000
+            print(f"{kind:<10}{len(ms):>8}{err:>8}{np.percentile(ms, 50):>10.2f}{np.percentile(ms, 99):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# bench_eta.py
+"""
+Benchmark the vectorised ETA job against the old per-order scalar loop.
+
+    python bench_eta.py --orders 1000000 --postcodes 5000
+"""
+import argparse
+import time
+from math import radians, sin, cos, sqrt, asin
+
+import numpy as np
+import pandas as pd
+
+from smarttrack import PORT, HUB, PORT_HUB_KMH, HUB_HOME_KMH, compute_etas
+
+
+def scalar_haversine(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat, dlon = lat2 - lat1, lon2 - lon1
+    a = sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2
+    return 2 * 6371 * asin(sqrt(a))
+
+
+def synthetic_tables(n_orders: int, n_postcodes: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    postcodes = np.array([f"{25000 + i:05d}" for i in range(n_postcodes)])
+    loc_df = pd.DataFrame({
+        "postcode": postcodes,
+        "city_name": [f"City {i % 200}" for i in range(n_postcodes)],
+        "latitude": rng.uniform(1.5, 6.5, n_postcodes),
+        "longitude": rng.uniform(100.5, 104.5, n_postcodes),
+    })
+    cust_df = pd.DataFrame({
+        "order id": [f"ORD{i:08d}" for i in range(n_orders)],
+        "customer name": "Customer",
+        "postal code": rng.choice(postcodes, n_orders),
+        "state": "Pahang",
+    })
+    return cust_df, loc_df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--postcodes", type=int, default=5000)
+    parser.add_argument("--scalar-sample", type=int, default=20_000,
+                        help="Orders timed with the scalar loop (extrapolated)")
+    args = parser.parse_args()
+
+    cust_df, loc_df = synthetic_tables(args.orders, args.postcodes)
+
+    t0 = time.perf_counter()
+    report = compute_etas(cust_df, loc_df)
+    vec_s = time.perf_counter() - t0
+
+    # Old path: filter the location table and call scalar haversine per order
+    sample = cust_df.head(args.scalar_sample)
+    lookup = loc_df.set_index("postcode")
+    t0 = time.perf_counter()
+    scalar = []
+    for pc in sample["postal code"]:
+        row = lookup.loc[pc]
+        scalar.append(scalar_haversine(*PORT, *HUB) / PORT_HUB_KMH +
+                      scalar_haversine(*HUB, row["latitude"], row["longitude"]) / HUB_HOME_KMH)
+    scalar_s = (time.perf_counter() - t0) * len(cust_df) / max(len(sample), 1)
+
+    err = np.max(np.abs(report["eta_hours"].to_numpy()[:len(scalar)] - np.array(scalar)))
+    print(f"orders:               {len(cust_df):,}")
+    print(f"vectorised job:       {vec_s:.3f} s  ({len(cust_df) / vec_s:,.0f} orders/s)")
+    print(f"scalar loop (extrap): {scalar_s:.1f} s")
+    print(f"max |difference|:     {err:.2e} h")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+# bench_qr_decode.py
+"""
+Decode-rate and latency benchmark on a synthetic scan corpus built with qr_png().
+
+Compares the original decode_qr (2x INTER_CUBIC upscale + fixed threshold, new
+detector per call) with the staged pipeline in smarttrack.decode_qr_array.
+With --folder, decodes a folder of real scans with smarttrack.decode_folder
+(process pool) and reports throughput; --save writes the synthetic corpus out
+as JPEGs to try that on.
+
+    python bench_qr_decode.py --n 300
+    python bench_qr_decode.py --n 300 --save scans/
+    python bench_qr_decode.py --folder scans/ --workers 4
+"""
+import argparse
+import os
+import random
+import time
+from collections import Counter
+
+import cv2
+import numpy as np
+
+from smarttrack import decode_folder, decode_qr_array, qr_png
+
+
+def legacy_decode(gray):
+    img = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    _, img = cv2.threshold(img, 150, 255, cv2.THRESH_BINARY)
+    val, _, _ = cv2.QRCodeDetector().detectAndDecode(img)
+    return [val.strip()] if val else []
+
+
+def degrade(img, rng):
+    """Simulated phone scan: downscale, blur, uneven lighting, sensor noise, JPEG."""
+    h, w = img.shape
+    scale = rng.uniform(0.35, 1.0)
+    img = cv2.resize(img, (int(w * scale), int(h * scale)), interpolation=cv2.INTER_AREA)
+    if rng.random() < 0.5:
+        img = cv2.GaussianBlur(img, (3, 3), 0)
+    gradient = np.linspace(rng.uniform(0.55, 1.0), 1.0, img.shape[1])[None, :]
+    img = img.astype(np.float32) * gradient + np.random.default_rng(rng.randrange(1 << 30)).normal(0, 8, img.shape)
+    img = np.clip(img, 0, 255).astype(np.uint8)
+    ok, enc = cv2.imencode(".jpg", img, [cv2.IMWRITE_JPEG_QUALITY, rng.randint(40, 90)])
+    return cv2.imdecode(enc, cv2.IMREAD_GRAYSCALE)
+
+
+def synthetic_corpus(n, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(n):
+        text = f"ORD{rng.randrange(10**7):07d}"
+        img = cv2.imdecode(np.frombuffer(qr_png(text), np.uint8), cv2.IMREAD_GRAYSCALE)
+        corpus.append(([text], degrade(img, rng)))
+    # A few sheets with several parcels side by side
+    for i in range(max(1, n // 20)):
+        texts = [f"ORD{rng.randrange(10**7):07d}" for _ in range(3)]
+        imgs = [cv2.imdecode(np.frombuffer(qr_png(t), np.uint8), cv2.IMREAD_GRAYSCALE) for t in texts]
+        corpus.append((texts, degrade(np.hstack(imgs), rng)))
+    return corpus
+
+
+def run(name, corpus, fn):
+    lat, hits, codes, total = [], 0, 0, 0
+    for expected, img in corpus:
+        t0 = time.perf_counter()
+        got = fn(img)
+        lat.append((time.perf_counter() - t0) * 1000)
+        found = len(set(got) & set(expected))
+        codes += found
+        total += len(expected)
+        hits += found > 0
+    print(f"{name:<22} images decoded {hits}/{len(corpus)}  codes {codes}/{total}  "
+          f"p50 {np.percentile(lat, 50):.2f} ms  p99 {np.percentile(lat, 99):.2f} ms  mean {sum(lat) / len(lat):.2f} ms")
+
+
+def run_folder(folder, multi, workers):
+    t0 = time.perf_counter()
+    rows = list(decode_folder(folder, multi=multi, workers=workers))
+    elapsed = time.perf_counter() - t0
+    if not rows:
+        print(f"no .png/.jpg/.jpeg files in {folder}")
+        return
+    lat = [ms for *_, ms in rows]
+    stages = Counter(stage or "none" for _, _, stage, _ in rows)
+    print(f"{len(rows):,} scans in {elapsed:.2f} s ({len(rows) / elapsed:,.1f} scans/s, "
+          f"{workers or os.cpu_count() or 1} worker(s))  decoded {sum(1 for _, v, _, _ in rows if v)}/{len(rows)}  "
+          f"codes {sum(len(v) for _, v, _, _ in rows)}")
+    print(f"per scan: p50 {np.percentile(lat, 50):.2f} ms  p99 {np.percentile(lat, 99):.2f} ms  "
+          f"stages {dict(stages.most_common())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=300, help="Single-code images in the corpus")
+    parser.add_argument("--folder", help="Decode every scan in this folder with decode_folder instead")
+    parser.add_argument("--workers", type=int, default=None, help="--folder: worker processes (default: CPU count)")
+    parser.add_argument("--multi", action="store_true", help="--folder: return every code in each scan")
+    parser.add_argument("--save", help="Write the synthetic corpus to this folder as JPEGs")
+    args = parser.parse_args()
+
+    if args.folder:
+        run_folder(args.folder, args.multi, args.workers)
+        return
+    corpus = synthetic_corpus(args.n)
+    if args.save:
+        os.makedirs(args.save, exist_ok=True)
+        for i, (texts, img) in enumerate(corpus):
+            cv2.imwrite(os.path.join(args.save, f"{i:05d}_{'-'.join(texts)}.jpg"), img)
+        print(f"{len(corpus)} scans -> {args.save}")
+    run("legacy (upscale first)", corpus, legacy_decode)
+    run("staged", corpus, lambda img: decode_qr_array(img)[0])
+    run("staged + multi", corpus, lambda img: decode_qr_array(img, multi=True)[0])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+# qr_labels.py
+"""
+Render dispatch QR labels for every order in a Customer CSV.
+
+    python qr_labels.py Customer.csv labels.zip
+    python qr_labels.py Customer.csv labels.pdf --workers 8
+"""
+import argparse
+import time
+
+from smarttrack import read_customers, write_qr_pdf, write_qr_zip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("customers", help="Customer CSV (needs an 'order id' column)")
+    parser.add_argument("output", help="Output .zip (PNG per order) or .pdf (one page per order)")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    args = parser.parse_args()
+
+    with open(args.customers, "rb") as fh:
+        _, cust_df = read_customers(fh.read())
+    writer = write_qr_pdf if args.output.lower().endswith(".pdf") else write_qr_zip
+
+    t0 = time.perf_counter()
+    with open(args.output, "wb") as out:
+        n = writer(cust_df["order id"].astype(str), out, workers=args.workers)
+    elapsed = time.perf_counter() - t0
+    print(f"{n:,} labels -> {args.output} in {elapsed:.2f} s ({n / elapsed:,.0f} labels/s)")
+
+
+if __name__ == "__main__":
+    main()
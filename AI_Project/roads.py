@@ -0,0 +1,250 @@
+# roads.py
+"""
+Road-network distances for SmartTrack ETAs.
+
+The network is an edge list in the same format as Lecture/Chapter2/UCS_streamlit.py
+(`src,dst,cost` per line, comma or whitespace separated, '#' comments), with cost in
+km, plus a node table (node, latitude, longitude) used to snap hubs and postcodes to
+their nearest graph node. Each hub gets one single-source shortest-path tree
+(Dijkstra), cached in memory and on disk, so every order at that hub is a lookup.
+
+    python roads.py --nodes 20000 --hubs 5 --postcodes 5000     # benchmark on a random grid
+"""
+import argparse
+import heapq
+import math
+import time
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from smarttrack import CACHE_DIR, HubGridIndex, content_hash, read_table
+
+ROAD_NODE_COLUMNS = {"node", "latitude", "longitude"}
+
+# =====================================================
+# PARSING
+# =====================================================
+def parse_edges(text: str, undirected: bool = True) -> Dict[str, Dict[str, float]]:
+    """
+    Parse edges, one per line: source,target,cost (comma or whitespace separated).
+    Ignores blank lines and lines starting with '#'. Later duplicates win.
+    Raises ValueError for a cost that is negative, NaN or infinite (Dijkstra needs
+    finite non-negative lengths).
+    """
+    graph: Dict[str, Dict[str, float]] = {}
+    for raw in text.splitlines():
+        line = raw.strip()
+        if not line or line.startswith('#'):
+            continue
+        parts = line.replace(',', ' ').split()
+        if len(parts) != 3:
+            raise ValueError(f"Invalid edge line: '{line}'. Expected: src dst cost")
+        u, v, w = parts
+        try:
+            w_val = float(w)
+        except ValueError:
+            raise ValueError(f"Invalid weight in line: '{line}'. Got '{w}'")
+        if not math.isfinite(w_val) or w_val < 0:
+            raise ValueError(f"Road length must be a finite number >= 0 in line: '{line}'")
+        graph.setdefault(u, {})[v] = w_val
+        graph.setdefault(v, {})
+        if undirected:
+            graph[v][u] = w_val
+    return graph
+
+def read_road_edges(data: bytes) -> Tuple[str, Dict[str, Dict[str, float]]]:
+    """(content_hash, graph) for an uploaded edge list."""
+    return content_hash(data), parse_edges(data.decode("utf-8"))
+
+def read_road_nodes(data: bytes) -> Tuple[str, pd.DataFrame]:
+    return read_table(data, "roadnodes", ROAD_NODE_COLUMNS)
+
+# =====================================================
+# NETWORK
+# =====================================================
+class RoadNetwork:
+    """
+    Compressed adjacency (CSR) over the graph, a spatial index over nodes that have
+    coordinates and at least one edge, and a per-source shortest-path tree cache.
+    `key` should identify the inputs (e.g. both content hashes); it names the disk cache.
+    """
+
+    def __init__(self, graph: Dict[str, Dict[str, float]], nodes: pd.DataFrame, key: str = None,
+                 cache_dir: Path = CACHE_DIR):
+        self.names: List[str] = list(graph)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+        counts = [len(graph[u]) for u in self.names]
+        self.indptr = np.r_[0, np.cumsum(counts)].astype(np.int64)
+        self.indices = np.fromiter((self.ids[v] for u in self.names for v in graph[u]),
+                                   dtype=np.int64, count=int(self.indptr[-1]))
+        self.weights = np.fromiter((w for u in self.names for w in graph[u].values()),
+                                   dtype=np.float64, count=int(self.indptr[-1]))
+        # Plain lists are much faster than NumPy scalars inside the Dijkstra loop
+        self._adj = (self.indptr.tolist(), self.indices.tolist(), self.weights.tolist())
+
+        nodes = nodes.assign(node=nodes["node"].astype(str)).drop_duplicates("node")
+        nodes = nodes[nodes["node"].map(lambda n: n in self.ids and bool(graph[n]))]
+        self.snap_ids = nodes["node"].map(self.ids).to_numpy(dtype=np.int64)
+        self.index = HubGridIndex(nodes["latitude"], nodes["longitude"])
+
+        self.key = key
+        self.cache_dir = cache_dir
+        self._trees: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def snap(self, lats: Sequence[float], lons: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """(node id, straight-line km to it) for every point; id -1 if no node has coordinates."""
+        idx, km = self.index.nearest(lats, lons)
+        node = np.full(len(idx), -1, dtype=np.int64)
+        node[idx >= 0] = self.snap_ids[idx[idx >= 0]]
+        return node, km
+
+    def _dijkstra(self, source: int) -> Tuple[np.ndarray, np.ndarray]:
+        indptr, indices, weights = self._adj
+        n = len(self.names)
+        dist = [float("inf")] * n
+        pred = [-1] * n
+        done = bytearray(n)
+        dist[source] = 0.0
+        heap = [(0.0, source)]
+        while heap:
+            d, u = heapq.heappop(heap)
+            if done[u]:
+                continue
+            done[u] = 1
+            for k in range(indptr[u], indptr[u + 1]):
+                v = indices[k]
+                nd = d + weights[k]
+                if nd < dist[v]:
+                    dist[v] = nd
+                    pred[v] = u
+                    heapq.heappush(heap, (nd, v))
+        return np.asarray(dist), np.asarray(pred, dtype=np.int64)
+
+    def tree(self, source: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(km from `source` to every node, predecessor on the shortest path), computed once."""
+        if source in self._trees:
+            return self._trees[source]
+        path = self.cache_dir / f"{self.key}.{source}.spt.npz" if self.key else None
+        if path is not None and path.exists():
+            try:
+                with np.load(path) as f:
+                    self._trees[source] = (f["dist"], f["pred"])
+                return self._trees[source]
+            except Exception:
+                pass  # unreadable cache entry; recompute
+        self._trees[source] = self._dijkstra(source)
+        if path is not None:
+            try:
+                self.cache_dir.mkdir(parents=True, exist_ok=True)
+                np.savez(path, dist=self._trees[source][0], pred=self._trees[source][1])
+            except OSError:
+                pass
+        return self._trees[source]
+
+    def path(self, source: int, target: int) -> List[str]:
+        """Node names along the shortest path (empty if unreachable)."""
+        dist, pred = self.tree(source)
+        if not np.isfinite(dist[target]):
+            return []
+        nodes = [target]
+        while nodes[-1] != source:
+            nodes.append(int(pred[nodes[-1]]))
+        return [self.names[i] for i in reversed(nodes)]
+
+def load_road_network(edges_hash: str, graph: Dict[str, Dict[str, float]],
+                      nodes_hash: str, nodes: pd.DataFrame) -> RoadNetwork:
+    return RoadNetwork(graph, nodes, key=f"{edges_hash}.{nodes_hash}")
+
+# =====================================================
+# HUB -> POSTCODE DISTANCES
+# =====================================================
+def road_km_by_postcode(network: RoadNetwork, loc_df: pd.DataFrame, hub_map: pd.DataFrame) -> pd.Series:
+    """
+    Road km from each postcode's assigned hub (hub_map from assign_hubs) to the postcode:
+    hub -> nearest node, shortest path, nearest node -> postcode. NaN when unreachable.
+    """
+    locs = loc_df[["postcode", "latitude", "longitude"]].copy()
+    locs["postcode"] = locs["postcode"].astype(str)
+    locs = locs.drop_duplicates("postcode")
+    hubs = hub_map.reindex(locs["postcode"])
+    node, snap_km = network.snap(locs["latitude"].to_numpy(dtype=np.float64),
+                                 locs["longitude"].to_numpy(dtype=np.float64))
+    km = np.full(len(locs), np.nan)
+    hub_ids = hubs["hub_id"].to_numpy(dtype=object)
+    for hub_id in pd.unique(hub_ids[pd.notna(hub_ids)]):
+        at = np.flatnonzero((hub_ids == hub_id) & (node >= 0))
+        if not len(at):
+            continue
+        first = at[0]
+        hub_node, hub_snap = network.snap([hubs["hub_latitude"].iat[first]], [hubs["hub_longitude"].iat[first]])
+        if hub_node[0] < 0:
+            continue
+        dist = network.tree(int(hub_node[0]))[0]
+        km[at] = hub_snap[0] + dist[node[at]] + snap_km[at]
+    km[~np.isfinite(km)] = np.nan
+    return pd.Series(km, index=pd.Index(locs["postcode"].to_numpy(), name="postcode"), name="road_km")
+
+# =====================================================
+# BENCHMARK
+# =====================================================
+def grid_network(n_nodes: int, center: Tuple[float, float], spacing_km: float = 1.0,
+                 seed: int = 0) -> Tuple[str, pd.DataFrame]:
+    """Random street grid around `center`: edge-list text and node table."""
+    rng = np.random.default_rng(seed)
+    side = int(np.ceil(np.sqrt(n_nodes)))
+    deg = spacing_km / 111.0
+    ii, jj = np.divmod(np.arange(side * side), side)
+    nodes = pd.DataFrame({
+        "node": [f"N{k}" for k in range(side * side)],
+        "latitude": center[0] + (ii - side / 2) * deg,
+        "longitude": center[1] + (jj - side / 2) * deg,
+    })
+    lines = []
+    for k in range(side * side):
+        for nb in ((k + 1) if jj[k] + 1 < side else None, (k + side) if ii[k] + 1 < side else None):
+            if nb is not None and rng.random() > 0.1:  # a few missing streets
+                lines.append(f"N{k},N{nb},{spacing_km * rng.uniform(1.0, 1.6):.3f}")
+    return "\n".join(lines), nodes
+
+
+def main():
+    from smarttrack import HUB, assign_hubs, haversine
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=20_000)
+    parser.add_argument("--hubs", type=int, default=5)
+    parser.add_argument("--postcodes", type=int, default=5000)
+    args = parser.parse_args()
+
+    text, nodes = grid_network(args.nodes, HUB)
+    rng = np.random.default_rng(1)
+    span = np.ptp(nodes["latitude"]) / 2
+    hubs = pd.DataFrame({"hub_id": [f"H{i}" for i in range(args.hubs)],
+                         "latitude": HUB[0] + rng.uniform(-span, span, args.hubs),
+                         "longitude": HUB[1] + rng.uniform(-span, span, args.hubs)})
+    loc_df = pd.DataFrame({"postcode": [f"{25000 + i}" for i in range(args.postcodes)],
+                           "latitude": HUB[0] + rng.uniform(-span, span, args.postcodes),
+                           "longitude": HUB[1] + rng.uniform(-span, span, args.postcodes)})
+    hub_map = assign_hubs(loc_df, hubs)
+
+    t0 = time.perf_counter()
+    network = RoadNetwork(parse_edges(text), nodes)
+    t1 = time.perf_counter()
+    km = road_km_by_postcode(network, loc_df, hub_map)
+    t2 = time.perf_counter()
+    km_again = road_km_by_postcode(network, loc_df, hub_map)
+    t3 = time.perf_counter()
+    straight = haversine(hub_map["hub_latitude"], hub_map["hub_longitude"], loc_df["latitude"], loc_df["longitude"])
+    print(f"nodes {len(network.names):,}  edges {len(network.indices):,}  hubs {args.hubs}  postcodes {args.postcodes:,}")
+    print(f"build network:        {t1 - t0:.2f} s")
+    print(f"first pass (trees):   {t2 - t1:.2f} s")
+    print(f"cached trees:         {(t3 - t2) * 1000:.1f} ms")
+    print(f"road / straight km:   {np.nanmedian(km.to_numpy() / straight):.2f} (median)")
+    print(f"unreachable:          {int(km_again.isna().sum())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# routing.py
+"""
+Multi-stop delivery routing for SmartTrack.
+
+Stops are assigned to capacity-limited vans by nearest-neighbour construction from
+the hub, then each route is improved independently with 2-opt and Or-opt moves
+(in parallel across vans). Distances are great-circle km from smarttrack.haversine.
+
+    python routing.py --stops 1000 --capacity 60     # benchmark on random stops
+"""
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from smarttrack import HUB, HUB_HOME_KMH, PORT, PORT_HUB_KMH, haversine
+
+EPS = 1e-9
+
+# =====================================================
+# DISTANCES
+# =====================================================
+def distance_matrix(lats: Sequence[float], lons: Sequence[float]) -> np.ndarray:
+    """Pairwise haversine km, computed in one broadcast pass."""
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    return haversine(lats[:, None], lons[:, None], lats[None, :], lons[None, :])
+
+def route_length(route: Sequence[int], dist: np.ndarray) -> float:
+    """Length of a closed tour given as node indices (depot first and last)."""
+    r = np.asarray(route)
+    return float(dist[r[:-1], r[1:]].sum())
+
+# =====================================================
+# CONSTRUCTION
+# =====================================================
+def nearest_neighbour_routes(dist: np.ndarray, demand: np.ndarray, capacity: float,
+                             max_vehicles: Optional[int] = None) -> List[List[int]]:
+    """
+    Node 0 is the depot. Each van starts at the depot and repeatedly drives to the
+    nearest unserved stop that still fits, returning when nothing fits.
+    """
+    n = dist.shape[0]
+    if np.any(demand[1:] > capacity):
+        raise ValueError("A single stop's demand exceeds vehicle capacity")
+    unserved = np.ones(n, dtype=bool)
+    unserved[0] = False
+    routes: List[List[int]] = []
+    while unserved.any():
+        if max_vehicles is not None and len(routes) >= max_vehicles:
+            raise ValueError(f"{int(unserved.sum())} stops left unserved: "
+                             f"{max_vehicles} vehicles x capacity {capacity} is not enough")
+        load, cur, route = 0.0, 0, [0]
+        while True:
+            fits = unserved & (demand + load <= capacity)
+            if not fits.any():
+                break
+            row = np.where(fits, dist[cur], np.inf)
+            nxt = int(np.argmin(row))
+            route.append(nxt)
+            unserved[nxt] = False
+            load += demand[nxt]
+            cur = nxt
+        route.append(0)
+        routes.append(route)
+    return routes
+
+# =====================================================
+# LOCAL SEARCH
+# =====================================================
+def two_opt(route: np.ndarray, dist: np.ndarray) -> np.ndarray:
+    """Best-improvement 2-opt; each pass evaluates all moves for one i in a vector op."""
+    r = np.asarray(route).copy()
+    n = len(r)
+    improved = True
+    while improved:
+        improved = False
+        for i in range(1, n - 2):
+            a, b = r[i - 1], r[i]
+            c, d = r[i + 1:n - 1], r[i + 2:n]
+            delta = dist[a, c] + dist[b, d] - dist[a, b] - dist[c, d]
+            k = int(np.argmin(delta))
+            if delta[k] < -EPS:
+                j = i + 1 + k
+                r[i:j + 1] = r[i:j + 1][::-1]
+                improved = True
+    return r
+
+def or_opt(route: np.ndarray, dist: np.ndarray, max_segment: int = 3) -> np.ndarray:
+    """Move segments of 1..max_segment stops (optionally reversed) to their best position."""
+    r = np.asarray(route).copy()
+    improved = True
+    while improved:
+        improved = False
+        for seg_len in range(1, max_segment + 1):
+            i = 1
+            while i + seg_len < len(r):
+                s0, s1 = r[i], r[i + seg_len - 1]
+                p, q = r[i - 1], r[i + seg_len]
+                gain = dist[p, s0] + dist[s1, q] - dist[p, q]
+                rest = np.concatenate([r[:i], r[i + seg_len:]])
+                u, v = rest[:-1], rest[1:]
+                fwd = dist[u, s0] + dist[s1, v] - dist[u, v]
+                rev = dist[u, s1] + dist[s0, v] - dist[u, v]
+                best = np.minimum(fwd, rev)
+                best[i - 1] = np.inf  # the slot it came from
+                k = int(np.argmin(best))
+                if best[k] < gain - EPS:
+                    seg = r[i:i + seg_len]
+                    if rev[k] < fwd[k]:
+                        seg = seg[::-1]
+                    r = np.concatenate([rest[:k + 1], seg, rest[k + 1:]])
+                    improved = True
+                else:
+                    i += 1
+    return r
+
+def improve_route(job: Tuple[List[int], np.ndarray]) -> List[int]:
+    """2-opt and Or-opt until neither improves. `job` = (route, dist submatrix for its nodes)."""
+    route, sub = job
+    local = np.arange(len(route) - 1).tolist() + [0]  # route order in submatrix coordinates
+    r = np.asarray(local)
+    best = route_length(r, sub)
+    while True:
+        r = or_opt(two_opt(r, sub), sub)
+        length = route_length(r, sub)
+        if length > best - EPS:
+            break
+        best = length
+    nodes = np.asarray(route[:-1])
+    return nodes[r].tolist()
+
+# =====================================================
+# PLANNER
+# =====================================================
+def plan_routes(lats: Sequence[float], lons: Sequence[float], depot: Tuple[float, float] = HUB,
+                capacity: float = 50, demand: Optional[Sequence[float]] = None,
+                max_vehicles: Optional[int] = None, workers: Optional[int] = None,
+                speed_kmh: float = HUB_HOME_KMH) -> Dict[str, Any]:
+    """
+    Plan van routes from `depot` to every stop. Returns:
+    - routes: per van, stop indexes (into lats/lons) in driving order
+    - route_km: per van round-trip distance; total_km
+    - stop_route, stop_eta_hours: per stop, its van and the ETA including the port -> hub leg
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    n = len(lats)
+    dist = distance_matrix(np.concatenate([[depot[0]], lats]), np.concatenate([[depot[1]], lons]))
+    dem = np.concatenate([[0.0], np.ones(n) if demand is None else np.asarray(demand, dtype=np.float64)])
+
+    routes = nearest_neighbour_routes(dist, dem, capacity, max_vehicles)
+    jobs = [(r, dist[np.ix_(r[:-1], r[:-1])]) for r in routes]
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            routes = list(pool.map(improve_route, jobs))
+    else:
+        routes = [improve_route(j) for j in jobs]
+
+    port_leg = float(haversine(*PORT, *depot)) / PORT_HUB_KMH
+    stop_route = np.full(n, -1)
+    stop_eta = np.full(n, np.nan)
+    route_km = []
+    for v, r in enumerate(routes):
+        r = np.asarray(r)
+        legs = dist[r[:-1], r[1:]]
+        arrive = np.cumsum(legs)[:-1]      # km driven when reaching each stop
+        stops = r[1:-1] - 1
+        stop_route[stops] = v
+        stop_eta[stops] = port_leg + arrive / speed_kmh
+        route_km.append(float(legs.sum()))
+
+    return {
+        "routes": [(np.asarray(r[1:-1]) - 1).tolist() for r in routes],
+        "route_km": route_km,
+        "total_km": float(sum(route_km)),
+        "stop_route": stop_route,
+        "stop_eta_hours": stop_eta,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--stops", type=int, default=1000)
+    parser.add_argument("--capacity", type=float, default=60)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    lats = HUB[0] + rng.normal(0, 0.15, args.stops)
+    lons = HUB[1] + rng.normal(0, 0.15, args.stops)
+
+    t0 = time.perf_counter()
+    dist = distance_matrix(np.r_[HUB[0], lats], np.r_[HUB[1], lons])
+    dem = np.r_[0.0, np.ones(args.stops)]
+    nn_km = sum(route_length(r, dist) for r in nearest_neighbour_routes(dist, dem, args.capacity))
+    t1 = time.perf_counter()
+    plan = plan_routes(lats, lons, capacity=args.capacity, workers=args.workers)
+    t2 = time.perf_counter()
+    print(f"stops {args.stops}  vans {len(plan['routes'])}  capacity {args.capacity:g}")
+    print(f"nearest neighbour: {nn_km:.1f} km  ({t1 - t0:.2f} s)")
+    print(f"+ 2-opt/Or-opt:    {plan['total_km']:.1f} km  ({t2 - t1:.2f} s)")
+    print(f"max stop ETA:      {np.nanmax(plan['stop_eta_hours']):.2f} h")
+
+
+if __name__ == "__main__":
+    main()
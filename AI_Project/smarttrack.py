@@ -0,0 +1,510 @@
+# smarttrack.py
+"""SmartTrack core helpers shared by the Streamlit app and offline jobs."""
+import hashlib
+import io
+import os
+import threading
+import time
+import zipfile
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+import cv2
+import numpy as np
+import pandas as pd
+import qrcode
+from PIL import Image
+
+CUSTOMER_COLUMNS = {"order id", "customer name", "postal code", "state"}
+LOCATION_COLUMNS = {"postcode", "city_name", "latitude", "longitude"}
+# Keys are kept as text so "01000" and "ORD-7" survive parsing unchanged
+STRING_COLUMNS = {"order id", "postal code", "postcode", "hub_id", "node"}
+HUB_COLUMNS = {"hub_id", "latitude", "longitude"}
+
+PORT = (3.9767, 103.4242)   # Port Kuantan
+HUB = (3.8168, 103.3317)    # Hub
+PORT_HUB_KMH = 70
+HUB_HOME_KMH = 40
+DEFAULT_HUBS = pd.DataFrame([{"hub_id": "KTN", "hub_name": "Kuantan Hub", "latitude": HUB[0], "longitude": HUB[1]}])
+EARTH_RADIUS_KM = 6371
+
+CACHE_DIR = Path(os.environ.get("SMARTTRACK_CACHE", Path(__file__).with_name(".cache")))
+
+# =====================================================
+# HASHING
+# =====================================================
+def content_hash(data: bytes) -> str:
+    """Stable key for an uploaded file's content."""
+    return hashlib.sha1(data).hexdigest()
+
+# =====================================================
+# INGESTION
+# =====================================================
+def normalize_cols(df: pd.DataFrame) -> pd.DataFrame:
+    df.columns = df.columns.str.strip().str.lower()
+    return df
+
+def read_table(data: bytes, name: str, required: Set[str], cache_dir: Path = CACHE_DIR) -> Tuple[str, pd.DataFrame]:
+    """
+    Parse an uploaded CSV once per content hash. Returns (content_hash, df).
+    - Column names are normalized; key columns are read as strings.
+    - Raises ValueError if a required column is missing.
+    - The parsed table is cached as <hash>.<name>.parquet under `cache_dir`
+      (best effort: a failed cache write never fails the upload).
+    """
+    key = content_hash(data)
+    path = cache_dir / f"{key}.{name}.parquet"
+    if path.exists():
+        try:
+            return key, pd.read_parquet(path)
+        except Exception:
+            pass  # unreadable cache entry; parse again
+
+    header = pd.read_csv(io.BytesIO(data), nrows=0).columns
+    names = {raw: raw.strip().lower() for raw in header}
+    missing = required - set(names.values())
+    if missing:
+        raise ValueError(f"Missing column(s): {', '.join(sorted(missing))}. "
+                         f"Required: {', '.join(sorted(required))}")
+    dtype = {raw: str for raw, name in names.items() if name in STRING_COLUMNS}
+    # low_memory=False infers each column from the whole file, so a column never
+    # ends up with mixed types across chunks
+    df = normalize_cols(pd.read_csv(io.BytesIO(data), dtype=dtype, low_memory=False))
+
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        df.to_parquet(path, index=False)
+    except Exception:
+        # e.g. pyarrow missing, read-only disk, or an object column Arrow can't convert
+        try:
+            path.unlink()
+        except OSError:
+            pass
+    return key, df
+
+def read_customers(data: bytes) -> Tuple[str, pd.DataFrame]:
+    return read_table(data, "customer", CUSTOMER_COLUMNS)
+
+def read_locations(data: bytes) -> Tuple[str, pd.DataFrame]:
+    return read_table(data, "location", LOCATION_COLUMNS)
+
+def read_hubs(data: bytes) -> Tuple[str, pd.DataFrame]:
+    return read_table(data, "hubs", HUB_COLUMNS)
+
+# =====================================================
+# INDEXES
+# =====================================================
+def build_order_index(cust_df: pd.DataFrame) -> Dict[str, int]:
+    """order id (as str) -> row position; the first row wins on duplicates."""
+    keys = cust_df["order id"].astype(str)
+    first = ~keys.duplicated()
+    return dict(zip(keys[first].tolist(), first.to_numpy().nonzero()[0].tolist()))
+
+def build_postcode_index(loc_df: pd.DataFrame) -> Dict[str, Tuple[str, float, float]]:
+    """postcode (as str) -> (city_name, latitude, longitude); the first row wins on duplicates."""
+    keys = loc_df["postcode"].astype(str)
+    first = ~keys.duplicated()
+    rows = loc_df.loc[first.to_numpy(), ["city_name", "latitude", "longitude"]]
+    return dict(zip(keys[first].tolist(), zip(rows["city_name"].tolist(),
+                                             rows["latitude"].tolist(),
+                                             rows["longitude"].tolist())))
+
+# =====================================================
+# DISTANCE & ETA
+# =====================================================
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km; accepts scalars or NumPy arrays (broadcasting)."""
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=np.float64)) for v in (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+def eta_hours(home_lat, home_lon, port=PORT, hub=HUB):
+    """Port -> hub at PORT_HUB_KMH, then hub -> home at HUB_HOME_KMH."""
+    return haversine(*port, *hub) / PORT_HUB_KMH + haversine(*hub, home_lat, home_lon) / HUB_HOME_KMH
+
+def compute_etas(cust_df: pd.DataFrame, loc_df: pd.DataFrame, hub_map: pd.DataFrame = None,
+                 port=PORT, road_km: pd.Series = None) -> pd.DataFrame:
+    """
+    ETA for every order in one vectorised pass, via the order's assigned hub.
+    `hub_map` comes from assign_hubs(loc_df, hubs); DEFAULT_HUBS is used when omitted.
+    `road_km` (per postcode, from roads.road_km_by_postcode) replaces the straight-line
+    hub -> home leg wherever it is known.
+    Orders whose postcode is not in the location table get NaN coordinates and ETA.
+    """
+    locs = loc_df[["postcode", "city_name", "latitude", "longitude"]].copy()
+    locs["postcode"] = locs["postcode"].astype(str)
+    locs = locs.drop_duplicates("postcode").set_index("postcode")
+    if hub_map is None:
+        hub_map = assign_hubs(loc_df, DEFAULT_HUBS)
+    hub_map = hub_map.reindex(locs.index)
+
+    report = cust_df[["order id", "customer name", "postal code", "state"]].copy()
+    pos = locs.index.get_indexer(report["postal code"].astype(str))
+    found = pos >= 0
+    take = np.where(found, pos, 0)
+
+    def column(frame, name, dtype=np.float64, fill=np.nan):
+        values = frame[name].to_numpy(dtype=dtype) if len(frame) else np.array([fill], dtype=dtype)
+        return np.where(found, values[take], fill)
+
+    report["city_name"] = column(locs, "city_name", object, None)
+    report["latitude"] = lat = column(locs, "latitude")
+    report["longitude"] = lon = column(locs, "longitude")
+    report["hub_id"] = column(hub_map, "hub_id", object, None)
+    hub_lat, hub_lon = column(hub_map, "hub_latitude"), column(hub_map, "hub_longitude")
+    report["eta_hours"] = eta_hours(lat, lon, port, (hub_lat, hub_lon))
+    if road_km is not None:
+        road = column(road_km.reindex(locs.index).to_frame("road_km"), "road_km")
+        report["road_km"] = road
+        known = np.isfinite(road)
+        port_leg = haversine(*port, hub_lat, hub_lon) / PORT_HUB_KMH
+        report.loc[known, "eta_hours"] = (port_leg + road / HUB_HOME_KMH)[known]
+    return report
+
+# =====================================================
+# HUBS
+# =====================================================
+def _unit_vectors(lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Points on the unit sphere; a larger dot product means a shorter great-circle distance."""
+    la, lo = np.radians(lats), np.radians(lons)
+    return np.stack([np.cos(la) * np.cos(lo), np.cos(la) * np.sin(lo), np.sin(la)], axis=-1)
+
+class HubGridIndex:
+    """
+    Uniform lat/lon grid over hub locations for exact nearest-hub (haversine) queries.
+    Each query ranks the hubs in its 3x3 cell neighbourhood by unit-vector dot product;
+    the answer is exact when the winner lies within the neighbourhood's guaranteed radius,
+    otherwise that query falls back to a scan over all hubs (one matrix product).
+    Longitude wrap-around is not modelled.
+    """
+
+    def __init__(self, lats: Sequence[float], lons: Sequence[float], cell_deg: float = None):
+        self.lats = np.asarray(lats, dtype=np.float64)
+        self.lons = np.asarray(lons, dtype=np.float64)
+        self.vecs = _unit_vectors(self.lats, self.lons)
+        if cell_deg is None:
+            # About two hubs per cell on average
+            area = max(np.ptp(self.lats), 0.1) * max(np.ptp(self.lons), 0.1) if len(self.lats) else 1.0
+            cell_deg = float(np.sqrt(2 * area / max(len(self.lats), 1)))
+        self.cell = cell_deg
+        cells: Dict[Tuple[int, int], List[int]] = {}
+        for i, key in enumerate(zip(*self._cell_of(self.lats, self.lons))):
+            cells.setdefault(key, []).append(i)
+        self.cells = {k: np.asarray(v) for k, v in cells.items()}
+
+    def _cell_of(self, lats, lons):
+        return np.floor(lats / self.cell).astype(np.int64), np.floor(lons / self.cell).astype(np.int64)
+
+    def _brute(self, qvecs: np.ndarray) -> np.ndarray:
+        idx = np.empty(len(qvecs), dtype=np.int64)
+        chunk = max(1, (1 << 23) // len(self.vecs))  # ~64 MB of dot products at a time
+        for s in range(0, len(qvecs), chunk):
+            idx[s:s + chunk] = (qvecs[s:s + chunk] @ self.vecs.T).argmax(axis=1)
+        return idx
+
+    def nearest(self, lats: Sequence[float], lons: Sequence[float]) -> Tuple[np.ndarray, np.ndarray]:
+        """(hub index, distance km) for every query point."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        idx = np.full(len(lats), -1, dtype=np.int64)
+        if not len(self.lats) or not len(lats):
+            return idx, np.full(len(lats), np.inf)
+        qvecs = _unit_vectors(lats, lons)
+        ci, cj = self._cell_of(lats, lons)
+        keys = (ci << 32) + cj
+        order = np.argsort(keys, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(keys[order]) != 0])
+        bounds = np.r_[starts, len(keys)]
+        for g, first in enumerate(starts):
+            i, j = ci[order[first]], cj[order[first]]
+            cand = [self.cells[k] for k in ((i + di, j + dj) for di in (-1, 0, 1) for dj in (-1, 0, 1))
+                    if k in self.cells]
+            if cand:
+                cand = np.concatenate(cand)
+                q = order[bounds[g]:bounds[g + 1]]
+                idx[q] = cand[(qvecs[q] @ self.vecs[cand].T).argmax(axis=1)]
+        found = idx >= 0
+        dist = np.full(len(lats), np.inf)
+        dist[found] = haversine(lats[found], lons[found], self.lats[idx[found]], self.lons[idx[found]])
+        # Anything outside the 3x3 block is at least one cell away in lat or lon
+        c = np.radians(self.cell)
+        safe = EARTH_RADIUS_KM * np.minimum(c, np.arcsin(np.clip(np.cos(np.radians(lats)) * np.sin(c), 0, 1)))
+        redo = ~(dist <= safe)
+        if redo.any():
+            idx[redo] = self._brute(qvecs[redo])
+            dist[redo] = haversine(lats[redo], lons[redo], self.lats[idx[redo]], self.lons[idx[redo]])
+        return idx, dist
+
+def assign_hubs(loc_df: pd.DataFrame, hubs: pd.DataFrame, cell_deg: float = None) -> pd.DataFrame:
+    """
+    Nearest hub for every postcode in one bulk pass. Returns a frame indexed by postcode
+    with hub_id, hub_latitude, hub_longitude and hub_km (hub -> postcode distance).
+    """
+    locs = loc_df[["postcode", "latitude", "longitude"]].copy()
+    locs["postcode"] = locs["postcode"].astype(str)
+    locs = locs.drop_duplicates("postcode")
+    index = HubGridIndex(hubs["latitude"], hubs["longitude"], cell_deg)
+    nearest, km = index.nearest(locs["latitude"].to_numpy(dtype=np.float64),
+                                locs["longitude"].to_numpy(dtype=np.float64))
+    ok = nearest >= 0
+    take = np.where(ok, nearest, 0)
+    hub_ids = hubs["hub_id"].astype(str).to_numpy(dtype=object)
+    return pd.DataFrame({
+        "hub_id": np.where(ok, hub_ids[take], None),
+        "hub_latitude": np.where(ok, hubs["latitude"].to_numpy(dtype=np.float64)[take], np.nan),
+        "hub_longitude": np.where(ok, hubs["longitude"].to_numpy(dtype=np.float64)[take], np.nan),
+        "hub_km": km,
+    }, index=pd.Index(locs["postcode"].to_numpy(), name="postcode"))
+
+def assign_hubs_cached(loc_hash: str, loc_df: pd.DataFrame, hubs_hash: str, hubs: pd.DataFrame,
+                       cache_dir: Path = CACHE_DIR) -> pd.DataFrame:
+    """assign_hubs() persisted as Parquet per (location table, hub registry) content pair."""
+    path = cache_dir / f"{loc_hash}.{hubs_hash}.hubmap.parquet"
+    if path.exists():
+        try:
+            return pd.read_parquet(path)
+        except Exception:
+            pass
+    hub_map = assign_hubs(loc_df, hubs)
+    try:
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        hub_map.to_parquet(path)
+    except (ImportError, OSError):
+        pass
+    return hub_map
+
+# =====================================================
+# QR LABELS
+# =====================================================
+QR_BOX_SIZE = 10
+QR_BORDER = 4
+# Bulk labels use a fixed mask: any mask is valid QR, skipping the automatic
+# 8-way mask search makes encoding ~8x faster, and pattern 5 scanned as reliably
+# as the automatic choice with OpenCV in our label tests.
+BULK_MASK_PATTERN = 5
+
+def qr_matrix(text: str, mask_pattern: int = None) -> np.ndarray:
+    """Module matrix including the quiet-zone border (True = black)."""
+    qr = qrcode.QRCode(border=QR_BORDER, mask_pattern=mask_pattern)
+    qr.add_data(text)
+    qr.make(fit=True)
+    return np.array(qr.get_matrix(), dtype=bool)
+
+@lru_cache(maxsize=4096)
+def qr_png(text: str, mask_pattern: int = None) -> bytes:
+    """PNG bytes for one QR code, QR_BOX_SIZE pixels per module."""
+    pixels = np.repeat(np.repeat(~qr_matrix(text, mask_pattern), QR_BOX_SIZE, axis=0), QR_BOX_SIZE, axis=1)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="PNG")
+    return buf.getvalue()
+
+@lru_cache(maxsize=4096)
+def qr_bitmap(text: str, mask_pattern: int = None) -> Tuple[int, bytes]:
+    """(modules per side, zlib-compressed 1-bit rows) with one pixel per module, 0 = black."""
+    matrix = qr_matrix(text, mask_pattern)
+    return matrix.shape[0], zlib.compress(np.packbits(~matrix, axis=1).tobytes())
+
+def _render_chunk(job: Tuple[str, List[str]]):
+    fmt, texts = job
+    render = qr_png if fmt == "png" else qr_bitmap
+    return [render(t, BULK_MASK_PATTERN) for t in texts]
+
+def iter_qr_codes(payloads: Iterable[str], fmt: str = "png", workers: int = None,
+                  chunk: int = 64, cache_size: int = 4096) -> Iterator[Tuple[str, object]]:
+    """
+    Yield (payload, rendered) in input order; fmt "png" -> PNG bytes, "bitmap" -> qr_bitmap().
+    Chunks are rendered in a process pool with at most 2 * workers chunks in flight,
+    so memory stays bounded however many payloads there are. Payloads seen recently
+    are served from an LRU cache instead of being rendered again.
+    """
+    cache: "OrderedDict[str, object]" = OrderedDict()
+    workers = workers or os.cpu_count() or 1
+    it = iter(payloads)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = []  # (texts, future or None)
+
+        def submit() -> bool:
+            texts = [str(t) for _, t in zip(range(chunk), it)]
+            if not texts:
+                return False
+            todo = list(dict.fromkeys(t for t in texts if t not in cache))
+            pending.append((texts, todo, pool.submit(_render_chunk, (fmt, todo)) if todo else None))
+            return True
+
+        while len(pending) < 2 * workers and submit():
+            pass
+        while pending:
+            texts, todo, future = pending.pop(0)
+            if future is not None:
+                for t, out in zip(todo, future.result()):
+                    cache[t] = out
+                    if len(cache) > cache_size:
+                        cache.popitem(last=False)
+            rendered = {t: cache[t] for t in texts if t in cache}
+            for t in texts:
+                yield t, rendered[t] if t in rendered else _render_chunk((fmt, [t]))[0]
+            submit()
+
+def _distinct(payloads: Iterable[str]) -> Iterator[str]:
+    """Payloads in order, each once (a repeated order id is the same label)."""
+    seen = set()
+    for text in payloads:
+        if text not in seen:
+            seen.add(text)
+            yield text
+
+def write_qr_zip(payloads: Iterable[str], out: BinaryIO, workers: int = None) -> int:
+    """
+    Stream one <payload>.png per distinct payload into a ZIP; returns the number of labels.
+    Payloads that map to the same file name (e.g. "A/1" and "A_1") get a _2, _3... suffix.
+    """
+    names = set()
+    with zipfile.ZipFile(out, "w", compression=zipfile.ZIP_STORED) as zf:
+        for text, png in iter_qr_codes(_distinct(payloads), "png", workers):
+            base = name = _safe_name(text)
+            k = 1
+            while name in names:
+                k += 1
+                name = f"{base}_{k}"
+            names.add(name)
+            zf.writestr(f"{name}.png", png)
+    return len(names)
+
+def write_qr_pdf(payloads: Iterable[str], out: BinaryIO, workers: int = None,
+                 page_size: Tuple[int, int] = (288, 324)) -> int:
+    """
+    Stream a multi-page PDF, one label (QR + caption) per distinct payload and page; returns
+    the number of labels.
+    Pages are written as they are rendered, with the cross-reference table at the end.
+    """
+    pdf = _PdfStream(out)
+    catalog, pages_id, font = pdf.reserve(), pdf.reserve(), pdf.reserve()
+    pdf.write_obj(font, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    w, h = page_size
+    side = min(w, h - 36) - 24
+    page_ids = []
+    for text, (modules, bits) in iter_qr_codes(_distinct(payloads), "bitmap", workers):
+        img, content, page = pdf.reserve(), pdf.reserve(), pdf.reserve()
+        pdf.write_stream(img, bits, b"/Type /XObject /Subtype /Image /Width %d /Height %d "
+                         b"/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /FlateDecode" % (modules, modules))
+        caption = text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+        ops = (f"q {side} 0 0 {side} {(w - side) / 2} {h - side - 12} cm /Im0 Do Q "
+               f"BT /F1 12 Tf 12 18 Td ({caption}) Tj ET").encode("latin-1", "replace")
+        pdf.write_stream(content, ops)
+        pdf.write_obj(page, b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Contents %d 0 R "
+                      b"/Resources << /XObject << /Im0 %d 0 R >> /Font << /F1 %d 0 R >> >> >>"
+                      % (pages_id, w, h, content, img, font))
+        page_ids.append(page)
+    kids = b" ".join(b"%d 0 R" % p for p in page_ids)
+    pdf.write_obj(pages_id, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids)))
+    pdf.write_obj(catalog, b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    pdf.close(catalog)
+    return len(page_ids)
+
+def _safe_name(text: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in text) or "qr"
+
+class _PdfStream:
+    """Minimal sequential PDF writer: objects are written once, offsets kept for the xref."""
+
+    def __init__(self, out: BinaryIO):
+        self.out = out
+        self.offsets: Dict[int, int] = {}
+        self.next_id = 1
+        self.pos = 0
+        self._write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def _write(self, data: bytes):
+        self.out.write(data)
+        self.pos += len(data)
+
+    def reserve(self) -> int:
+        self.next_id += 1
+        return self.next_id - 1
+
+    def write_obj(self, obj_id: int, body: bytes):
+        self.offsets[obj_id] = self.pos
+        self._write(b"%d 0 obj\n%s\nendobj\n" % (obj_id, body))
+
+    def write_stream(self, obj_id: int, data: bytes, extra: bytes = b""):
+        self.write_obj(obj_id, b"<< %s /Length %d >>\nstream\n%s\nendstream" % (extra, len(data), data))
+
+    def close(self, root: int):
+        xref = self.pos
+        lines = [b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id]
+        lines += [b"%010d 00000 n \n" % self.offsets[i] for i in range(1, self.next_id)]
+        self._write(b"".join(lines))
+        self._write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, root, xref))
+
+# =====================================================
+# QR DECODING
+# =====================================================
+# Cheapest first; later stages only run when the earlier ones find nothing.
+DECODE_STAGES = ("native", "adaptive", "upscale")
+_local = threading.local()
+
+def _detector() -> "cv2.QRCodeDetector":
+    """One detector per thread (Streamlit sessions run in separate threads)."""
+    det = getattr(_local, "detector", None)
+    if det is None:
+        det = _local.detector = cv2.QRCodeDetector()
+    return det
+
+def _stage_image(gray: np.ndarray, stage: str) -> np.ndarray:
+    if stage == "native":
+        return gray
+    if stage == "adaptive":
+        return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_GAUSSIAN_C, cv2.THRESH_BINARY, 31, 5)
+    img = cv2.resize(gray, None, fx=2, fy=2, interpolation=cv2.INTER_CUBIC)
+    return cv2.threshold(img, 150, 255, cv2.THRESH_BINARY)[1]
+
+def decode_qr_array(gray: np.ndarray, multi: bool = False) -> Tuple[List[str], Optional[str]]:
+    """
+    Decode QR code(s) from a grayscale image. Returns (values, stage) where stage is the
+    DECODE_STAGES entry that succeeded (None if nothing was decoded).
+    With multi=True every code in the image is returned (detectAndDecodeMulti).
+    """
+    det = _detector()
+    for stage in DECODE_STAGES:
+        img = _stage_image(gray, stage)
+        try:
+            if multi:
+                ok, vals, _, _ = det.detectAndDecodeMulti(img)
+                vals = [v.strip() for v in vals if v and v.strip()] if ok else []
+            else:
+                val, _, _ = det.detectAndDecode(img)
+                vals = [val.strip()] if val and val.strip() else []
+        except cv2.error:
+            vals = []
+        if vals:
+            return list(dict.fromkeys(vals)), stage
+    return [], None
+
+def decode_qr_bytes(data: bytes, multi: bool = False) -> Tuple[List[str], Optional[str]]:
+    """Decode an encoded image (PNG/JPG bytes); undecodable files yield ([], None)."""
+    gray = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if gray is None:
+        return [], None
+    return decode_qr_array(gray, multi)
+
+def _decode_file(job: Tuple[str, bool]) -> Tuple[str, List[str], Optional[str], float]:
+    path, multi = job
+    t0 = time.perf_counter()
+    with open(path, "rb") as fh:
+        values, stage = decode_qr_bytes(fh.read(), multi)
+    return path, values, stage, (time.perf_counter() - t0) * 1000
+
+def decode_folder(folder: str, multi: bool = False, workers: int = None,
+                  extensions: Tuple[str, ...] = (".png", ".jpg", ".jpeg")) -> Iterator[Tuple[str, List[str], Optional[str], float]]:
+    """Yield (path, values, stage, latency_ms) for every scan in `folder`, decoded in a process pool."""
+    paths = sorted(str(p) for p in Path(folder).iterdir() if p.suffix.lower() in extensions)
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        yield from map(_decode_file, ((p, multi) for p in paths))
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_decode_file, ((p, multi) for p in paths), chunksize=16)
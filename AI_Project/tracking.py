@@ -0,0 +1,333 @@
+# tracking.py
+"""
+Order tracking events for SmartTrack.
+
+Status transitions are appended to a SQLite log (`events`, indexed by order id);
+an insert trigger keeps a `latest` table keyed by order id, so the current status
+of an order is a single primary-key lookup no matter how long the log grows.
+A simulator generates realistic progressions for every order.
+
+    python tracking.py simulate --customers Customer.csv --rate 2000 --speedup 3600
+    python tracking.py bench --orders 100000 --events 500000      # load test (temporary DB)
+"""
+import argparse
+import heapq
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from smarttrack import CACHE_DIR
+
+STATUSES = ("Order Confirmed", "Picked Up from Port", "At Hub", "Out for Delivery", "Delivered")
+DELIVERED = len(STATUSES) - 1
+# Mean hours spent in each status before the next one (gamma distributed per order)
+STAGE_HOURS = (6.0, 0.5, 4.0, 1.0)
+TRACKING_DB = CACHE_DIR / "tracking.sqlite3"
+
+Event = Tuple[str, int, float]   # (order_id, status, ts)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    seq      INTEGER PRIMARY KEY,
+    order_id TEXT NOT NULL,
+    status   INTEGER NOT NULL,
+    ts       REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS events_order ON events (order_id, seq);
+CREATE TABLE IF NOT EXISTS latest (
+    order_id TEXT PRIMARY KEY,
+    status   INTEGER NOT NULL,
+    ts       REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TRIGGER IF NOT EXISTS events_latest AFTER INSERT ON events BEGIN
+    INSERT OR REPLACE INTO latest (order_id, status, ts) VALUES (NEW.order_id, NEW.status, NEW.ts);
+END;
+"""
+
+# =====================================================
+# STORE
+# =====================================================
+class TrackingStore:
+    """
+    Append-only event log in SQLite (WAL mode, so readers never block the writer).
+    Connections are per thread; the same store can be shared by Streamlit sessions
+    and a simulator thread.
+    """
+
+    def __init__(self, path=TRACKING_DB):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    def append(self, events: Iterable[Event]) -> int:
+        """Append events in one transaction. Returns the number written."""
+        conn = self._conn()
+        with conn:
+            cur = conn.executemany("INSERT INTO events (order_id, status, ts) VALUES (?, ?, ?)", events)
+        return cur.rowcount
+
+    def latest(self, order_id: str) -> Optional[Tuple[int, float]]:
+        """(status, ts) of the order's most recent event, or None if it has none."""
+        return self._conn().execute(
+            "SELECT status, ts FROM latest WHERE order_id = ?", (order_id,)).fetchone()
+
+    def latest_all(self) -> Dict[str, Tuple[int, float]]:
+        return {oid: (status, ts) for oid, status, ts in
+                self._conn().execute("SELECT order_id, status, ts FROM latest")}
+
+    def history(self, order_id: str) -> List[Tuple[int, float]]:
+        """Every (status, ts) event for the order, oldest first."""
+        return self._conn().execute(
+            "SELECT status, ts FROM events WHERE order_id = ? ORDER BY seq", (order_id,)).fetchall()
+
+    def status_counts(self) -> Dict[int, int]:
+        """Number of orders currently in each status."""
+        return dict(self._conn().execute("SELECT status, COUNT(*) FROM latest GROUP BY status"))
+
+    def event_count(self) -> int:
+        return self._conn().execute("SELECT COALESCE(MAX(seq), 0) FROM events").fetchone()[0]
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM events")
+            conn.execute("DELETE FROM latest")
+
+# =====================================================
+# SIMULATOR
+# =====================================================
+def _stage_delay(rng: random.Random, status: int, stage_hours: Sequence[float]) -> float:
+    mean = stage_hours[status]
+    return rng.gammavariate(4.0, mean / 4.0) * 3600
+
+def simulate_events(order_ids: Iterable[str], start: float = None, spread_hours: float = 24.0,
+                    stage_hours: Sequence[float] = STAGE_HOURS,
+                    initial: Dict[str, Tuple[int, float]] = None, seed: int = 0) -> Iterator[Event]:
+    """
+    Yield (order_id, status, ts) in timestamp order for every order's progression to
+    Delivered. New orders are confirmed uniformly over `spread_hours` from `start`;
+    orders found in `initial` (e.g. store.latest_all()) resume from their last status.
+    """
+    rng = random.Random(seed)
+    start = time.time() if start is None else start
+    initial = initial or {}
+    heap = []
+    for oid in order_ids:
+        if oid in initial:
+            status, ts = initial[oid]
+            if status < DELIVERED:
+                heap.append((ts + _stage_delay(rng, status, stage_hours), oid, status + 1))
+        else:
+            heap.append((start + rng.uniform(0, spread_hours * 3600), oid, 0))
+    heapq.heapify(heap)
+    while heap:
+        ts, oid, status = heap[0]
+        yield oid, status, ts
+        if status < DELIVERED:
+            heapq.heapreplace(heap, (ts + _stage_delay(rng, status, stage_hours), oid, status + 1))
+        else:
+            heapq.heappop(heap)
+
+def run_simulation(store: TrackingStore, events: Iterable[Event], rate: float = None, speedup: float = None,
+                   batch: int = 500, limit: int = None, stop: threading.Event = None) -> int:
+    """
+    Write `events` to the store in batches. Returns the number written.
+    - rate: at most this many events per second (None = as fast as possible)
+    - speedup: simulated seconds per real second; events wait until the simulated
+      clock (started at the first event) reaches their timestamp (None = no waiting)
+    """
+    t0 = time.perf_counter()
+    sim0 = None
+    written = 0
+    buf: List[Event] = []
+
+    def wait(seconds: float) -> bool:
+        nonlocal written, buf
+        if buf:
+            written += store.append(buf)
+            buf = []
+        if stop is not None:
+            return stop.wait(seconds)
+        time.sleep(seconds)
+        return False
+
+    def wait_until(due: float) -> bool:
+        """Wait in short steps until `due` seconds after t0 (or stop); True if stopped."""
+        ahead = due - (time.perf_counter() - t0)
+        while ahead > 0:
+            if wait(min(ahead, 0.25)):
+                return True
+            ahead = due - (time.perf_counter() - t0)
+        return False
+
+    for event in events:
+        if stop is not None and stop.is_set():
+            break
+        if limit is not None and written + len(buf) >= limit:
+            break
+        if speedup:
+            sim0 = event[2] if sim0 is None else sim0
+            if wait_until((event[2] - sim0) / speedup):
+                break
+        if rate and wait_until((written + len(buf)) / rate):
+            break
+        buf.append(event)
+        if len(buf) >= batch:
+            written += store.append(buf)
+            buf = []
+    if buf:
+        written += store.append(buf)
+    return written
+
+
+class TrackingSimulator:
+    """Background thread running run_simulation for a set of orders; restartable."""
+
+    def __init__(self, store: TrackingStore, order_ids: Sequence[str], rate: float = 1000,
+                 speedup: float = 3600, seed: int = 0):
+        self.store = store
+        self.order_ids = list(order_ids)
+        self.rate = rate
+        self.speedup = speedup
+        self.seed = seed
+        self.written = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        events = simulate_events(self.order_ids, initial=self.store.latest_all(), seed=self.seed)
+        self.written += run_simulation(self.store, events, rate=self.rate, speedup=self.speedup, stop=self._stop)
+
+
+def bench(store: TrackingStore, args: argparse.Namespace):
+    """Write load test plus lookup latency under load, on an emptied `store`."""
+    store.clear()
+    order_ids = [f"ORD{i:08d}" for i in range(args.orders)]
+    events = simulate_events(order_ids)
+
+    # A reader thread samples latest-status lookups while the writer runs
+    done = threading.Event()
+    under_load: List[float] = []
+
+    def reader():
+        rng = random.Random(1)
+        while not done.is_set():
+            oid = order_ids[rng.randrange(len(order_ids))]
+            t = time.perf_counter()
+            store.latest(oid)
+            under_load.append(time.perf_counter() - t)
+            time.sleep(0.0005)
+
+    th = threading.Thread(target=reader, daemon=True)
+    th.start()
+    t0 = time.perf_counter()
+    n = run_simulation(store, events, batch=args.batch, limit=args.events)
+    write_s = time.perf_counter() - t0
+    done.set()
+    th.join()
+
+    rng = random.Random(2)
+    sample = [order_ids[rng.randrange(len(order_ids))] for _ in range(args.lookups)]
+    latest_us, history_us = [], []
+    for oid in sample:
+        t = time.perf_counter()
+        store.latest(oid)
+        latest_us.append((time.perf_counter() - t) * 1e6)
+    for oid in sample[:args.lookups // 10]:
+        t = time.perf_counter()
+        store.history(oid)
+        history_us.append((time.perf_counter() - t) * 1e6)
+
+    p = lambda xs, q: float(np.percentile(xs, q)) if len(xs) else float("nan")
+    load_us = [x * 1e6 for x in under_load]
+    print(f"orders {args.orders}  events {n}  batch {args.batch}")
+    print(f"write:                 {n / write_s:,.0f} events/s  ({write_s:.2f} s)")
+    print(f"latest, under load:    p50 {p(load_us, 50):.1f} us  p99 {p(load_us, 99):.1f} us  ({len(load_us)} reads)")
+    print(f"latest, idle:          p50 {p(latest_us, 50):.1f} us  p99 {p(latest_us, 99):.1f} us")
+    print(f"history, idle:         p50 {p(history_us, 50):.1f} us  p99 {p(history_us, 99):.1f} us")
+    print(f"status counts:         {store.status_counts()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=None,
+                        help=f"SQLite file (simulate: default {TRACKING_DB}; bench: default a temporary file)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_sim = sub.add_parser("simulate", help="Feed tracking events for every order in a customer CSV")
+    p_sim.add_argument("--customers", required=True)
+    p_sim.add_argument("--rate", type=float, default=1000, help="Max events per second")
+    p_sim.add_argument("--speedup", type=float, default=3600, help="Simulated seconds per real second")
+
+    p_bench = sub.add_parser("bench", help="Write load test plus lookup latency under load")
+    p_bench.add_argument("--orders", type=int, default=100_000)
+    p_bench.add_argument("--events", type=int, default=500_000)
+    p_bench.add_argument("--batch", type=int, default=1000)
+    p_bench.add_argument("--lookups", type=int, default=20_000)
+    p_bench.add_argument("--force", action="store_true", help=f"Allow --db {TRACKING_DB} (it is cleared first)")
+    args = parser.parse_args()
+
+    if args.cmd == "simulate":
+        args.db = args.db or str(TRACKING_DB)
+        store = TrackingStore(args.db)
+        from smarttrack import read_customers
+        with open(args.customers, "rb") as fh:
+            _, cust_df = read_customers(fh.read())
+        events = simulate_events(cust_df["order id"], initial=store.latest_all())
+        try:
+            n = run_simulation(store, events, rate=args.rate, speedup=args.speedup)
+        except KeyboardInterrupt:
+            n = store.event_count()
+        print(f"{n} events in {args.db}")
+        return
+
+    # The load test clears its database first: never the app's live history by accident
+    if args.db is None:
+        tmp = tempfile.mkdtemp(prefix="tracking-bench-")
+        args.db = str(Path(tmp) / "bench.sqlite3")
+    else:
+        tmp = None
+        if Path(args.db).resolve() == TRACKING_DB.resolve() and not args.force:
+            parser.error(f"bench clears --db; {TRACKING_DB} is the app's tracking history (add --force)")
+    try:
+        bench(TrackingStore(args.db), args)
+    finally:
+        if tmp is not None:
+            shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,18 @@
+import sys
+from pathlib import Path
+
 import streamlit as st
 import torch
-import torchvision.models as models
 from torchvision.models import ResNet18_Weights
 from PIL import Image
 import pandas as pd
 
+# Batch inference helpers are shared with the Chapter 5 lecture apps
+sys.path.append(str(Path(__file__).resolve().parents[2] / "Lecture" / "Chapter5"))
+from classifier import (classify_image, cold_start_caption, imagenet_labels, load_resnet18, render_backend_selector,
+                        render_batch_mode, render_cache_controls, render_cache_stats)
+from inference_server import inference_client, render_remote_model
+
 # ---------------------------------------------------------
 # Step 1: Create a new Streamlit application configuration
 # ---------------------------------------------------------
@@ -28,18 +36,27 @@ st.sidebar.info(f"⚙️ Running on: **{device}**")
 # ---------------------------------------------------------
 @st.cache_resource
 def load_model():
-    # Load model with best available pre-trained weights
+    # Best available pre-trained weights, read from the local weights cache
+    # and warmed up with one forward pass (model is returned in eval mode)
     weights = ResNet18_Weights.DEFAULT
-    model = models.resnet18(weights=weights)
-    model.to(device)
-    model.eval()  # Set to evaluation mode
-    return model, weights
+    model, cold_start = load_resnet18(device=device)
+    return model, weights, cold_start
 
-try:
-    model, weights = load_model()
-except Exception as e:
-    st.error(f"Error loading model: {e}")
-    st.stop()
+# If an inference server is configured (CV_INFERENCE_SOCKET), the weights stay
+# in the server process and this app only preprocesses and displays
+server = inference_client()
+if server is None:
+    try:
+        model, weights, cold_start = load_model()
+    except Exception as e:
+        st.error(f"Error loading model: {e}")
+        st.stop()
+    st.sidebar.caption(cold_start_caption(cold_start))
+else:
+    weights = ResNet18_Weights.DEFAULT
+
+# Class names ship with the weights metadata, so no download is needed
+labels = imagenet_labels(weights)
 
 # ---------------------------------------------------------
 # Step 5: Apply recommended image preprocessing
@@ -47,58 +64,70 @@ except Exception as e:
 # ResNet18_Weights.DEFAULT.transforms() handles resize, crop, and normalization
 preprocess = weights.transforms()
 
+# ---------------------------------------------------------
+# Step 5b: Select CPU inference backend (FP32, TorchScript, INT8, ...)
+# ---------------------------------------------------------
+if server is None:
+    infer = render_backend_selector(model, preprocess)
+else:
+    infer = render_remote_model(server)
+
+# Top-5 results cached by image content: widget changes rerun the script,
+# but an image that was already classified skips preprocessing and inference
+cache, perceptual = render_cache_controls()
+
 # ---------------------------------------------------------
 # Step 6: Design User Interface for upload
 # ---------------------------------------------------------
-uploaded_file = st.file_uploader("Upload an image (JPG/PNG)", type=["jpg", "png", "jpeg"])
-
-if uploaded_file is not None:
-    # Display the uploaded image
-    image = Image.open(uploaded_file).convert('RGB')
-    col1, col2 = st.columns([1, 1])
-    
-    with col1:
-        st.image(image, caption="Uploaded Image", use_container_width=True)
-
-    # ---------------------------------------------------------
-    # Step 7: Convert to tensor and perform inference
-    # ---------------------------------------------------------
-    # Preprocess and add batch dimension (unsqueeze)
-    input_tensor = preprocess(image).unsqueeze(0)
-    input_tensor = input_tensor.to(device)
-
-    with torch.no_grad():  # Disable gradient computation
-        output = model(input_tensor)
-
-    # ---------------------------------------------------------
-    # Step 8: Apply Softmax and get Top-5
-    # ---------------------------------------------------------
-    probabilities = torch.nn.functional.softmax(output[0], dim=0)
-    
-    # Get top 5 predictions
-    top5_prob, top5_catid = torch.topk(probabilities, 5)
-
-    # Prepare data for visualization
-    # Note: Without 'requests', we display Class IDs instead of human-readable names.
-    # To get names, you would typically need a local 'imagenet_classes.txt' file.
-    results = []
-    for i in range(top5_prob.size(0)):
-        results.append({
-            "Class ID": f"Class {top5_catid[i].item()}",
-            "Probability": top5_prob[i].item()
-        })
-    
-    df_results = pd.DataFrame(results)
-
-    # ---------------------------------------------------------
-    # Step 9: Visualize prediction probabilities
-    # ---------------------------------------------------------
-    with col2:
-        st.subheader("Top 5 Predictions")
-        st.dataframe(df_results.style.format({"Probability": "{:.2%}"}), hide_index=True)
-    
-    st.subheader("Confidence Chart")
-    st.bar_chart(df_results.set_index("Class ID")["Probability"])
+mode = st.radio("Mode", ["Single image", "Batch (multiple images)"], horizontal=True)
+
+if mode != "Single image":
+    # Many images: threaded preprocessing + batched inference, CSV export of top-5
+    render_batch_mode(infer, labels, preprocess)
+else:
+    uploaded_file = st.file_uploader("Upload an image (JPG/PNG)", type=["jpg", "png", "jpeg"])
+
+    if uploaded_file is not None:
+        # Display the uploaded image
+        image = Image.open(uploaded_file).convert('RGB')
+        col1, col2 = st.columns([1, 1])
+
+        with col1:
+            st.image(image, caption="Uploaded Image", use_container_width=True)
+
+        # ---------------------------------------------------------
+        # Step 7 & 8: Convert to tensor, perform inference, Softmax and Top-5
+        # ---------------------------------------------------------
+        # Preprocess, add batch dimension, run the model (no gradients) and take
+        # the top 5 softmax probabilities; a cached result for the same image is reused
+        top5_prob, top5_catid, cached = classify_image(
+            infer, uploaded_file.getvalue(), preprocess, cache,
+            namespace=st.session_state["backend_active"], perceptual=perceptual
+        )
+
+        # Prepare data for visualization
+        results = []
+        for prob, catid in zip(top5_prob, top5_catid):
+            results.append({
+                "Label": labels[catid],
+                "Probability": prob
+            })
+
+        df_results = pd.DataFrame(results)
+
+        # ---------------------------------------------------------
+        # Step 9: Visualize prediction probabilities
+        # ---------------------------------------------------------
+        with col2:
+            st.subheader("Top 5 Predictions")
+            st.dataframe(df_results.style.format({"Probability": "{:.2%}"}), hide_index=True)
+            if cached:
+                st.caption("⚡ Served from the prediction cache")
+
+        st.subheader("Confidence Chart")
+        st.bar_chart(df_results.set_index("Label")["Probability"])
+
+render_cache_stats(cache)
 
 # ---------------------------------------------------------
 # Step 10: Discussion Section
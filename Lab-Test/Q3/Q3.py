@@ -1,9 +1,14 @@
+import sys
+from pathlib import Path
+
 import streamlit as st
-import torch
-import torch.nn.functional as F
-from torchvision import models, transforms
+from torchvision import transforms
 from PIL import Image
-import requests
+
+# Batch inference helpers are shared with the Chapter 5 lecture apps
+sys.path.append(str(Path(__file__).resolve().parents[2] / "Lecture" / "Chapter5"))
+from classifier import (classify_image, cold_start_caption, imagenet_labels, load_resnet18, render_backend_selector,
+                        render_batch_mode, render_cache_controls, render_cache_stats, render_video_mode)
 
 # -----------------------------
 # Page config
@@ -23,10 +28,10 @@ st.write("Using **PyTorch ResNet-18 (pretrained on ImageNet)** + Streamlit webca
 # -----------------------------
 @st.cache_data
 def load_imagenet_labels():
-    url = "https://raw.githubusercontent.com/pytorch/hub/master/imagenet_classes.txt"
-    r = requests.get(url)
-    labels = r.text.strip().split("\n")
-    return labels
+    """
+    ImageNet class names bundled with the torchvision weights (no network needed).
+    """
+    return imagenet_labels()
 
 
 # -----------------------------
@@ -34,13 +39,13 @@ def load_imagenet_labels():
 # -----------------------------
 @st.cache_resource
 def load_model():
-    model = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
-    model.eval()
-    return model
+    # Weights from the local cache dir, then one warm-up pass; timings shown in the sidebar
+    return load_resnet18()
 
 
 labels = load_imagenet_labels()
-model = load_model()
+model, cold_start = load_model()
+st.sidebar.caption(cold_start_caption(cold_start))
 
 # Preprocess pipeline for ResNet
 preprocess = transforms.Compose([
@@ -53,6 +58,25 @@ preprocess = transforms.Compose([
     ),
 ])
 
+# -----------------------------
+# Inference backend (sidebar)
+# -----------------------------
+infer = render_backend_selector(model, preprocess)
+# Any rerun (or an unchanged photo) reuses the cached top-5 instead of running the model
+cache, perceptual = render_cache_controls()
+
+# -----------------------------
+# Real-time video / batch upload modes
+# -----------------------------
+mode = st.radio("Mode", ["Webcam", "Real-time video", "Batch (multiple images)"], horizontal=True)
+if mode == "Real-time video":
+    # Video file or V4L2 stream; inference runs in the background on the newest frame
+    render_video_mode(infer, labels, preprocess)
+    st.stop()
+if mode != "Webcam":
+    render_batch_mode(infer, labels, preprocess)
+    st.stop()
+
 # -----------------------------
 # Webcam input
 # -----------------------------
@@ -70,24 +94,18 @@ if img_data is not None:
     with col1:
         st.image(image, caption="Captured Image", use_container_width=True)
 
-    # Preprocess
-    input_tensor = preprocess(image)
-    input_batch = input_tensor.unsqueeze(0)  # shape: [1, 3, 224, 224]
-
-    # Inference
-    with torch.no_grad():
-        outputs = model(input_batch)
-        probs = F.softmax(outputs[0], dim=0)
-
-    # Top-5 predictions
-    top5_prob, top5_catid = torch.topk(probs, 5)
+    # Preprocess + inference, unless this photo's top-5 is already cached
+    top5_prob, top5_catid, cached = classify_image(
+        infer, img_data.getvalue(), preprocess, cache,
+        namespace=st.session_state["backend_active"], perceptual=perceptual,
+    )
 
     with col2:
         st.markdown("### 🔍 Top-5 Predictions")
-        for i in range(top5_prob.size(0)):
-            label = labels[top5_catid[i]]
-            prob = top5_prob[i].item()
-            st.write(f"**{label}** — {prob:.4f}")
+        for prob, catid in zip(top5_prob, top5_catid):
+            st.write(f"**{labels[catid]}** — {prob:.4f}")
+        if cached:
+            st.caption("⚡ Served from the prediction cache")
 
     # Optional: show as table
     import pandas as pd
@@ -100,3 +118,5 @@ if img_data is not None:
     st.dataframe(df, use_container_width=True)
 else:
     st.warning("Webcam doesn't capture anything. Click **Take photo**.")
+
+render_cache_stats(cache)
@@ -0,0 +1,317 @@
+# ac_stream_service.py
+"""
+Streaming rule evaluation for a smart-home AC controller.
+
+Sensor readings (JSON objects with "home_id" plus any of "temperature",
+"humidity", "occupancy") are consumed from a JSON-lines file, a TCP socket or a
+simulated generator. Each home keeps its own incremental forward-chaining state,
+readings inside the debounce window are merged, and only decisions that differ
+from the last emitted one are written out.
+
+Examples:
+    python ac_stream_service.py simulate --homes 5000 --rate 20000 --duration 10
+    python ac_stream_service.py file readings.jsonl
+    python ac_stream_service.py socket --port 8765     # one JSON reading per line
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+from rule_engine import forward_chain
+
+# ----------------------------
+# 1) AC ruleset
+# ----------------------------
+AC_RULES: List[Dict[str, Any]] = [
+    {
+        "name": "Empty home",
+        "priority": 100,
+        "conditions": [["occupancy", "==", 0]],
+        "action": {"decision": "OFF", "reason": "Nobody home"},
+    },
+    {
+        "name": "Hot",
+        "priority": 10,
+        "conditions": [["temperature", ">=", 30]],
+        "action": {"set": {"heat": "HOT"}},
+    },
+    {
+        "name": "Warm",
+        "priority": 10,
+        "conditions": [["temperature", ">=", 26], ["temperature", "<", 30]],
+        "action": {"set": {"heat": "WARM"}},
+    },
+    {
+        "name": "Occupied & hot",
+        "priority": 90,
+        "conditions": [["occupancy", ">", 0], ["heat", "==", "HOT"]],
+        "action": {"decision": "COOL_HIGH", "reason": "Hot and occupied"},
+    },
+    {
+        "name": "Occupied & warm",
+        "priority": 80,
+        "conditions": [["occupancy", ">", 0], ["heat", "==", "WARM"]],
+        "action": {"decision": "COOL", "reason": "Warm and occupied"},
+    },
+    {
+        "name": "Humid",
+        "priority": 70,
+        "conditions": [["occupancy", ">", 0], ["humidity", ">=", 70]],
+        "action": {"decision": "DRY", "reason": "High humidity"},
+    },
+    {
+        "name": "Comfortable",
+        "priority": 50,
+        "conditions": [["occupancy", ">", 0], ["temperature", "<", 26], ["humidity", "<", 70]],
+        "action": {"decision": "FAN", "reason": "Comfortable; air circulation only"},
+    },
+]
+
+# ----------------------------
+# 2) Metrics
+# ----------------------------
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = min(len(ordered) - 1, max(0, int(round(q / 100 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+class Metrics:
+    """Counters plus bounded latency samples (seconds)."""
+
+    def __init__(self, max_samples: int = 100_000):
+        self.started = time.perf_counter()
+        self.readings = 0
+        self.rejected = 0  # lines that are not a JSON object with a home_id
+        self.evaluations = 0
+        self.emitted = 0
+        self.rule_evaluations = 0
+        self.max_samples = max_samples
+        self.eval_latency: List[float] = []
+        self.end_to_end: List[float] = []
+
+    def sample(self, bucket: List[float], value: float):
+        if len(bucket) < self.max_samples:
+            bucket.append(value)
+        else:
+            bucket[random.randrange(self.max_samples)] = value
+
+    def report(self) -> Dict[str, float]:
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "elapsed_s": round(elapsed, 3),
+            "readings": self.readings,
+            "readings_per_s": round(self.readings / elapsed, 1),
+            "readings_rejected": self.rejected,
+            "evaluations": self.evaluations,
+            "evaluations_per_s": round(self.evaluations / elapsed, 1),
+            "decisions_emitted": self.emitted,
+            "rule_evaluations_per_eval": round(self.rule_evaluations / max(self.evaluations, 1), 2),
+            "eval_p50_ms": round(percentile(self.eval_latency, 50) * 1000, 4),
+            "eval_p99_ms": round(percentile(self.eval_latency, 99) * 1000, 4),
+            "e2e_p50_ms": round(percentile(self.end_to_end, 50) * 1000, 3),
+            "e2e_p99_ms": round(percentile(self.end_to_end, 99) * 1000, 3),
+        }
+
+# ----------------------------
+# 3) Service
+# ----------------------------
+class HomeState:
+    __slots__ = ("facts", "chain_state", "decision", "pending_since", "timer")
+
+    def __init__(self):
+        self.facts: Dict[str, Any] = {}
+        self.chain_state: Optional[Dict[str, Any]] = None
+        self.decision: Optional[str] = None
+        self.pending_since: Optional[float] = None
+        self.timer: Optional[asyncio.TimerHandle] = None
+
+
+class RuleStreamService:
+    """
+    Evaluates rules per home on a debounced schedule.
+    - The first reading after an idle period opens a `debounce` window; further
+      readings for that home only update its facts until the window closes.
+    - Evaluation is incremental (forward_chain with the home's previous state).
+    - `emit(home_id, action, facts)` is called only when the decision changes.
+    """
+
+    def __init__(
+        self,
+        rules: List[Dict[str, Any]],
+        emit: Callable[[str, Dict[str, Any], Dict[str, Any]], None],
+        debounce: float = 0.2,
+        max_cycles: int = 10,
+    ):
+        self.rules = rules
+        self.emit = emit
+        self.debounce = debounce
+        self.max_cycles = max_cycles
+        self.homes: Dict[str, HomeState] = {}
+        self.metrics = Metrics()
+
+    def submit(self, reading: Any):
+        # Malformed line, JSON that is not an object, or no home to merge it into
+        if not isinstance(reading, dict) or reading.get("home_id") is None:
+            self.metrics.rejected += 1
+            return
+        home_id = str(reading.get("home_id"))
+        home = self.homes.get(home_id)
+        if home is None:
+            home = self.homes[home_id] = HomeState()
+        for key, value in reading.items():
+            if key != "home_id":
+                home.facts[key] = value
+        self.metrics.readings += 1
+
+        if home.timer is None:
+            home.pending_since = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            home.timer = loop.call_later(self.debounce, self._evaluate, home_id)
+
+    def _evaluate(self, home_id: str):
+        home = self.homes[home_id]
+        home.timer = None
+        t0 = time.perf_counter()
+        action, _, home.chain_state = forward_chain(
+            home.facts, self.rules, max_cycles=self.max_cycles, state=home.chain_state
+        )
+        t1 = time.perf_counter()
+
+        m = self.metrics
+        m.evaluations += 1
+        m.rule_evaluations += home.chain_state["evaluations"]
+        m.sample(m.eval_latency, t1 - t0)
+        m.sample(m.end_to_end, t1 - home.pending_since)
+
+        decision = action.get("decision")
+        if decision != home.decision:
+            home.decision = decision
+            m.emitted += 1
+            self.emit(home_id, action, home.facts)
+
+    async def drain(self):
+        """Wait until every open debounce window has been evaluated."""
+        while any(h.timer is not None for h in self.homes.values()):
+            await asyncio.sleep(self.debounce / 2 or 0.001)
+
+    async def consume(self, source: AsyncIterator[Any]):
+        async for reading in source:
+            self.submit(reading)
+        await self.drain()
+
+# ----------------------------
+# 4) Sources
+# ----------------------------
+def parse_reading(line: Union[str, bytes]) -> Any:
+    """Decoded JSON line, or None if it is not valid JSON (submit() rejects anything but an object)."""
+    try:
+        return json.loads(line)
+    except ValueError:  # JSONDecodeError, or bytes that are not UTF-8
+        return None
+
+
+async def file_source(path: str) -> AsyncIterator[Any]:
+    """JSON-lines file, one reading per line."""
+    with open(path, "r", encoding="utf-8") as fh:
+        for i, line in enumerate(fh):
+            line = line.strip()
+            if line:
+                yield parse_reading(line)
+            if i % 1000 == 0:
+                await asyncio.sleep(0)  # let debounce timers fire
+
+
+async def simulated_source(homes: int, rate: float, duration: float, seed: int = 0) -> AsyncIterator[Dict[str, Any]]:
+    """Random-walk sensors for `homes` homes at roughly `rate` readings/sec."""
+    rng = random.Random(seed)
+    temps = [rng.uniform(22, 32) for _ in range(homes)]
+    hums = [rng.uniform(40, 85) for _ in range(homes)]
+    occ = [rng.randint(0, 4) for _ in range(homes)]
+    tick = 0.01
+    per_tick = max(1, int(rate * tick))
+    end = time.perf_counter() + duration
+    while time.perf_counter() < end:
+        t_start = time.perf_counter()
+        for _ in range(per_tick):
+            h = rng.randrange(homes)
+            temps[h] += rng.gauss(0, 0.3)
+            hums[h] = min(100.0, max(0.0, hums[h] + rng.gauss(0, 1.0)))
+            if rng.random() < 0.01:
+                occ[h] = rng.randint(0, 4)
+            yield {
+                "home_id": f"home-{h}",
+                "temperature": round(temps[h], 1),
+                "humidity": round(hums[h], 1),
+                "occupancy": occ[h],
+            }
+        await asyncio.sleep(max(0.0, tick - (time.perf_counter() - t_start)))
+
+
+async def serve_socket(service: RuleStreamService, host: str, port: int):
+    """TCP server; every client sends newline-delimited JSON readings."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            service.submit(parse_reading(line))
+        writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    async with server:
+        await server.serve_forever()
+
+# ----------------------------
+# 5) CLI
+# ----------------------------
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Streaming AC rule evaluation service")
+    parser.add_argument("--debounce", type=float, default=0.2, help="Debounce window in seconds")
+    parser.add_argument("--quiet", action="store_true", help="Do not print emitted decisions")
+    sub = parser.add_subparsers(dest="source", required=True)
+
+    p_file = sub.add_parser("file")
+    p_file.add_argument("path")
+
+    p_sock = sub.add_parser("socket")
+    p_sock.add_argument("--host", default="127.0.0.1")
+    p_sock.add_argument("--port", type=int, default=8765)
+
+    p_sim = sub.add_parser("simulate")
+    p_sim.add_argument("--homes", type=int, default=1000)
+    p_sim.add_argument("--rate", type=float, default=5000, help="Readings per second")
+    p_sim.add_argument("--duration", type=float, default=5.0, help="Seconds")
+
+    args = parser.parse_args(argv)
+
+    def emit(home_id, action, facts):
+        if not args.quiet:
+            print(json.dumps({"home_id": home_id, **action}), flush=True)
+
+    service = RuleStreamService(AC_RULES, emit, debounce=args.debounce)
+
+    async def run():
+        if args.source == "file":
+            await service.consume(file_source(args.path))
+        elif args.source == "simulate":
+            await service.consume(simulated_source(args.homes, args.rate, args.duration))
+        else:
+            await serve_socket(service, args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps({"metrics": service.metrics.report(), "homes": len(service.homes)}), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
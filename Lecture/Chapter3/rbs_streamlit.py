@@ -1,35 +1,20 @@
 # app.py
 import json
-from typing import List, Dict, Any, Tuple
-import operator
+import random
+from typing import List, Dict, Any
 import streamlit as st
 
+from rule_engine import (
+    run_rules, forward_chain, profile_rules, suggest_condition_order, compile_rules, analyze_rules,
+    compile_decision_tree, run_tree, tree_stats, verify_decision_tree,
+)
+
 # ----------------------------
-# 1) Minimal rule engine
+# 1) Default ruleset
 # ----------------------------
-# A rule shape:
-# {
-#   "name": "High income & good credit",
-#   "priority": 90,               # higher wins if multiple actions conflict
-#   "conditions": [               # all must be true (AND)
-#       ["income", ">=", 6000],
-#       ["credit_score", ">=", 700],
-#       ["debt_to_income", "<", 0.4]
-#   ],
-#   "action": {"decision": "APPROVE", "reason": "Strong income & credit"}
-# }
-
-OPS = {
-    "==": operator.eq,
-    "!=": operator.ne,
-    ">": operator.gt,
-    ">=": operator.ge,
-    "<": operator.lt,
-    "<=": operator.le,
-    "in": lambda a, b: a in b,
-    "not_in": lambda a, b: a not in b,
-}
-
+# Rule shape and operators are documented in rule_engine.py.
+# Random facts compared tree vs. single pass after each compile (the full check is test_rule_engine.py)
+TREE_SPOT_CHECKS = 200
 DEFAULT_RULES: List[Dict[str, Any]] = [
     {
         "name": "Excellent profile",
@@ -80,36 +65,6 @@ DEFAULT_RULES: List[Dict[str, Any]] = [
     },
 ]
 
-def evaluate_condition(facts: Dict[str, Any], cond: List[Any]) -> bool:
-    """Evaluate a single condition: [field, op, value]."""
-    if len(cond) != 3:
-        return False
-    field, op, value = cond
-    if field not in facts or op not in OPS:
-        return False
-    try:
-        return OPS[op](facts[field], value)
-    except Exception:
-        return False
-
-def rule_matches(facts: Dict[str, Any], rule: Dict[str, Any]) -> bool:
-    """All conditions must be true (AND)."""
-    return all(evaluate_condition(facts, c) for c in rule.get("conditions", []))
-
-def run_rules(facts: Dict[str, Any], rules: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
-    """
-    Returns (best_action, fired_rules)
-    - best_action: chosen by highest priority among fired rules (ties keep the first encountered)
-    - fired_rules: list of rule dicts that matched
-    """
-    fired = [r for r in rules if rule_matches(facts, r)]
-    if not fired:
-        return ({"decision": "REVIEW", "reason": "No rule matched"}, [])
-
-    fired_sorted = sorted(fired, key=lambda r: r.get("priority", 0), reverse=True)
-    best = fired_sorted[0].get("action", {"decision": "REVIEW", "reason": "No action"})
-    return best, fired_sorted
-
 # ----------------------------
 # 2) Streamlit UI
 # ----------------------------
@@ -131,8 +86,37 @@ with st.sidebar:
     default_json = json.dumps(DEFAULT_RULES, indent=2)
     rules_text = st.text_area("Edit rules here", value=default_json, height=300)
 
+    st.divider()
+    st.header("Inference")
+    mode = st.radio("Mode", ["Single pass", "Forward chaining", "Decision tree"], index=0,
+                    help="Forward chaining lets actions assert derived facts via \"set\". "
+                         "Decision tree compiles the rules into one lookup per field.")
+    max_cycles = st.number_input("Max agenda cycles", min_value=1, max_value=1000, step=1, value=10,
+                                 disabled=mode != "Forward chaining")
+
+    st.divider()
+    st.header("Profiling")
+    n_samples = st.number_input("Sample applicants", min_value=10, max_value=100000, step=100, value=1000)
+    jitter = st.slider("Variation around current facts (±%)", 0, 100, 40)
+    profile_btn = st.button("Profile ruleset")
+    apply_order = st.checkbox("Apply suggested condition order", value=False)
+    prune = st.checkbox("Prune dead & shadowed rules", value=False,
+                        help="Drops rules that can never be the chosen action (see Static Analysis).")
+
     run = st.button("Evaluate", type="primary")
 
+def sample_facts(base: Dict[str, Any], n: int, spread: float, seed: int = 0) -> List[Dict[str, Any]]:
+    """Random applicants around `base` (numeric fields scaled by up to ±spread)."""
+    rng = random.Random(seed)
+    batch = []
+    for _ in range(n):
+        f = {}
+        for k, v in base.items():
+            x = v * (1 + rng.uniform(-spread, spread))
+            f[k] = int(round(x)) if isinstance(v, int) else x
+        batch.append(f)
+    return batch
+
 facts = {
     "income": float(income),
     "credit_score": int(credit_score),
@@ -146,20 +130,99 @@ st.json(facts)
 
 # Parse rules (fall back to defaults if invalid)
 try:
-    rules = json.loads(rules_text)
-    assert isinstance(rules, list), "Rules must be a JSON array"
+    if st.session_state.get("rules_text") == rules_text:
+        rules = st.session_state.rules  # same list object keeps forward-chaining state reusable
+    else:
+        rules = json.loads(rules_text)
+        assert isinstance(rules, list), "Rules must be a JSON array"
+        for k, rule in enumerate(rules):
+            assert isinstance(rule, dict), f"Rule #{k} must be a JSON object"
+            priority = rule.get("priority", 0)
+            assert isinstance(priority, (int, float)) and not isinstance(priority, bool), \
+                f"Rule #{k}: priority must be a number, got {priority!r}"
+            assert isinstance(rule.get("conditions", []), list), f"Rule #{k}: conditions must be a JSON array"
+            assert isinstance(rule.get("action", {}), dict), f"Rule #{k}: action must be a JSON object"
+        with st.spinner(f"Analysing {len(rules)} rules..."):
+            analysis = analyze_rules(rules)
+        # Only once parsing and analysis both succeeded, so a bad edit never leaves
+        # rules and analysis out of step
+        st.session_state.update(rules_text=rules_text, rules=rules, analysis=analysis,
+                                chain_state=None, profile=None, compile_key=None)
+    analysis = st.session_state.analysis
 except Exception as e:
     st.error(f"Invalid rules JSON. Using defaults. Details: {e}")
     rules = DEFAULT_RULES
+    analysis = analyze_rules(rules)
+source_rules = rules
+
+if profile_btn:
+    batch = sample_facts(facts, int(n_samples), jitter / 100)
+    st.session_state.profile = profile_rules(batch, source_rules)
+
+# Compile once per (rules, profile, options); the same list object is reused across reruns
+profile = st.session_state.get("profile") if apply_order else None
+if apply_order or prune:
+    compile_key = (id(source_rules), id(profile), prune)
+    if st.session_state.get("compile_key") != compile_key:
+        st.session_state.compiled_rules = compile_rules(source_rules, profile, prune=prune)
+        st.session_state.compile_key = compile_key
+    rules = st.session_state.compiled_rules
 
 st.subheader("Active Rules")
+if len(rules) != len(source_rules):
+    st.caption(f"{len(source_rules) - len(rules)} of {len(source_rules)} rules pruned.")
 with st.expander("Show rules", expanded=False):
     st.code(json.dumps(rules, indent=2), language="json")
 
+def rule_name(i: int) -> str:
+    return source_rules[i].get("name", f"#{i}")
+
+flagged = set(analysis["unsatisfiable"]) | set(analysis["shadowed"]) | set(analysis["conflicts"])
+with st.expander(f"Static Analysis ({len(flagged)} flagged)", expanded=False):
+    st.dataframe(
+        [
+            {
+                "Rule": rule_name(i),
+                "Satisfiable intervals": "; ".join(f"{f}: {d}" for f, d in analysis["intervals"][i].items()),
+                "Unsatisfiable": i in analysis["unsatisfiable"],
+                "Shadowed by": rule_name(analysis["shadowed"][i]) if i in analysis["shadowed"] else "",
+                "Conflicts with": rule_name(analysis["conflicts"][i]) if i in analysis["conflicts"] else "",
+            }
+            for i in range(len(source_rules))
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+    if analysis["truncated"]:
+        st.warning(f"{len(analysis['truncated'])} rules hit the exact-check limit; their shadowing and "
+                   "conflict results may be incomplete: "
+                   + ", ".join(rule_name(i) for i in analysis["truncated"][:10])
+                   + (" ..." if len(analysis["truncated"]) > 10 else ""))
+
 st.divider()
 
 if run:
-    action, fired = run_rules(facts, rules)
+    if mode == "Forward chaining":
+        action, fired, chain_state = forward_chain(
+            facts, rules, max_cycles=int(max_cycles), state=st.session_state.get("chain_state")
+        )
+        st.session_state.chain_state = chain_state
+    elif mode == "Decision tree":
+        if st.session_state.get("tree_rules") is not rules:
+            try:
+                compiled = compile_decision_tree(rules)
+                st.session_state.tree = (compiled, tree_stats(compiled[0]), len(verify_decision_tree(rules, compiled, n=TREE_SPOT_CHECKS)))
+            except ValueError as e:
+                st.session_state.tree = (None, str(e), 0)
+            st.session_state.tree_rules = rules
+        compiled, stats, mismatches = st.session_state.tree
+        if compiled is None:
+            st.warning(f"Cannot compile a decision tree ({stats}); using single pass.")
+            action, fired = run_rules(facts, rules)
+        else:
+            action, fired = run_tree(facts, compiled)
+    else:
+        action, fired = run_rules(facts, rules)
 
     col1, col2 = st.columns([1, 1])
     with col1:
@@ -185,5 +248,68 @@ if run:
                     for cond in r.get("conditions", []):
                         st.code(str(cond))
 
+    if mode == "Forward chaining":
+        st.subheader("Forward Chaining")
+        derived = {k: v for k, (v, _) in chain_state["derived"].items()}
+        st.write(f"Cycles: **{chain_state['cycles']}** | Rule evaluations: **{chain_state['evaluations']}** "
+                 f"(of {len(rules)} rules)")
+        if not chain_state["converged"]:
+            st.warning(f"Stopped after {int(max_cycles)} cycles before the agenda was empty.")
+        st.caption("Derived facts")
+        st.json(derived)
+
+    if mode == "Decision tree" and compiled is not None:
+        st.subheader("Decision Tree")
+        st.write(f"Nodes: **{stats['nodes']}** | Leaves: **{stats['leaves']}** | Depth: **{stats['depth']}** "
+                 f"(vs. scanning {len(rules)} rules)")
+        if mismatches:
+            st.error(f"{mismatches} of {TREE_SPOT_CHECKS} random facts disagree with single pass.")
+        else:
+            st.caption(f"Spot-checked against single pass on {TREE_SPOT_CHECKS} random facts: no mismatches "
+                       "(full check: pytest test_rule_engine.py).")
+
 else:
     st.info("Set input values and click **Evaluate**.")
+
+# ----------------------------
+# 3) Rule profiler
+# ----------------------------
+profile = st.session_state.get("profile")
+if profile:
+    st.divider()
+    st.subheader("Rule Profiler")
+    st.caption(f"{profile[0]['evaluations']} sampled applicants. "
+               "Short-circuit counts show where evaluation stopped (last column = all conditions passed).")
+    st.dataframe(
+        [
+            {
+                "Rule": p["name"],
+                "Hits": p["hits"],
+                "Hit rate": round(p["hit_rate"], 4),
+                "Conditions evaluated": sum(c["evaluations"] for c in p["conditions"]),
+                "Time (µs)": round(sum(c["time_ns"] for c in p["conditions"]) / 1000, 1),
+                "Short-circuit positions": str(p["short_circuit"]),
+                "Suggested order": str(suggest_condition_order(p)),
+            }
+            for p in profile
+        ],
+        use_container_width=True,
+        hide_index=True,
+    )
+    with st.expander("Per-condition detail"):
+        st.dataframe(
+            [
+                {
+                    "Rule": p["name"],
+                    "Position": k,
+                    "Condition": str(c["condition"]),
+                    "Evaluations": c["evaluations"],
+                    "Pass rate": round(c["pass_rate"], 4),
+                    "Avg (ns)": round(c["avg_ns"], 1),
+                }
+                for p in profile
+                for k, c in enumerate(p["conditions"])
+            ],
+            use_container_width=True,
+            hide_index=True,
+        )
@@ -0,0 +1,915 @@
+# rule_engine.py
+"""Minimal rule engine shared by the Streamlit demo and the streaming service."""
+from typing import List, Dict, Any, Optional, Tuple
+import bisect
+import json
+import math
+import operator
+import random
+import time
+
+import numpy as np
+
+# ----------------------------
+# 1) Rule shape
+# ----------------------------
+# A rule shape:
+# {
+#   "name": "High income & good credit",
+#   "priority": 90,               # higher wins if multiple actions conflict
+#   "conditions": [               # all must be true (AND)
+#       ["income", ">=", 6000],
+#       ["credit_score", ">=", 700],
+#       ["debt_to_income", "<", 0.4]
+#   ],
+#   "action": {"decision": "APPROVE", "reason": "Strong income & credit"}
+# }
+#
+# In forward-chaining mode an action may also assert derived facts:
+#   "action": {"set": {"risk_band": "LOW"}}
+# Derived facts can be used in the conditions of other rules.
+
+OPS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "<": operator.lt,
+    "<=": operator.le,
+    "in": lambda a, b: a in b,
+    "not_in": lambda a, b: a not in b,
+}
+
+# ----------------------------
+# 2) Single-pass evaluation
+# ----------------------------
+def evaluate_condition(facts: Dict[str, Any], cond: List[Any]) -> bool:
+    """Evaluate a single condition: [field, op, value]."""
+    if len(cond) != 3:
+        return False
+    field, op, value = cond
+    if field not in facts or op not in OPS:
+        return False
+    try:
+        return OPS[op](facts[field], value)
+    except Exception:
+        return False
+
+def rule_matches(facts: Dict[str, Any], rule: Dict[str, Any]) -> bool:
+    """All conditions must be true (AND)."""
+    return all(evaluate_condition(facts, c) for c in rule.get("conditions", []))
+
+def run_rules(facts: Dict[str, Any], rules: List[Dict[str, Any]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Returns (best_action, fired_rules)
+    - best_action: chosen by highest priority among fired rules (ties keep the first encountered)
+    - fired_rules: list of rule dicts that matched
+    """
+    fired = [r for r in rules if rule_matches(facts, r)]
+    if not fired:
+        return ({"decision": "REVIEW", "reason": "No rule matched"}, [])
+
+    fired_sorted = sorted(fired, key=lambda r: r.get("priority", 0), reverse=True)
+    best = fired_sorted[0].get("action", {"decision": "REVIEW", "reason": "No action"})
+    return best, fired_sorted
+
+# ----------------------------
+# 3) Forward chaining (agenda + incremental updates)
+# ----------------------------
+_MISSING = object()
+
+def build_dependency_index(rules: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """Map each fact name to the indexes of the rules whose conditions read it."""
+    index: Dict[str, List[int]] = {}
+    for i, rule in enumerate(rules):
+        fields = {c[0] for c in rule.get("conditions", []) if len(c) == 3}
+        for field in fields:
+            index.setdefault(field, []).append(i)
+    return index
+
+def _setter_index(rules: List[Dict[str, Any]]) -> Dict[str, List[int]]:
+    """
+    Map each derived fact name to the indexes of the rules that set it, in win order
+    (priority descending, ties by list order): the first matching one supplies the value.
+    """
+    index: Dict[str, List[int]] = {}
+    for i in sorted(range(len(rules)), key=lambda i: -rules[i].get("priority", 0)):
+        for field in (rules[i].get("action", {}).get("set") or {}):
+            index.setdefault(field, []).append(i)
+    return index
+
+def _changed_fields(old: Dict[str, Any], new: Dict[str, Any]) -> set:
+    keys = set(old) | set(new)
+    return {k for k in keys if old.get(k, _MISSING) != new.get(k, _MISSING)}
+
+def forward_chain(
+    facts: Dict[str, Any],
+    rules: List[Dict[str, Any]],
+    max_cycles: int = 10,
+    state: Dict[str, Any] = None,
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Forward-chaining evaluation. Returns (best_action, fired_rules, state).
+    - Actions with a "set" mapping assert derived facts, which can make other rules fire.
+    - Only rules whose conditions read a changed fact are put back on the agenda.
+    - Pass the previous `state` to re-evaluate incrementally when new facts arrive;
+      derived facts of rules that stop matching are retracted.
+    - When several matching rules set the same fact, the highest-priority one wins
+      (ties: earliest in the list), so the result never depends on update history.
+    - Stops after `max_cycles` agenda passes (state["converged"] is False if cut short);
+      the unfinished agenda is kept in state["agenda"] and resumed by the next call.
+    """
+    if state is None or state.get("rules") is not rules:
+        state = {
+            "rules": rules,
+            "index": build_dependency_index(rules),
+            "setters": _setter_index(rules),
+            "base": {},
+            "derived": {},      # field -> (value, rule index)
+            "matched": [False] * len(rules),
+        }
+        agenda = set(range(len(rules)))
+    else:
+        agenda = set(state.get("agenda", ()))
+
+    index = state["index"]
+    setters = state["setters"]
+    matched = state["matched"]
+    derived = state["derived"]
+
+    changed = _changed_fields(state["base"], facts)
+    state["base"] = dict(facts)
+    working = dict(facts)
+    working.update({k: v for k, (v, _) in derived.items()})
+    for field in changed:
+        agenda.update(index.get(field, ()))
+
+    cycles = 0
+    evaluations = 0
+    while agenda and cycles < max_cycles:
+        cycles += 1
+        changed = set()
+        for i in sorted(agenda):
+            rule = rules[i]
+            evaluations += 1
+            now = rule_matches(working, rule)
+            if now == matched[i]:
+                continue
+            matched[i] = now
+            assigns = rule.get("action", {}).get("set", {}) or {}
+            for field in assigns:
+                # Same resolution on assert and retract: the first matching setter in win
+                # order, else the input fact
+                winner = next((j for j in setters[field] if matched[j]), None)
+                if winner is not None:
+                    if derived.get(field, (None, -1))[1] == winner:
+                        continue
+                    value = rules[winner]["action"]["set"][field]
+                    derived[field] = (value, winner)
+                elif field in derived:
+                    del derived[field]
+                    value = facts.get(field, _MISSING)
+                else:
+                    continue
+                if working.get(field, _MISSING) != value:
+                    if value is _MISSING:
+                        working.pop(field, None)
+                    else:
+                        working[field] = value
+                    changed.add(field)
+        agenda = {j for field in changed for j in index.get(field, ())}
+
+    state["facts"] = working
+    state["cycles"] = cycles
+    state["evaluations"] = evaluations
+    state["agenda"] = agenda
+    state["converged"] = not agenda
+
+    fired = [r for i, r in enumerate(rules) if matched[i]]
+    deciding = [r for r in fired if "decision" in r.get("action", {})]
+    if not deciding:
+        return ({"decision": "REVIEW", "reason": "No rule matched"}, fired, state)
+
+    fired_sorted = sorted(fired, key=lambda r: r.get("priority", 0), reverse=True)
+    best = max(deciding, key=lambda r: r.get("priority", 0))["action"]
+    return best, fired_sorted, state
+
+# ----------------------------
+# 4) Profiling + condition ordering
+# ----------------------------
+def profile_rules(facts_batch: List[Dict[str, Any]], rules: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Evaluate every rule on every facts dict (same semantics as run_rules) and record:
+    - per rule: evaluations, hits, hit_rate, short_circuit (how often evaluation
+      stopped at each condition position; position len(conditions) means "all passed")
+    - per condition: evaluations, passes, pass_rate, total/avg time in nanoseconds
+    """
+    clock = time.perf_counter_ns
+    profile: List[Dict[str, Any]] = []
+    for rule in rules:
+        conds = rule.get("conditions", [])
+        stats = [{"condition": c, "evaluations": 0, "passes": 0, "time_ns": 0} for c in conds]
+        short_circuit = [0] * (len(conds) + 1)
+        hits = 0
+        for facts in facts_batch:
+            pos = len(conds)
+            for k, cond in enumerate(conds):
+                t0 = clock()
+                ok = evaluate_condition(facts, cond)
+                stats[k]["time_ns"] += clock() - t0
+                stats[k]["evaluations"] += 1
+                if not ok:
+                    pos = k
+                    break
+                stats[k]["passes"] += 1
+            short_circuit[pos] += 1
+            hits += pos == len(conds)
+        for s in stats:
+            n = max(s["evaluations"], 1)
+            s["pass_rate"] = s["passes"] / n
+            s["avg_ns"] = s["time_ns"] / n
+        profile.append({
+            "name": rule.get("name", "(unnamed)"),
+            "evaluations": len(facts_batch),
+            "hits": hits,
+            "hit_rate": hits / max(len(facts_batch), 1),
+            "short_circuit": short_circuit,
+            "conditions": stats,
+        })
+    return profile
+
+def suggest_condition_order(rule_profile: Dict[str, Any]) -> List[int]:
+    """
+    Order that minimises expected cost of an AND chain: ascending cost / (1 - pass_rate),
+    i.e. cheap conditions that reject often go first. Conditions never evaluated keep
+    their relative position at the end.
+    """
+    stats = rule_profile["conditions"]
+
+    def rank(k: int) -> Tuple[int, float, int]:
+        s = stats[k]
+        if s["evaluations"] == 0:
+            return (1, 0.0, k)
+        reject = 1.0 - s["pass_rate"]
+        return (0, s["avg_ns"] / reject if reject > 0 else float("inf"), k)
+
+    return sorted(range(len(stats)), key=rank)
+
+def compile_rules(
+    rules: List[Dict[str, Any]],
+    profile: List[Dict[str, Any]] = None,
+    prune: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Return a copy of the ruleset ready for evaluation. With a profile from
+    profile_rules(), each rule's conditions are reordered by suggest_condition_order().
+    Reordering an AND never changes which rules match.
+    With prune=True, dead and shadowed rules are removed (see prune_rules()).
+    """
+    compiled = []
+    for i, rule in enumerate(rules):
+        new_rule = dict(rule)
+        conds = list(rule.get("conditions", []))
+        if profile is not None and i < len(profile) and len(profile[i]["conditions"]) == len(conds):
+            conds = [conds[k] for k in suggest_condition_order(profile[i])]
+        new_rule["conditions"] = conds
+        compiled.append(new_rule)
+    if prune:
+        compiled = prune_rules(compiled)
+    return compiled
+
+# ----------------------------
+# 5) Static analysis
+# ----------------------------
+# Each rule is reduced to one constraint per field:
+#   lo/hi      closed numeric bounds (strict bounds are moved with math.nextafter)
+#   allowed    finite set of permitted values (from "==" / "in"), or None
+#   excluded   values ruled out by "!=" / "not_in"
+#   numeric    True once an ordering operator applies (the fact must then be a number)
+# Conditions the analyzer cannot reason about (e.g. substring "in") are "opaque":
+# they only make a rule match less often, so such a rule is never used as a shadower.
+_INF = float("inf")
+
+def _is_num(v: Any) -> bool:
+    return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+def _new_constraint() -> Dict[str, Any]:
+    return {"lo": -_INF, "hi": _INF, "lo_txt": "(-inf", "hi_txt": "inf)",
+            "allowed": None, "excluded": frozenset(), "numeric": False}
+
+def _apply_condition(c: Dict[str, Any], op: str, value: Any) -> bool:
+    """Tighten constraint `c` with one condition. Returns False if the condition is opaque."""
+    if op in (">", ">=", "<", "<="):
+        if not _is_num(value):
+            return False
+        c["numeric"] = True
+        if op in (">", ">="):
+            key = value if op == ">=" else math.nextafter(value, _INF)
+            if key > c["lo"]:
+                c["lo"], c["lo_txt"] = key, f"{'[' if op == '>=' else '('}{value}"
+        else:
+            key = value if op == "<=" else math.nextafter(value, -_INF)
+            if key < c["hi"]:
+                c["hi"], c["hi_txt"] = key, f"{value}{']' if op == '<=' else ')'}"
+        return True
+    if op in ("in", "not_in"):
+        if not isinstance(value, (list, tuple, set, frozenset)):
+            return False
+        try:
+            values = frozenset(value)
+        except TypeError:
+            return False
+    else:
+        try:
+            values = frozenset([value])
+        except TypeError:
+            return False
+    if op in ("==", "in"):
+        c["allowed"] = values if c["allowed"] is None else c["allowed"] & values
+    else:
+        c["excluded"] = c["excluded"] | values
+    return True
+
+def _satisfies(v: Any, c: Dict[str, Any]) -> bool:
+    if c["allowed"] is not None and v not in c["allowed"]:
+        return False
+    if v in c["excluded"]:
+        return False
+    return not c["numeric"] or (_is_num(v) and c["lo"] <= v <= c["hi"])
+
+def _feasible(c: Dict[str, Any]) -> bool:
+    if c["allowed"] is not None:
+        return any(_satisfies(v, c) for v in c["allowed"])
+    if c["numeric"]:
+        return c["lo"] < c["hi"] or (c["lo"] == c["hi"] and c["lo"] not in c["excluded"])
+    return True
+
+def _contains(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    """True if every value allowed by constraint `b` is allowed by `a`."""
+    if b["allowed"] is not None:
+        return all(_satisfies(v, a) for v in b["allowed"] if _satisfies(v, b))
+    if b["numeric"]:
+        if b["lo"] == b["hi"]:
+            return _satisfies(b["lo"], a)
+        if a["allowed"] is not None:
+            return False
+        if a["numeric"] and (a["lo"] > b["lo"] or a["hi"] < b["hi"]):
+            return False
+        return all(e in b["excluded"] or not (_is_num(e) and b["lo"] <= e <= b["hi"]) for e in a["excluded"])
+    return a["allowed"] is None and not a["numeric"] and a["excluded"] <= b["excluded"]
+
+def _merge(a: Dict[str, Any], b: Dict[str, Any]) -> Dict[str, Any]:
+    m = dict(a)
+    m["lo"], m["hi"] = max(a["lo"], b["lo"]), min(a["hi"], b["hi"])
+    if a["allowed"] is None or b["allowed"] is None:
+        m["allowed"] = a["allowed"] if b["allowed"] is None else b["allowed"]
+    else:
+        m["allowed"] = a["allowed"] & b["allowed"]
+    m["excluded"] = a["excluded"] | b["excluded"]
+    m["numeric"] = a["numeric"] or b["numeric"]
+    return m
+
+def _normalize_rule(rule: Dict[str, Any]) -> Dict[str, Any]:
+    fields: Dict[str, Dict[str, Any]] = {}
+    opaque = False
+    malformed = False
+    for cond in rule.get("conditions", []):
+        if not isinstance(cond, (list, tuple)) or len(cond) != 3 or cond[1] not in OPS:
+            malformed = True  # evaluate_condition() always returns False for these
+            continue
+        field, op, value = cond
+        c = fields.get(field) or _new_constraint()
+        if _apply_condition(c, op, value):
+            fields[field] = c
+        else:
+            opaque = True
+    unsat = malformed or not all(_feasible(c) for c in fields.values())
+    return {"fields": fields, "opaque": opaque, "unsat": unsat}
+
+def _rule_contains(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    if a["opaque"]:
+        return False
+    return all(f in b["fields"] and _contains(c, b["fields"][f]) for f, c in a["fields"].items())
+
+def _rules_overlap(a: Dict[str, Any], b: Dict[str, Any]) -> bool:
+    return all(_feasible(_merge(c, b["fields"][f])) for f, c in a["fields"].items() if f in b["fields"])
+
+def describe_constraint(c: Dict[str, Any]) -> str:
+    parts = []
+    if c["numeric"]:
+        parts.append(f"{c['lo_txt']}, {c['hi_txt']}")
+    if c["allowed"] is not None:
+        parts.append("in " + str(sorted(map(str, c["allowed"]))))
+    if c["excluded"]:
+        parts.append("not in " + str(sorted(map(str, c["excluded"]))))
+    return " and ".join(parts) or "any"
+
+# Prefilter encoding: per field, the values named in any rule's ==/in/!=/not_in
+# conditions form a small universe U, and a constraint becomes
+#   bits       which values of U it allows (packed uint64 words)
+#   o_lo/o_hi  the numbers outside U it allows (NaN: none)
+#   o_any      whether it allows any value outside U, numeric or not
+# This is exact, so containment and overlap become a few numpy ops per field,
+# evaluated for a chunk of rules against a block of candidates at once.
+# Fields where a bool and an equal number share a U slot (True == 1), or whose U
+# is larger than MAX_UNIVERSE, fall back to exact pairwise checks, at most
+# MAX_EXACT_CHECKS per rule; rules cut off there are listed in "truncated".
+MAX_UNIVERSE = 4096
+MAX_EXACT_CHECKS = 64
+CHUNK_ROWS = 64
+
+def _universes(norms: List[Dict[str, Any]]) -> Tuple[Dict[str, Dict[Any, int]], set]:
+    """
+    Per field: value -> slot for every value named in an allowed/excluded set (numbers
+    first, ascending, so a numeric interval is a run of slots), and the fields to skip.
+    """
+    named: Dict[str, Dict[Any, bool]] = {}
+    loose = set()
+    for n in norms:
+        for f, c in n["fields"].items():
+            u = named.setdefault(f, {})
+            for v in (c["allowed"] or frozenset()) | c["excluded"]:
+                if u.setdefault(v, isinstance(v, bool)) != isinstance(v, bool):
+                    loose.add(f)  # True and 1 share a slot but not a meaning
+    universes = {}
+    for f, u in named.items():
+        if len(u) > MAX_UNIVERSE:
+            loose.add(f)
+            continue
+        nums = sorted(v for v in u if _is_num(v) and v == v)
+        rest = [v for v in u if not (_is_num(v) and v == v)]
+        universes[f] = {v: slot for slot, v in enumerate(nums + rest)}
+    return universes, loose
+
+def _low_high(mask: int) -> Tuple[int, int]:
+    """Lowest and highest set bit of a non-zero int."""
+    return (mask & -mask).bit_length() - 1, mask.bit_length() - 1
+
+class _FieldCodes:
+    """
+    Prefilter encoding of one field for every rule (rows in win order); unconstrained rows
+    allow anything. set() records each row, finish() packs them into arrays. Queries take
+    rows `r` and candidates `c` (index arrays) and return (len(r), len(c)) masks.
+    """
+
+    def __init__(self, universe: Dict[Any, int], n_rows: int):
+        self.universe = universe
+        self.numbers = [v for v in universe if _is_num(v) and v == v]  # slots 0..len-1, ascending
+        self.full = (1 << len(universe)) - 1
+        self.words = max(1, -(-len(universe) // 64))
+        self.masks: List[Optional[int]] = [None] * n_rows  # allowed slots of U (None: unconstrained)
+        self.o_lo = np.full(n_rows, -_INF)
+        self.o_hi = np.full(n_rows, _INF)
+        self.o_any = np.ones(n_rows, dtype=bool)
+
+    def finish(self):
+        """
+        bits: (rows, words) uint64. Rows with at most two non-zero words also get them in
+        few_word/few_val (padded with 0), compared with one gather per word instead of all
+        words. b_* / m_*: lowest and highest slot allowed / not allowed, cheap bounds
+        checked before the bits.
+        """
+        if not self.universe:
+            return  # numbers only: the o_* interval is the whole encoding
+        n_rows, n_slots, word = len(self.masks), len(self.universe), (1 << 64) - 1
+        anything = (1 << (64 * self.words)) - 1
+        bounds = []
+        self.constrained = np.array([m is not None for m in self.masks])
+        self.is_few = np.zeros(n_rows, dtype=bool)
+        self.few_word = np.zeros((n_rows, 2), dtype=np.intp)
+        self.few_val = np.zeros((n_rows, 2), dtype=np.uint64)
+        for row, m in enumerate(self.masks):
+            if m is None:
+                bounds.append((0, n_slots - 1, n_slots, -1))
+                continue
+            rest = self.full & ~m
+            low_high = _low_high(m) if m else (n_slots, -1)
+            bounds.append((*low_high, *(_low_high(rest) if rest else (n_slots, -1))))
+            if low_high[1] // 64 - low_high[0] // 64 > 1 and bin(m).count("1") > 128:
+                continue  # more than two non-zero words for sure
+            words = [(w, (m >> (64 * w)) & word) for w in range(self.words)]
+            words = [(w, v) for w, v in words if v]
+            if len(words) <= 2:
+                self.is_few[row] = True
+                for k, (w, v) in enumerate(words):
+                    self.few_word[row, k], self.few_val[row, k] = w, v
+        packed = b"".join((anything if m is None else m).to_bytes(8 * self.words, "little") for m in self.masks)
+        self.bits = np.frombuffer(packed, dtype="<u8").reshape(n_rows, self.words).astype(np.uint64)
+        self.b_lo, self.b_hi, self.m_lo, self.m_hi = np.array(bounds, dtype=np.int32).reshape(-1, 4).T
+
+    def set(self, row: int, c: Dict[str, Any]):
+        u = self.universe
+        if c["allowed"] is not None:
+            mask = 0
+            for v in c["allowed"]:
+                if _satisfies(v, c):
+                    mask |= 1 << u[v]
+            self.masks[row] = mask
+            self.o_lo[row] = self.o_hi[row] = np.nan
+            self.o_any[row] = False
+            return
+        if u:
+            if c["numeric"]:
+                i = bisect.bisect_left(self.numbers, c["lo"])
+                j = bisect.bisect_right(self.numbers, c["hi"])
+                mask = (1 << j) - (1 << i) if i < j else 0
+            else:
+                mask = self.full
+            for v in c["excluded"]:
+                mask &= ~(1 << u[v])
+            self.masks[row] = mask
+        if not c["numeric"]:
+            return  # anything outside U
+        # Move the bounds past values of U (those are covered by the bits)
+        lo, hi = c["lo"], c["hi"]
+        while lo <= hi and lo in u:
+            lo = math.nextafter(lo, _INF)
+        while lo <= hi and hi in u:
+            hi = math.nextafter(hi, -_INF)
+        self.o_lo[row], self.o_hi[row] = (lo, hi) if lo <= hi else (np.nan, np.nan)
+        self.o_any[row] = False
+
+    def _few_words(self, r: np.ndarray, c: np.ndarray):
+        """(k-th non-zero word of each row in r, the same word of each candidate) pairs, as (R, 1) and (R, C)."""
+        for k in range(2):
+            val = self.few_val[r, k]
+            if val.any():
+                yield val[:, None], self.bits[c[None, :], self.few_word[r, k][:, None]]
+
+    def contains(self, r: np.ndarray, c: np.ndarray) -> np.ndarray:
+        """Candidate allows every value the row allows (rows must constrain this field)."""
+        lo, hi = self.o_lo[r][:, None], self.o_hi[r][:, None]
+        ok = np.isnan(lo) | ((self.o_lo[c] <= lo) & (self.o_hi[c] >= hi))
+        any_r = self.o_any[r]
+        if any_r.any():
+            ok &= self.o_any[c] | ~any_r[:, None]
+        if not self.universe:
+            return ok
+        # The slots a container rules out must lie within the ones the row rules out
+        ok &= (self.m_lo[c] >= self.m_lo[r][:, None]) & (self.m_hi[c] <= self.m_hi[r][:, None])
+        for val, words in self._few_words(r, c):
+            ok &= (words & val) == val
+        # Unconstrained candidates allow all of U: only the others need their words compared
+        ri, ci = np.nonzero(ok & ~self.is_few[r][:, None] & self.constrained[c])
+        if len(ri):
+            need = self.bits[r[ri]]
+            ok[ri, ci] = ((self.bits[c[ci]] & need) == need).all(axis=1)
+        return ok
+
+    def overlaps(self, r: np.ndarray, c: np.ndarray) -> np.ndarray:
+        """Row and candidate share an allowed value (rows must constrain this field)."""
+        lo, hi = self.o_lo[r][:, None], self.o_hi[r][:, None]
+        hit = (self.o_lo[c] <= hi) & (self.o_hi[c] >= lo)  # NaN (nothing outside U) never overlaps
+        any_r = self.o_any[r]
+        if any_r.any():
+            hit |= self.o_any[c] & any_r[:, None]
+        if not self.universe:
+            return hit
+        for val, words in self._few_words(r, c):
+            hit |= (words & val) != 0
+        todo = ~hit & ~self.is_few[r][:, None] & self.constrained[c]
+        todo &= (self.b_lo[c] <= self.b_hi[r][:, None]) & (self.b_hi[c] >= self.b_lo[r][:, None])
+        # An unconstrained candidate allows all of U: it meets any row that allows some of it
+        hit |= ~self.constrained[c] & (self.b_lo[r] <= self.b_hi[r])[:, None]
+        ri, ci = np.nonzero(todo)
+        if len(ri):
+            hit[ri, ci] = (self.bits[c[ci]] & self.bits[r[ri]]).any(axis=1)
+        return hit
+
+def analyze_rules(rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Static analysis of a ruleset (rule indexes refer to `rules`). Returns:
+    - intervals: per rule {field: satisfiable set as text}
+    - unsatisfiable: rules that can never match
+    - shadowed: {rule: earlier-winning rule whose conditions are a superset}; the
+      shadowed rule can fire but can never be the chosen action
+    - conflicts: {rule: earlier rule with equal priority, overlapping conditions and a
+      different action}; which one wins depends only on list order
+    - truncated: rules whose search ran out of exact checks (MAX_EXACT_CHECKS), so a
+      shadow or conflict of theirs may be missing
+    Candidates are found with the vectorised per-field encoding above; exact pairwise
+    checks only run for rules that touch a field the encoding cannot represent.
+    """
+    norms = [_normalize_rule(r) for r in rules]
+    # Win order of run_rules: priority descending, ties keep list order
+    order = sorted(range(len(rules)), key=lambda i: -rules[i].get("priority", 0))
+
+    n_rows = len(rules)
+    universes, loose = _universes(norms)
+    codes = {f: _FieldCodes(u, n_rows) for f, u in universes.items() if f not in loose}
+    col = {f: k for k, f in enumerate(sorted(universes))}
+    has = np.zeros((len(col), n_rows), dtype=bool)
+    n_fields = np.zeros(n_rows, dtype=np.int32)
+    action_ids: Dict[str, int] = {}
+    act = np.zeros(n_rows, dtype=np.int64)
+    prio = np.zeros(n_rows)
+    live = np.zeros(n_rows, dtype=bool)   # satisfiable
+    exact = np.zeros(n_rows, dtype=bool)  # every field is encoded, so prefilter hits are final
+
+    for row, i in enumerate(order):
+        n = norms[i]
+        for f, c in n["fields"].items():
+            has[col[f], row] = True
+            if f in codes:
+                codes[f].set(row, c)
+        n_fields[row] = len(n["fields"])
+        key = json.dumps(rules[i].get("action", {}), sort_keys=True, default=str)
+        act[row] = action_ids.setdefault(key, len(action_ids))
+        prio[row] = rules[i].get("priority", 0)
+        live[row] = not n["unsat"]
+        exact[row] = not (loose & n["fields"].keys())
+    for fc in codes.values():
+        fc.finish()
+    can_shadow = live & ~np.array([norms[i]["opaque"] for i in order], dtype=bool)
+    # First row of each priority level (prio is non-increasing along the rows)
+    prio_start = np.searchsorted(-prio, -prio, side="left")
+
+    shadowed: Dict[int, int] = {}
+    conflicts: Dict[int, int] = {}
+    truncated = set()
+
+    def first_match(cand: np.ndarray, row: int, check, budget: int) -> Tuple[Optional[int], int]:
+        """(first candidate passing the exact check, or None; remaining exact-check budget)."""
+        for r in cand:
+            if exact[r] and exact[row]:
+                return int(r), budget
+            if not budget:
+                truncated.add(order[row])
+                break
+            budget -= 1
+            if check(norms[order[r]], norms[order[row]]):
+                return int(r), budget
+        return None, budget
+
+    def scan(rows: np.ndarray, cands: np.ndarray, pairs, check, found: Dict[int, int]):
+        """
+        For each of `rows` (ascending) the earliest of `cands` (ascending) below it whose
+        pair passes; candidate blocks grow 4x, so an early hit ends the scan soon.
+        """
+        budget = {int(r): MAX_EXACT_CHECKS for r in rows}
+        pos, size = 0, 256
+        while len(rows) and pos < len(cands) and cands[pos] < rows[-1]:
+            block = cands[pos:pos + size]
+            hits = pairs(rows, block) & (block < rows[:, None])
+            done = np.zeros(len(rows), dtype=bool)
+            for k in np.flatnonzero(hits.any(axis=1)):
+                row = int(rows[k])
+                r, budget[row] = first_match(block[hits[k]], row, check, budget[row])
+                if r is not None:
+                    found[order[row]] = order[r]
+                    done[k] = True
+            # Rows at or below the block's end have seen all their candidates
+            rows = rows[~done & (rows > block[-1])]
+            pos, size = pos + size, size * 4
+
+    # Shadowing: rows grouped by field set, so only rules over a subset of the same
+    # fields are candidates (they must cover the row on each of those fields)
+    signatures: Dict[Tuple[int, ...], List[int]] = {}
+    for row in np.flatnonzero(live):
+        signatures.setdefault(tuple(np.flatnonzero(has[:, row])), []).append(row)
+    for sig, rows in signatures.items():
+        covered = has[list(sig)].sum(axis=0) if sig else np.zeros(n_rows, dtype=np.int64)
+        cands = np.flatnonzero(can_shadow & (covered == n_fields))
+        fields = [codes[f] for f in col if col[f] in sig and f in codes]
+
+        def shadow_pairs(r: np.ndarray, c: np.ndarray) -> np.ndarray:
+            ok = np.ones((len(r), len(c)), dtype=bool)
+            for fc in fields:
+                if not ok.any():
+                    break
+                ok &= fc.contains(r, c)
+            return ok
+
+        rows = np.array(rows)
+        for k in range(0, len(rows), CHUNK_ROWS):
+            scan(rows[k:k + CHUNK_ROWS], cands, shadow_pairs, _rule_contains, shadowed)
+
+    # Conflicts: same priority level, different action, overlapping on every shared field
+    # (a field only one side constrains always overlaps, as both rules are satisfiable)
+    def conflict_pairs(r: np.ndarray, c: np.ndarray) -> np.ndarray:
+        ok = live[c] & (act[c] != act[r][:, None]) & (prio[c] == prio[r][:, None])
+        for f in {f for row in r for f in norms[order[row]]["fields"]}:
+            if f in codes and ok.any():
+                sub = np.flatnonzero(has[col[f], r])
+                ok[sub] &= codes[f].overlaps(r[sub], c) | ~has[col[f], c]
+        return ok
+
+    live_rows = np.flatnonzero(live)
+    everything = np.arange(n_rows)
+    for k in range(0, len(live_rows), CHUNK_ROWS):
+        rows = live_rows[k:k + CHUNK_ROWS]
+        start = prio_start[rows[0]]
+        scan(rows, everything[start:], conflict_pairs, _rules_overlap, conflicts)
+
+    return {
+        "intervals": [{f: describe_constraint(c) for f, c in n["fields"].items()} for n in norms],
+        "unsatisfiable": sorted(order[row] for row in np.flatnonzero(~live)),
+        "shadowed": shadowed,
+        "conflicts": conflicts,
+        "truncated": sorted(truncated),
+    }
+
+def prune_rules(rules: List[Dict[str, Any]], analysis: Dict[str, Any] = None) -> List[Dict[str, Any]]:
+    """
+    Drop rules that can never be the chosen action (unsatisfiable or shadowed).
+    Rules that assert facts via "set" are kept because forward chaining still needs them.
+    The best action from run_rules() is unchanged; the fired list only loses dead rules.
+    """
+    if analysis is None:
+        analysis = analyze_rules(rules)
+    dead = set(analysis["unsatisfiable"]) | set(analysis["shadowed"])
+    return [r for i, r in enumerate(rules) if i not in dead or r.get("action", {}).get("set")]
+
+# ----------------------------
+# 6) Decision tree compilation
+# ----------------------------
+# The tree visits each field used by the rules once. A numeric field is split into
+# cells by the sorted thresholds t1 < t2 < ...: (-inf, t1), [t1], (t1, t2), [t2], ...
+# plus a "missing" and a "non-numeric" cell; a categorical field into one cell per
+# mentioned value plus "other" and "missing". Inside a cell every condition on that
+# field has a fixed truth value, so a walk is one bisect/dict lookup per field.
+# Node shapes:
+#   ("leaf", rule_index)                                   -1 = no rule matched
+#   ("num", field, cuts, children, non_numeric, missing)   len(children) == 2*len(cuts)+1
+#   ("cat", field, {value: child}, other, missing)
+
+def _num_value(v: Any) -> bool:
+    return isinstance(v, (int, float)) and v == v  # bool counts; NaN does not
+
+def _field_kind(conds: List[List[Any]]) -> str:
+    """'num' if every condition on the field is numeric, 'cat' if every value is hashable, else ''."""
+    numeric, categorical = True, True
+    for _, op, value in conds:
+        values = value if op in ("in", "not_in") else [value]
+        if op in ("in", "not_in") and not isinstance(value, (list, tuple, set, frozenset)):
+            return ""
+        if not all(_num_value(v) for v in values):
+            numeric = False
+        if op in (">", ">=", "<", "<="):
+            categorical = False
+        try:
+            frozenset(values)
+        except TypeError:
+            categorical = False
+    return "num" if numeric else ("cat" if categorical else "")
+
+def compile_decision_tree(rules: List[Dict[str, Any]], max_nodes: int = 100_000) -> Tuple[Any, List[Dict[str, Any]]]:
+    """
+    Compile priority-ordered first-match (the best action of run_rules) into a decision tree.
+    Returns (tree, ordered_rules) where leaves index into `rules`.
+    Raises ValueError for conditions that cannot be split on (e.g. substring "in"),
+    for "set" actions (use forward_chain), or if the tree would exceed `max_nodes`.
+    """
+    order = sorted(range(len(rules)), key=lambda i: -rules[i].get("priority", 0))
+    by_field: List[Dict[str, List[List[Any]]]] = []
+    for rule in rules:
+        if rule.get("action", {}).get("set"):
+            raise ValueError(f"Rule '{rule.get('name')}' asserts facts; decision trees are single-pass only")
+        conds: Dict[str, List[List[Any]]] = {}
+        for cond in rule.get("conditions", []):
+            if not isinstance(cond, (list, tuple)) or len(cond) != 3 or cond[1] not in OPS:
+                conds = None  # never matches
+                break
+            conds.setdefault(cond[0], []).append(cond)
+        by_field.append(conds)
+
+    # Rules with malformed conditions can never match
+    order = [i for i in order if by_field[i] is not None]
+    fields = sorted({f for i in order for f in by_field[i]}, key=str)
+    kinds = {}
+    for f in fields:
+        kinds[f] = _field_kind([c for i in order for c in by_field[i].get(f, [])])
+        if not kinds[f]:
+            raise ValueError(f"Field '{f}' mixes operators/values that cannot be compiled")
+    depth_of = {f: k for k, f in enumerate(fields)}
+
+    memo: Dict[Tuple[int, Tuple[int, ...]], Any] = {}
+    n_nodes = [0]
+
+    def cell_passes(rule_conds: List[List[Any]], probe: Any, present: bool) -> bool:
+        if not present:
+            return False
+        return all(evaluate_condition({"x": probe}, ["x", op, v]) for _, op, v in rule_conds)
+
+    def build(k: int, cands: Tuple[int, ...]) -> Any:
+        # First candidate with nothing left to check on later fields wins outright
+        while k < len(fields) and cands and not any(fields[k] in by_field[i] for i in cands):
+            k += 1
+        if not cands:
+            return ("leaf", -1)
+        first = cands[0]
+        if all(depth_of[f] < k for f in by_field[first]):
+            return ("leaf", first)
+        key = (k, cands)
+        if key in memo:
+            return memo[key]
+        n_nodes[0] += 1
+        if n_nodes[0] > max_nodes:
+            raise ValueError(f"Decision tree exceeds {max_nodes} nodes")
+
+        field = fields[k]
+
+        def child(probe: Any, present: bool = True) -> Any:
+            keep = tuple(i for i in cands
+                         if field not in by_field[i] or cell_passes(by_field[i][field], probe, present))
+            return build(k + 1, keep)
+
+        values = []
+        for i in cands:
+            for _, op, v in by_field[i].get(field, []):
+                values.extend(v if op in ("in", "not_in") else [v])
+        missing = child(None, present=False)
+        if kinds[field] == "num":
+            cuts = sorted(set(values))
+            probes = []
+            for j, t in enumerate(cuts):
+                below = cuts[j - 1] if j else None
+                probes.append(t - 1 if below is None else (below + t) / 2)
+                probes.append(t)
+            probes.append(cuts[-1] + 1 if cuts else 0)
+            children = [child(p) for p in probes]
+            node = ("num", field, cuts, children, child(object()), missing)
+        else:
+            mapping = {v: child(v) for v in set(values)}
+            node = ("cat", field, mapping, child(object()), missing)
+        memo[key] = node
+        return node
+
+    return build(0, tuple(order)), rules
+
+def evaluate_tree(tree: Any, facts: Dict[str, Any]) -> int:
+    """Walk the tree; returns the index of the winning rule or -1."""
+    node = tree
+    while node[0] != "leaf":
+        field = node[1]
+        if field not in facts:
+            node = node[-1]
+            continue
+        x = facts[field]
+        if node[0] == "num":
+            if not _num_value(x):
+                node = node[4]
+                continue
+            cuts = node[2]
+            j = bisect.bisect_left(cuts, x)
+            node = node[3][2 * j + 1 if j < len(cuts) and cuts[j] == x else 2 * j]
+        else:
+            try:
+                node = node[2].get(x, node[3])
+            except TypeError:
+                node = node[3]
+    return node[1]
+
+def run_tree(facts: Dict[str, Any], compiled: Tuple[Any, List[Dict[str, Any]]]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Same return shape as run_rules, but fired_rules only holds the winning rule."""
+    tree, rules = compiled
+    i = evaluate_tree(tree, facts)
+    if i < 0:
+        return ({"decision": "REVIEW", "reason": "No rule matched"}, [])
+    return rules[i].get("action", {"decision": "REVIEW", "reason": "No action"}), [rules[i]]
+
+def tree_stats(tree: Any) -> Dict[str, int]:
+    """Distinct nodes, leaves and maximum depth (shared subtrees counted once)."""
+    seen, leaves, depth = set(), 0, 0
+    stack = [(tree, 0)]
+    while stack:
+        node, d = stack.pop()
+        depth = max(depth, d)
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        if node[0] == "leaf":
+            leaves += 1
+            continue
+        kids = node[3] + [node[4], node[5]] if node[0] == "num" else list(node[2].values()) + [node[3], node[4]]
+        stack.extend((c, d + 1) for c in kids)
+    return {"nodes": len(seen), "leaves": leaves, "depth": depth}
+
+def random_facts(rules: List[Dict[str, Any]], n: int, seed: int = 0) -> List[Dict[str, Any]]:
+    """Random facts concentrated on and around every threshold in the rules (fields sometimes missing)."""
+    rng = random.Random(seed)
+    pools: Dict[str, List[Any]] = {}
+    for rule in rules:
+        for cond in rule.get("conditions", []):
+            if not isinstance(cond, (list, tuple)) or len(cond) != 3:
+                continue
+            field, op, value = cond
+            values = value if op in ("in", "not_in") and isinstance(value, (list, tuple, set)) else [value]
+            pool = pools.setdefault(field, [])
+            for v in values:
+                pool.append(v)
+                if _num_value(v) and not isinstance(v, bool):
+                    pool.extend([v - 1, v + 1, v - 0.01, v + 0.01, v * 2])
+    batch = []
+    for _ in range(n):
+        facts = {}
+        for field, pool in pools.items():
+            if rng.random() < 0.95:
+                facts[field] = rng.choice(pool)
+        batch.append(facts)
+    return batch
+
+def verify_decision_tree(rules: List[Dict[str, Any]], compiled: Tuple[Any, List[Dict[str, Any]]],
+                         n: int = 10_000, seed: int = 0) -> List[Dict[str, Any]]:
+    """Compare run_tree against run_rules on random facts; returns the mismatching facts."""
+    return [f for f in random_facts(rules, n, seed) if run_tree(f, compiled)[0] != run_rules(f, rules)[0]]
@@ -0,0 +1,170 @@
+# test_rule_engine.py
+"""
+Decision-tree compilation must pick the same action as single-pass evaluation
+(the Streamlit demo only spot-checks a small sample; this is the full check),
+incremental forward chaining must end where a fresh run on the same facts does, and
+the vectorised static analysis must agree with plain pairwise checks.
+
+    python -m pytest -q test_rule_engine.py
+"""
+import random
+from typing import Any, Dict, List
+
+import pytest
+
+import rule_engine
+from rule_engine import (
+    _normalize_rule, _rule_contains, _rules_overlap, analyze_rules, compile_decision_tree, forward_chain,
+    random_facts, run_rules, run_tree,
+)
+
+NUM_FIELDS = ["income", "credit_score", "debt_to_income", "age"]
+CAT_FIELDS = ["region", "segment"]
+CAT_VALUES = ["north", "south", "east", "west", "retail", "sme"]
+DECISIONS = ["APPROVE", "REJECT", "REVIEW"]
+
+
+def random_rules(rng: random.Random, n: int, kinds: str) -> List[Dict[str, Any]]:
+    """`n` random rules over numeric and/or categorical fields; few priorities, so ties are common."""
+    fields = (NUM_FIELDS if "num" in kinds else []) + (CAT_FIELDS if "cat" in kinds else [])
+    rules = []
+    for i in range(n):
+        conditions = []
+        for field in rng.sample(fields, rng.randint(0, min(3, len(fields)))):
+            if field in NUM_FIELDS:
+                op = rng.choice([">", ">=", "<", "<=", "==", "!="])
+                conditions.append([field, op, rng.choice([rng.randint(0, 20), rng.randint(0, 20) / 4])])
+            else:
+                op = rng.choice(["==", "!=", "in", "not_in"])
+                value = rng.sample(CAT_VALUES, rng.randint(1, 3)) if op in ("in", "not_in") else rng.choice(CAT_VALUES)
+                conditions.append([field, op, value])
+        rules.append({"name": f"r{i}", "priority": rng.randint(0, 3), "conditions": conditions,
+                      "action": {"decision": rng.choice(DECISIONS), "reason": f"r{i}"}})
+    return rules
+
+
+def odd_facts(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    """Values no rule names: unseen numbers, strings on numeric fields, None, missing fields."""
+    pool = [None, "", "n/a", -1, 0.5, 99, 1e9, True, False, "north ", "NORTH"]
+    return [{f: rng.choice(pool) for f in NUM_FIELDS + CAT_FIELDS if rng.random() < 0.8} for _ in range(n)]
+
+
+def assert_equivalent(rules: List[Dict[str, Any]], facts_batch: List[Dict[str, Any]]):
+    compiled = compile_decision_tree(rules)
+    for facts in facts_batch:
+        assert run_tree(facts, compiled)[0] == run_rules(facts, rules)[0], facts
+
+
+@pytest.mark.parametrize("kinds", ["num", "cat", "num+cat"])
+@pytest.mark.parametrize("seed", range(20))
+def test_tree_matches_single_pass(kinds: str, seed: int):
+    rng = random.Random(seed)
+    rules = random_rules(rng, rng.randint(1, 25), kinds)
+    assert_equivalent(rules, random_facts(rules, 500, seed) + odd_facts(rng, 100))
+
+
+def test_no_match_falls_back_to_review():
+    rules = [{"name": "rich", "priority": 1, "conditions": [["income", ">", 10]],
+              "action": {"decision": "APPROVE"}}]
+    compiled = compile_decision_tree(rules)
+    assert run_tree({"income": 5}, compiled) == run_rules({"income": 5}, rules)
+    assert run_tree({}, compiled)[0]["decision"] == "REVIEW"
+
+
+def test_equal_priority_keeps_list_order():
+    rules = [{"name": n, "priority": 5, "conditions": [["age", ">=", 18]], "action": {"decision": n}}
+             for n in ("first", "second")]
+    assert run_tree({"age": 30}, compile_decision_tree(rules))[0]["decision"] == "first"
+
+
+@pytest.mark.parametrize("rules", [
+    [{"name": "sets", "conditions": [], "action": {"set": {"x": 1}}}],
+    [{"name": "mixed", "conditions": [["age", ">", 1], ["age", "==", "old"]], "action": {}}],
+])
+def test_uncompilable_rules_raise(rules: List[Dict[str, Any]]):
+    with pytest.raises(ValueError):
+        compile_decision_tree(rules)
+
+
+def layered_rules(rng: random.Random, n: int) -> List[Dict[str, Any]]:
+    """
+    Setters of "heat"/"mode" that read the sensors (several per field, so they conflict),
+    then deciders that read the derived facts. Acyclic, so there is one fixpoint.
+    """
+    rules = []
+    for i in range(n):
+        conditions = [[f, rng.choice([">", "<="]), rng.randint(15, 35)]
+                      for f in rng.sample(["temp", "hum"], rng.randint(1, 2))]
+        field = rng.choice(["heat", "mode"])
+        value = rng.choice(["COLD", "WARM", "HOT"] if field == "heat" else ["ECO", "BOOST"])
+        rules.append({"name": f"s{i}", "priority": rng.randint(0, 2), "conditions": conditions,
+                      "action": {"set": {field: value}}})
+    for i in range(n):
+        conditions = [["heat", "==", rng.choice(["COLD", "WARM", "HOT"])]]
+        if rng.random() < 0.5:
+            conditions.append(["mode", rng.choice(["==", "!="]), rng.choice(["ECO", "BOOST"])])
+        rules.append({"name": f"d{i}", "priority": rng.randint(0, 2), "conditions": conditions,
+                      "action": {"decision": rng.choice(["COOL", "HEAT", "OFF"]), "reason": f"d{i}"}})
+    return rules
+
+
+@pytest.mark.parametrize("seed", range(30))
+def test_incremental_chain_matches_fresh_run(seed: int):
+    rng = random.Random(seed)
+    rules = layered_rules(rng, rng.randint(2, 8))
+    state = None
+    for _ in range(40):
+        facts = {"temp": rng.randint(10, 40), "hum": rng.randint(10, 40)}
+        action, fired, state = forward_chain(facts, rules, max_cycles=50, state=state)
+        fresh_action, fresh_fired, fresh = forward_chain(facts, rules, max_cycles=50)
+        assert (action, fired, state["facts"]) == (fresh_action, fresh_fired, fresh["facts"]), facts
+
+
+def test_conflicting_setters_resolve_by_priority_then_order():
+    rules = [
+        {"name": "warm", "priority": 1, "conditions": [["temp", ">", 20]], "action": {"set": {"heat": "WARM"}}},
+        {"name": "hot", "priority": 1, "conditions": [["temp", ">", 30]], "action": {"set": {"heat": "HOT"}}},
+        {"name": "scorching", "priority": 2, "conditions": [["temp", ">", 40]], "action": {"set": {"heat": "HOT!"}}},
+    ]
+    state = None
+    for temp, heat in [(35, "WARM"), (25, "WARM"), (45, "HOT!"), (35, "WARM"), (10, None)]:
+        _, _, state = forward_chain({"temp": temp}, rules, state=state)
+        assert state["facts"].get("heat") == heat, temp
+
+
+def pairwise_analysis(rules: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Shadowing and conflicts straight from the definitions, one pair at a time."""
+    norms = [_normalize_rule(r) for r in rules]
+    order = [i for i in sorted(range(len(rules)), key=lambda i: -rules[i].get("priority", 0))
+             if not norms[i]["unsat"]]
+    shadowed, conflicts = {}, {}
+    for k, i in enumerate(order):
+        for j in order[:k]:
+            if i not in shadowed and _rule_contains(norms[j], norms[i]):
+                shadowed[i] = j
+            if (i not in conflicts and rules[j].get("priority", 0) == rules[i].get("priority", 0)
+                    and rules[j]["action"] != rules[i]["action"] and _rules_overlap(norms[j], norms[i])):
+                conflicts[i] = j
+    return {"shadowed": shadowed, "conflicts": conflicts}
+
+
+@pytest.mark.parametrize("kinds", ["num", "cat", "num+cat"])
+@pytest.mark.parametrize("seed", range(10))
+def test_analysis_matches_pairwise_checks(kinds: str, seed: int):
+    rng = random.Random(seed)
+    rules = random_rules(rng, 150, kinds)
+    for rule in rules[::9]:
+        # True == 1 on one field makes it fall back to the exact checks
+        rule["conditions"].append(["flag", rng.choice(["==", "!="]), rng.choice([True, False, 0, 1, 2])])
+    analysis = analyze_rules(rules)
+    assert analysis["truncated"] == []
+    assert {k: analysis[k] for k in ("shadowed", "conflicts")} == pairwise_analysis(rules)
+
+
+def test_analysis_reports_truncated_checks(monkeypatch):
+    monkeypatch.setattr(rule_engine, "MAX_EXACT_CHECKS", 0)
+    rules = [{"name": n, "priority": 1, "conditions": [["flag", "==", v]], "action": {"decision": n}}
+             for n, v in (("one", 1), ("true", True), ("again", 1))]
+    analysis = analyze_rules(rules)
+    assert analysis["truncated"] == [1, 2]
+    assert analysis["shadowed"] == {}
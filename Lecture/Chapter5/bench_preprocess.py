@@ -0,0 +1,53 @@
+# bench_preprocess.py
+"""
+Microbenchmark: ms per image for the torchvision preprocessing pipeline
+(Resize(256) -> CenterCrop(224) -> ToTensor -> Normalize) versus FastPreprocess.
+
+    python bench_preprocess.py                      # synthetic 12 MP JPEGs
+    python bench_preprocess.py photos/*.jpg --runs 5
+"""
+import argparse
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from classifier import benchmark_preprocess
+
+
+def synthetic_jpegs(count: int, width: int, height: int, seed: int = 0):
+    """Smooth random images (closer to photos than pure noise) encoded as JPEG."""
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        small = rng.integers(0, 256, (max(height // 250, 2), max(width // 250, 2), 3), dtype=np.uint8)
+        buf = BytesIO()
+        Image.fromarray(small).resize((width, height), Image.BICUBIC).save(buf, "JPEG", quality=90)
+        images.append(buf.getvalue())
+    return images
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", help="Image files (default: synthetic JPEGs)")
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--size", default="4000x3000", help="Synthetic image size WxH")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.images:
+        images = []
+        for path in args.images:
+            with open(path, "rb") as fh:
+                images.append(fh.read())
+    else:
+        width, height = (int(v) for v in args.size.lower().split("x"))
+        images = synthetic_jpegs(args.count, width, height)
+
+    table = benchmark_preprocess(images, args.runs)
+    print(f"{len(images)} image(s), {args.runs} run(s)")
+    print(table.to_string(index=False, float_format=lambda v: f"{v:.3f}"))
+
+
+if __name__ == "__main__":
+    main()
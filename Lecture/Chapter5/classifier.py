@@ -0,0 +1,844 @@
+# classifier.py
+"""
+Shared ResNet-18 inference helpers for the Chapter 5 classifier apps
+(also used by Lab-Report-5/AILab5.py and Lab-Test/Q3/Q3.py).
+
+Labels and weights are resolved locally: class names come from the torchvision
+weights metadata, and the weights file is read from a local cache directory
+(downloaded there once if missing; pre-seed it on machines without internet).
+
+Batch mode: images are decoded and preprocessed on a thread pool while the
+previous batch runs through the model, so the CPU stays busy with full batches
+instead of one image at a time.
+
+Preprocessing: FastPreprocess decodes JPEGs at reduced size, crops and resizes in
+one step and normalizes in place; `python bench_preprocess.py` compares it with
+the torchvision pipeline.
+
+Prediction cache: single-image results are kept per (backend, SHA-1 of the raw
+bytes), optionally matched by perceptual hash, so Streamlit reruns and repeated
+uploads skip preprocessing and inference.
+
+Real-time video: VideoClassifier reads a video file or V4L2 device on one thread
+and runs the model on another, always on the newest frame (needs OpenCV).
+"""
+import copy
+import hashlib
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import torch
+import torch.nn.functional as F
+from PIL import Image
+from torchvision import models, transforms
+from torchvision.models import ResNet18_Weights
+from torchvision.models import quantization as qmodels
+
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+# Weights live in <MODEL_CACHE>/checkpoints/ (same layout as torch.hub)
+MODEL_CACHE = Path(os.environ.get("CV_MODEL_CACHE", Path(__file__).with_name(".cache") / "torch"))
+
+
+# -----------------------------
+# Labels & model
+# -----------------------------
+def imagenet_labels(weights: ResNet18_Weights = ResNet18_Weights.DEFAULT) -> List[str]:
+    """The 1000 ImageNet class names shipped with the torchvision weights; no download."""
+    return list(weights.meta["categories"])
+
+
+def weights_path(weights: ResNet18_Weights = ResNet18_Weights.DEFAULT, cache_dir: Path = MODEL_CACHE) -> Path:
+    return Path(cache_dir) / "checkpoints" / os.path.basename(urlparse(weights.url).path)
+
+
+def load_resnet18(cache_dir: Path = MODEL_CACHE, device: str = "cpu") -> Tuple[torch.nn.Module, Dict[str, Any]]:
+    """
+    ResNet-18 with weights read from `cache_dir`, plus one warm-up forward pass.
+    Returns (model, cold_start) where cold_start has load_s, warmup_s and cached
+    (whether the weights were already on disk).
+    """
+    weights = ResNet18_Weights.DEFAULT
+    path = weights_path(weights, cache_dir)
+    cached = path.exists()
+    t0 = time.perf_counter()
+    try:
+        state = weights.get_state_dict(progress=False, model_dir=str(path.parent))
+    except OSError as e:
+        raise RuntimeError(f"ResNet-18 weights are not in {path.parent} and could not be downloaded ({e}). "
+                           f"Copy {path.name} there to run offline.") from e
+    model = models.resnet18()
+    model.load_state_dict(state)
+    model.to(device).eval()
+    t1 = time.perf_counter()
+    with torch.inference_mode():
+        model(torch.zeros(1, 3, 224, 224, device=device))
+    t2 = time.perf_counter()
+    return model, {"load_s": t1 - t0, "warmup_s": t2 - t1, "cached": cached}
+
+
+def cold_start_caption(cold_start: Dict[str, Any]) -> str:
+    source = "local cache" if cold_start["cached"] else "first download"
+    return (f"⏱ Cold start: weights {cold_start['load_s']:.2f} s ({source}), "
+            f"warm-up {cold_start['warmup_s']:.2f} s")
+
+
+def build_preprocess() -> transforms.Compose:
+    """Resize(256) -> CenterCrop(224) -> tensor -> ImageNet normalization."""
+    return transforms.Compose([
+        transforms.Resize(256),
+        transforms.CenterCrop(224),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD),
+    ])
+
+
+def load_image(data: bytes) -> Image.Image:
+    return Image.open(BytesIO(data)).convert("RGB")
+
+
+class FastPreprocess:
+    """
+    Same result as build_preprocess() up to resampling differences, in fewer passes:
+    - decode: JPEGs are decoded at a reduced DCT scale (draft mode) that still
+      leaves the short side >= `resize`
+    - resize: one bilinear resize from the centre-crop box straight to crop x crop
+    - normalize: uint8 -> float copy, then a single multiply-add with the
+      ImageNet mean/std folded into one scale and shift per channel
+    `batch()` fills a reusable buffer (pinned when CUDA is available) instead of
+    allocating per image; callable like a transform for single images.
+    """
+
+    def __init__(self, resize: int = 256, crop: int = 224, mean: Sequence[float] = IMAGENET_MEAN,
+                 std: Sequence[float] = IMAGENET_STD, max_batch: int = 1):
+        self.resize = resize
+        self.crop = crop
+        std_t = torch.tensor(std).view(3, 1, 1)
+        # (x / 255 - mean) / std == x * scale + shift
+        self.scale = 1.0 / (255.0 * std_t)
+        self.shift = -torch.tensor(mean).view(3, 1, 1) / std_t
+        self._buffer = self._allocate(max_batch)
+
+    def _allocate(self, n: int) -> torch.Tensor:
+        buffer = torch.empty(n, 3, self.crop, self.crop)
+        return buffer.pin_memory() if torch.cuda.is_available() else buffer
+
+    def decode(self, data: bytes) -> Image.Image:
+        image = Image.open(BytesIO(data))
+        if image.format == "JPEG":
+            image.draft("RGB", (self.resize, self.resize))
+        return image.convert("RGB")
+
+    def __call__(self, image: Image.Image, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+        w, h = image.size
+        side = min(w, h) * self.crop / self.resize
+        box = ((w - side) / 2, (h - side) / 2, (w + side) / 2, (h + side) / 2)
+        pixels = np.array(image.resize((self.crop, self.crop), Image.BILINEAR, box=box))
+        if out is None:
+            out = torch.empty(3, self.crop, self.crop)
+        out.copy_(torch.from_numpy(pixels).permute(2, 0, 1))
+        return out.mul_(self.scale).add_(self.shift)
+
+    def batch(self, images: Sequence[Image.Image]) -> torch.Tensor:
+        """[N, 3, crop, crop] view into the reusable buffer; valid until the next call."""
+        if len(images) > len(self._buffer):
+            self._buffer = self._allocate(len(images))
+        for i, image in enumerate(images):
+            self(image, out=self._buffer[i])
+        return self._buffer[:len(images)]
+
+
+def benchmark_preprocess(images: Sequence[bytes], runs: int = 3) -> pd.DataFrame:
+    """
+    ms per image (decode included) for the torchvision pipeline and FastPreprocess,
+    with the mean absolute difference from the torchvision tensors.
+    """
+    reference = build_preprocess()
+    fast = FastPreprocess()
+    paths = {
+        "Resize -> CenterCrop -> ToTensor -> Normalize": lambda data: reference(load_image(data)).unsqueeze(0),
+        "Fast, full decode": lambda data: fast.batch([load_image(data)]),
+        "Fast, JPEG draft decode": lambda data: fast.batch([fast.decode(data)]),
+    }
+    expected = [reference(load_image(data)) for data in images]
+    rows = []
+    for name, run in paths.items():
+        diff = float(np.mean([float((run(data)[0] - ref).abs().mean()) for data, ref in zip(images, expected)]))
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            for data in images:
+                run(data)
+        ms = (time.perf_counter() - t0) * 1000 / (runs * len(images))
+        rows.append({"path": name, "ms_per_image": ms, "mean_abs_diff": diff})
+    table = pd.DataFrame(rows)
+    table["speedup"] = table["ms_per_image"].iloc[0] / table["ms_per_image"]
+    return table
+
+
+# -----------------------------
+# Inference backends (CPU)
+# -----------------------------
+BACKENDS = ("Eager FP32", "TorchScript", "torch.compile", "Channels-last", "Dynamic INT8", "Static INT8 (fbgemm)")
+# Backends that need sample images before they can be built
+NEEDS_CALIBRATION = {"Static INT8 (fbgemm)"}
+
+
+class ChannelsLast(torch.nn.Module):
+    """Runs the wrapped model with NHWC (channels_last) weights and inputs."""
+
+    def __init__(self, model: torch.nn.Module):
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last)
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+def build_backend(name: str, model: torch.nn.Module, calibration: Optional[torch.Tensor] = None) -> torch.nn.Module:
+    """
+    An inference module for `name` derived from the FP32 `model` (which is not modified).
+    - Dynamic INT8 quantizes the Linear layer only (PyTorch has no dynamic conv kernels)
+    - Static INT8 fuses conv/bn/relu, calibrates observers on `calibration` and converts
+      using the fbgemm x86 backend
+    """
+    example = torch.zeros(1, 3, 224, 224)
+    if name == "Eager FP32":
+        return model
+    if name == "TorchScript":
+        with torch.no_grad():
+            traced = torch.jit.trace(copy.deepcopy(model).eval(), example)
+        return torch.jit.optimize_for_inference(traced)  # freezes, folds conv+bn
+    if name == "torch.compile":
+        return torch.compile(copy.deepcopy(model).eval())
+    if name == "Channels-last":
+        return ChannelsLast(copy.deepcopy(model)).eval()
+    if name == "Dynamic INT8":
+        return torch.ao.quantization.quantize_dynamic(copy.deepcopy(model).eval(), {torch.nn.Linear},
+                                                      dtype=torch.qint8)
+    if name == "Static INT8 (fbgemm)":
+        if calibration is None or not len(calibration):
+            raise ValueError("Static INT8 needs calibration images")
+        if "fbgemm" not in torch.backends.quantized.supported_engines:
+            raise RuntimeError("fbgemm quantized engine is not available on this CPU")
+        torch.backends.quantized.engine = "fbgemm"
+        qmodel = qmodels.resnet18(weights=None, quantize=False)
+        qmodel.load_state_dict(model.state_dict())
+        qmodel.eval()
+        qmodel.fuse_model()
+        qmodel.qconfig = torch.ao.quantization.get_default_qconfig("fbgemm")
+        torch.ao.quantization.prepare(qmodel, inplace=True)
+        with torch.inference_mode():
+            for chunk in calibration.split(16):
+                qmodel(chunk)
+        return torch.ao.quantization.convert(qmodel, inplace=True)
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def benchmark_backends(model: torch.nn.Module, samples: torch.Tensor, names: Sequence[str] = BACKENDS,
+                       runs: int = 10) -> pd.DataFrame:
+    """
+    Per backend: build time (including the first forward pass), median batch-1
+    latency, batched throughput over `samples` and top-1 agreement with eager FP32.
+    Backends that fail to build are listed with their error.
+    """
+    with torch.inference_mode():
+        reference = model(samples).argmax(dim=1)
+    rows = []
+    for name in names:
+        row: Dict[str, Any] = {"backend": name}
+        try:
+            t0 = time.perf_counter()
+            module = build_backend(name, model, samples)
+            with torch.inference_mode():
+                module(samples[:1])
+                row["build_s"] = time.perf_counter() - t0
+                module(samples)  # second warm-up at the benchmark batch size
+
+                single = []
+                for i in range(runs):
+                    t = time.perf_counter()
+                    module(samples[i % len(samples)].unsqueeze(0))
+                    single.append(time.perf_counter() - t)
+                t = time.perf_counter()
+                for _ in range(max(1, runs // 2)):
+                    top1 = module(samples).argmax(dim=1)
+                batch_s = (time.perf_counter() - t) / max(1, runs // 2)
+            row["latency_ms"] = float(np.median(single)) * 1000
+            row["images_per_sec"] = len(samples) / batch_s
+            row["top1_agreement"] = float((top1 == reference).float().mean())
+        except Exception as e:
+            row["error"] = str(e)
+        rows.append(row)
+    return pd.DataFrame(rows, columns=["backend", "build_s", "latency_ms", "images_per_sec", "top1_agreement", "error"])
+
+
+def calibration_batch(files: Sequence[Tuple[str, bytes]], preprocess: Callable = None, limit: int = 64) -> torch.Tensor:
+    """Preprocessed [N, 3, 224, 224] batch from up to `limit` readable sample images."""
+    preprocess = preprocess or build_preprocess()
+    batches = [batch for _, batch, _ in iter_batches(files[:limit], preprocess, batch_size=limit) if len(batch)]
+    return torch.cat(batches) if batches else torch.empty(0, 3, 224, 224)
+
+
+# -----------------------------
+# Batched inference
+# -----------------------------
+def _prepare(job: Tuple[str, bytes, Callable]) -> Tuple[str, Optional[torch.Tensor], Optional[str]]:
+    name, data, preprocess = job
+    decode = getattr(preprocess, "decode", load_image)
+    try:
+        return name, preprocess(decode(data)), None
+    except Exception as e:  # unreadable file: reported, not fatal for the batch
+        return name, None, str(e)
+
+
+def iter_batches(files: Iterable[Tuple[str, bytes]], preprocess: Callable, batch_size: int = 16,
+                 workers: int = 4) -> Iterator[Tuple[List[str], torch.Tensor, List[Tuple[str, str]]]]:
+    """
+    Yield (names, [B, 3, 224, 224] tensor, errors) in upload order. At most two batches
+    are being decoded ahead of the one being consumed.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        names: List[str] = []
+        tensors: List[torch.Tensor] = []
+        errors: List[Tuple[str, str]] = []
+        source = iter(files)
+
+        def fill():
+            while len(pending) < 2 * batch_size:
+                item = next(source, None)
+                if item is None:
+                    return
+                pending.append(pool.submit(_prepare, (item[0], item[1], preprocess)))
+
+        fill()
+        while pending:
+            name, tensor, error = pending.popleft().result()
+            fill()
+            if tensor is None:
+                errors.append((name, error))
+            else:
+                names.append(name)
+                tensors.append(tensor)
+            if len(tensors) == batch_size or (not pending and (tensors or errors)):
+                yield names, torch.stack(tensors) if tensors else torch.empty(0, 3, 224, 224), errors
+                names, tensors, errors = [], [], []
+
+
+def predict(model: torch.nn.Module, batch: torch.Tensor, k: int = 5) -> Tuple[torch.Tensor, torch.Tensor]:
+    """Top-k (probabilities, class ids), each [B, k]."""
+    with torch.inference_mode():
+        probs = F.softmax(model(batch), dim=1)
+        return torch.topk(probs, k, dim=1)
+
+
+def classify_files(model: torch.nn.Module, files: Sequence[Tuple[str, bytes]], labels: Optional[Sequence[str]] = None,
+                   preprocess: Callable = None, batch_size: int = 16, workers: int = 4,
+                   k: int = 5) -> Tuple[pd.DataFrame, Dict[str, float]]:
+    """
+    Classify many images. Returns (results, stats):
+    - results: one row per (file, rank) with class_id, label and probability;
+      unreadable files get a single row with an error message
+    - stats: images, seconds, images_per_sec, inference_seconds, batches
+    """
+    preprocess = preprocess or build_preprocess()
+    rows = []
+    infer_s = 0.0
+    batches = 0
+    t0 = time.perf_counter()
+    for names, batch, errors in iter_batches(files, preprocess, batch_size, workers):
+        for name, error in errors:
+            rows.append({"file": name, "rank": None, "class_id": None, "label": None,
+                         "probability": None, "error": error})
+        if not names:
+            continue
+        t1 = time.perf_counter()
+        top_prob, top_id = predict(model, batch, k)
+        infer_s += time.perf_counter() - t1
+        batches += 1
+        for name, probs, ids in zip(names, top_prob.tolist(), top_id.tolist()):
+            for rank, (p, c) in enumerate(zip(probs, ids), start=1):
+                rows.append({"file": name, "rank": rank, "class_id": c,
+                             "label": labels[c] if labels else f"Class {c}",
+                             "probability": p, "error": None})
+    elapsed = time.perf_counter() - t0
+    n = sum(1 for r in rows if r["rank"] == 1)
+    stats = {
+        "images": n,
+        "seconds": elapsed,
+        "images_per_sec": n / elapsed if elapsed > 0 else 0.0,
+        "inference_seconds": infer_s,
+        "batches": batches,
+    }
+    return pd.DataFrame(rows, columns=["file", "rank", "class_id", "label", "probability", "error"]), stats
+
+
+def batch_summary(results: pd.DataFrame) -> pd.DataFrame:
+    """Top-1 per file (plus unreadable files) for display."""
+    top1 = results[(results["rank"] == 1) | results["error"].notna()]
+    return top1[["file", "label", "probability", "error"]].reset_index(drop=True)
+
+
+# -----------------------------
+# Streamlit: batch mode
+# -----------------------------
+def render_batch_mode(model: torch.nn.Module, labels: Optional[Sequence[str]] = None,
+                      preprocess: Callable = None, key: str = "batch"):
+    """Multi-file upload -> batched top-5 predictions, throughput and CSV export."""
+    files = st.file_uploader("Upload images (jpg/png)", type=["jpg", "jpeg", "png"],
+                             accept_multiple_files=True, key=f"{key}_files")
+    c1, c2 = st.columns(2)
+    batch_size = int(c1.number_input("Batch size", 1, 256, 16, key=f"{key}_size"))
+    workers = int(c2.number_input("Decode threads", 1, 32, 4, key=f"{key}_workers"))
+    if not files:
+        st.info("👆 Please upload one or more images to start.")
+        return
+
+    file_ids = tuple(f.file_id for f in files)
+    if st.button(f"Classify {len(files)} image(s)", key=f"{key}_run"):
+        with st.spinner("Classifying..."):
+            results, stats = classify_files(model, [(f.name, f.getvalue()) for f in files], labels,
+                                            preprocess, batch_size, workers)
+        st.session_state[f"{key}_results"] = (file_ids, results, stats)
+
+    saved = st.session_state.get(f"{key}_results")
+    if saved is None or saved[0] != file_ids:
+        return
+    _, results, stats = saved
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Images", stats["images"])
+    m2.metric("Images / sec", f"{stats['images_per_sec']:.1f}")
+    m3.metric("Model time", f"{stats['inference_seconds']:.2f} s", f"{stats['batches']} batch(es)",
+              delta_color="off")
+    st.dataframe(batch_summary(results), use_container_width=True, hide_index=True)
+    st.download_button("Download top-5 predictions (CSV)", results.to_csv(index=False).encode("utf-8"),
+                       "predictions_top5.csv", "text/csv", key=f"{key}_csv")
+
+
+# -----------------------------
+# Streamlit: backend selector
+# -----------------------------
+@st.cache_resource(max_entries=8)
+def _cached_backend(name: str, samples_key: Tuple[str, ...], _model: torch.nn.Module,
+                    _samples: Optional[Callable[[], torch.Tensor]]) -> torch.nn.Module:
+    """`samples_key` is () unless the backend is calibrated, so the others are built once."""
+    calibration = _samples() if _samples is not None else None
+    if calibration is not None and not len(calibration):
+        raise ValueError("none of the sample images could be read")
+    return build_backend(name, _model, calibration)
+
+
+@st.cache_resource(max_entries=4)
+def _calibration_samples(samples_key: Tuple[str, ...], selector: str, _files: Sequence[Any],
+                         _preprocess: Optional[Callable]) -> torch.Tensor:
+    return calibration_batch([(f.name, f.getvalue()) for f in _files], _preprocess)
+
+
+def render_backend_selector(model: torch.nn.Module, preprocess: Callable = None,
+                            key: str = "backend") -> torch.nn.Module:
+    """
+    Sidebar backend picker with optional sample images (used for INT8 calibration and
+    the benchmark table). Returns the module to run inference with.
+    """
+    with st.sidebar.expander("⚡ Inference backend"):
+        name = st.selectbox("Backend", BACKENDS, key=f"{key}_name")
+        files = st.file_uploader("Sample images (calibration & benchmark)", type=["jpg", "jpeg", "png"],
+                                 accept_multiple_files=True, key=f"{key}_samples")
+        samples_key = tuple(f.file_id for f in files or [])
+
+        def samples() -> torch.Tensor:
+            # Decoded only when a calibrated backend is built or the benchmark runs, then cached
+            return _calibration_samples(samples_key, key, files, preprocess)
+
+        if name in NEEDS_CALIBRATION and not files:
+            st.warning(f"{name} needs sample images for calibration; using Eager FP32.")
+            name = "Eager FP32"
+        calibrated = name in NEEDS_CALIBRATION
+        try:
+            with st.spinner(f"Preparing {name}..."):
+                module = _cached_backend(name, samples_key if calibrated else (), model,
+                                         samples if calibrated else None)
+        except Exception as e:
+            st.error(f"{name} unavailable: {e}")
+            name, module, calibrated = "Eager FP32", model, False
+        # Identifies the running module, e.g. for keying cached predictions
+        st.session_state[f"{key}_active"] = (name, samples_key if calibrated else ())
+
+        if files and st.button("Benchmark all backends", key=f"{key}_bench"):
+            batch = samples()
+            if len(batch):
+                with st.spinner("Benchmarking..."):
+                    st.session_state[f"{key}_table"] = (samples_key, benchmark_backends(model, batch), len(batch))
+            else:
+                st.warning("None of the sample images could be read.")
+        saved = st.session_state.get(f"{key}_table")
+        if saved is not None and saved[0] == samples_key:
+            st.dataframe(saved[1].style.format({"build_s": "{:.2f}", "latency_ms": "{:.1f}",
+                                                "images_per_sec": "{:.1f}", "top1_agreement": "{:.1%}"},
+                                               na_rep="–"),
+                         hide_index=True, use_container_width=True)
+            st.caption(f"Latency: batch 1. Throughput and agreement: {saved[2]} sample image(s).")
+    return module
+
+
+# -----------------------------
+# Prediction cache
+# -----------------------------
+def dhash(data: bytes, size: int = 8) -> int:
+    """64-bit difference hash: brighter-than-right-neighbour bits of a 9x8 grayscale thumbnail."""
+    image = Image.open(BytesIO(data))
+    if image.format == "JPEG":
+        image.draft("L", (size * 8, size * 8))
+    pixels = np.asarray(image.convert("L").resize((size + 1, size), Image.BILINEAR), dtype=np.int16)
+    return int.from_bytes(np.packbits(pixels[:, 1:] > pixels[:, :-1]).tobytes(), "big")
+
+
+class PredictionCache:
+    """
+    Top-k predictions keyed by (namespace, SHA-1 of the raw image bytes), evicted
+    least-recently-used first once the entries take more than `max_bytes`. Keys made
+    with perceptual=True also carry a dHash; a lookup that misses on the exact bytes
+    then accepts any entry within `max_distance` bits (re-encoded or resized copies).
+    Thread-safe, so one instance can be shared by all sessions.
+    """
+
+    # Rough per-entry cost of the dict slots, key tuple and hash string
+    ENTRY_OVERHEAD = 300
+
+    def __init__(self, max_bytes: int = 8 * 2**20, max_distance: int = 4):
+        self.max_bytes = max_bytes
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[Tuple[Any, str], Tuple[np.ndarray, np.ndarray, Optional[int]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+            self.hits = self.near_hits = self.misses = 0
+
+    @staticmethod
+    def key(data: bytes, perceptual: bool = False) -> Tuple[str, Optional[int]]:
+        return hashlib.sha1(data).hexdigest(), dhash(data) if perceptual else None
+
+    def get(self, namespace: Any, key: Tuple[str, Optional[int]]) -> Optional[Tuple[List[float], List[int]]]:
+        """(probabilities, class ids) or None; counts a hit or a miss."""
+        digest, phash = key
+        with self._lock:
+            found = (namespace, digest) if (namespace, digest) in self._entries else None
+            if found is None and phash is not None:
+                found = next((k for k, (_, _, h) in self._entries.items()
+                              if k[0] == namespace and h is not None
+                              and bin(h ^ phash).count("1") <= self.max_distance), None)
+                self.near_hits += found is not None
+            if found is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(found)
+            probs, ids, _ = self._entries[found]
+            return probs.tolist(), ids.tolist()
+
+    def put(self, namespace: Any, key: Tuple[str, Optional[int]], probs: Sequence[float], ids: Sequence[int]):
+        digest, phash = key
+        entry = (np.asarray(probs, dtype=np.float32), np.asarray(ids, dtype=np.int32), phash)
+        with self._lock:
+            old = self._entries.pop((namespace, digest), None)
+            if old is not None:
+                self.bytes -= self._size(old)
+            self._entries[(namespace, digest)] = entry
+            self.bytes += self._size(entry)
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                self.bytes -= self._size(self._entries.popitem(last=False)[1])
+
+    def _size(self, entry: Tuple[np.ndarray, np.ndarray, Optional[int]]) -> int:
+        return self.ENTRY_OVERHEAD + entry[0].nbytes + entry[1].nbytes
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "bytes": self.bytes, "hits": self.hits,
+                    "near_hits": self.near_hits, "misses": self.misses,
+                    "hit_rate": self.hits / lookups if lookups else 0.0}
+
+
+def classify_image(model: torch.nn.Module, data: bytes, preprocess: Callable = None,
+                   cache: Optional[PredictionCache] = None, namespace: Any = None, perceptual: bool = False,
+                   k: int = 5) -> Tuple[List[float], List[int], bool]:
+    """Top-k (probabilities, class ids, served from cache) for one image's raw bytes."""
+    key = cache.key(data, perceptual) if cache is not None else None
+    if cache is not None:
+        found = cache.get(namespace, key)
+        if found is not None:
+            return found[0], found[1], True
+    preprocess = preprocess or build_preprocess()
+    image = getattr(preprocess, "decode", load_image)(data)
+    batch = preprocess.batch([image]) if hasattr(preprocess, "batch") else preprocess(image).unsqueeze(0)
+    top_prob, top_id = predict(model, batch, k)
+    probs, ids = top_prob[0].tolist(), top_id[0].tolist()
+    if cache is not None:
+        cache.put(namespace, key, probs, ids)
+    return probs, ids, False
+
+
+# -----------------------------
+# Streamlit: prediction cache
+# -----------------------------
+@st.cache_resource
+def prediction_cache() -> PredictionCache:
+    """One cache per server process, shared by every session."""
+    return PredictionCache()
+
+
+def render_cache_controls(key: str = "cache") -> Tuple[PredictionCache, bool]:
+    """Sidebar options for the shared cache. Returns (cache, match near-duplicates)."""
+    cache = prediction_cache()
+    with st.sidebar.expander("🗂 Prediction cache"):
+        perceptual = st.checkbox("Match near-duplicates (perceptual hash)", key=f"{key}_perceptual",
+                                 help=f"Reuse results for images within {cache.max_distance} bits of dHash")
+        if st.button("Clear cache", key=f"{key}_clear"):
+            cache.clear()
+    return cache, perceptual
+
+
+def render_cache_stats(cache: PredictionCache):
+    """Hit rate and size; call after the page's lookups so the numbers include them."""
+    stats = cache.stats()
+    st.sidebar.metric("Cache hit rate", f"{stats['hit_rate']:.0%}",
+                      f"{stats['hits']} hit(s) / {stats['hits'] + stats['misses']} lookup(s)", delta_color="off")
+    st.sidebar.caption(f"{stats['entries']} cached prediction(s), {stats['near_hits']} near-duplicate hit(s), "
+                       f"{stats['bytes'] / 1024:.0f} of {cache.max_bytes / 2**20:.0f} MiB")
+
+
+# -----------------------------
+# Real-time video
+# -----------------------------
+def open_video(source: str):
+    """cv2.VideoCapture for a video file, a V4L2 device path (/dev/video0) or a camera index."""
+    import cv2  # only video mode needs OpenCV
+
+    capture = cv2.VideoCapture(int(source) if str(source).isdigit() else str(source))
+    if not capture.isOpened():
+        raise RuntimeError(f"Cannot open video source '{source}'")
+    return capture
+
+
+class VideoClassifier:
+    """
+    Continuous top-k classification of a video source on two background threads:
+    - capture: reads frames (a file is paced to its own frame rate) into a queue of
+      depth 1; a frame nobody has taken yet is dropped when the next one arrives
+    - inference: runs the model on the newest frame and blends its softmax into an
+      exponential moving average (`smoothing` = weight of the previous average)
+    Results therefore come at the rate the model sustains and describe a recent frame.
+    Both threads stop by themselves once nobody has called wait() for `idle_timeout`
+    seconds (e.g. the browser tab was closed).
+    """
+
+    def __init__(self, model: torch.nn.Module, source: str, preprocess: Callable = None, k: int = 5,
+                 smoothing: float = 0.6, loop: bool = True, idle_timeout: float = 10.0):
+        self.model = model
+        self.source = source
+        self.preprocess = preprocess or build_preprocess()
+        self.k = k
+        self.smoothing = smoothing
+        self.loop = loop
+        self.idle_timeout = idle_timeout
+        self.captured = self.dropped = self.inferred = 0
+        self.error: Optional[str] = None
+        self._frames: "queue.Queue[Tuple[float, np.ndarray]]" = queue.Queue(maxsize=1)
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._changed = threading.Condition()
+        self._result: Optional[Dict[str, Any]] = None
+        self._seq = 0
+        self._last_wait = time.monotonic()
+
+    @property
+    def running(self) -> bool:
+        return any(t.is_alive() for t in self._threads)
+
+    def start(self):
+        if self.running:
+            return
+        self._stop.clear()
+        self._last_wait = time.monotonic()
+        self._threads = [threading.Thread(target=self._capture, daemon=True),
+                         threading.Thread(target=self._infer, daemon=True)]
+        for t in self._threads:
+            t.start()
+
+    def stop(self):
+        self._stop.set()
+        for t in self._threads:
+            t.join()
+
+    def wait(self, seq: int = 0, timeout: float = 1.0) -> Tuple[int, Optional[Dict[str, Any]]]:
+        """Block until a result newer than `seq` exists (or timeout); returns (seq, result)."""
+        self._last_wait = time.monotonic()
+        with self._changed:
+            self._changed.wait_for(lambda: self._seq > seq or self._stop.is_set(), timeout)
+            return self._seq, self._result
+
+    def _capture(self):
+        import cv2
+
+        try:
+            capture = open_video(self.source)
+        except Exception as e:
+            self.error = str(e)
+            self._stop.set()
+            return
+        is_file = os.path.isfile(str(self.source))
+        fps = capture.get(cv2.CAP_PROP_FPS) if is_file else 0
+        interval = 1.0 / fps if fps and fps > 0 else 0.0
+        due = time.perf_counter()
+        try:
+            while not self._stop.is_set():
+                ok, frame = capture.read()
+                if not ok:
+                    if is_file and self.loop and self.captured:
+                        capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                        continue
+                    break
+                item = (time.perf_counter(), cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                try:
+                    self._frames.put_nowait(item)
+                except queue.Full:
+                    try:
+                        self._frames.get_nowait()  # stale: the model has not picked it up yet
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+                    self._frames.put_nowait(item)  # this is the only producer, so there is room now
+                self.captured += 1
+                if interval:
+                    due = max(due + interval, time.perf_counter() - interval)
+                    self._stop.wait(max(0.0, due - time.perf_counter()))
+        finally:
+            capture.release()
+
+    def _infer(self):
+        average = None
+        finished = deque(maxlen=30)
+        batch_of = getattr(self.preprocess, "batch", None)
+        while not self._stop.is_set():
+            if time.monotonic() - self._last_wait > self.idle_timeout:
+                self._stop.set()
+                break
+            try:
+                captured_at, frame = self._frames.get(timeout=0.1)
+            except queue.Empty:
+                if not self._threads[0].is_alive():
+                    break  # source ended
+                continue
+            image = Image.fromarray(frame)
+            try:
+                batch = batch_of([image]) if batch_of else self.preprocess(image).unsqueeze(0)
+                with torch.inference_mode():
+                    probs = F.softmax(self.model(batch), dim=1)[0]
+                    if average is None or not self.smoothing:
+                        average = probs
+                    else:
+                        average = average.mul_(self.smoothing).add_(probs, alpha=1.0 - self.smoothing)
+                    top_prob, top_id = torch.topk(average, self.k)
+            except Exception as e:
+                self.error = str(e)
+                self._stop.set()
+                break
+            now = time.perf_counter()
+            finished.append(now)
+            self.inferred += 1
+            result = {
+                "frame": frame,
+                "probs": top_prob.tolist(),
+                "ids": top_id.tolist(),
+                "latency_ms": (now - captured_at) * 1000,
+                "fps": (len(finished) - 1) / (finished[-1] - finished[0]) if len(finished) > 1 else 0.0,
+                "captured": self.captured,
+                "dropped": self.dropped,
+                "inferred": self.inferred,
+            }
+            with self._changed:
+                self._result = result
+                self._seq += 1
+                self._changed.notify_all()
+        with self._changed:
+            self._changed.notify_all()
+
+
+# -----------------------------
+# Streamlit: real-time video
+# -----------------------------
+def _uploaded_video_path(upload) -> str:
+    """Uploaded video saved once under the temp dir (OpenCV reads from paths), keyed by content."""
+    data = upload.getvalue()
+    path = Path(tempfile.gettempdir()) / f"cv_video_{hashlib.sha1(data).hexdigest()}{Path(upload.name).suffix}"
+    if not path.exists():
+        path.write_bytes(data)
+    return str(path)
+
+
+def render_video_mode(model: torch.nn.Module, labels: Optional[Sequence[str]] = None,
+                      preprocess: Callable = None, key: str = "video"):
+    """Start/stop continuous classification; redraws each time the model finishes a frame."""
+    c1, c2 = st.columns([3, 2])
+    source = c1.text_input("Video file or V4L2 device", "/dev/video0", key=f"{key}_source",
+                           help="Path to a video file, a device such as /dev/video0, or a camera index")
+    upload = c2.file_uploader("…or upload a video", type=["mp4", "avi", "mov", "mkv", "webm"], key=f"{key}_upload")
+    smoothing = st.slider("Top-5 smoothing (EMA weight of previous frames)", 0.0, 0.95, 0.6, 0.05,
+                          key=f"{key}_smoothing")
+    if upload is not None:
+        source = _uploaded_video_path(upload)
+
+    b1, b2 = st.columns(2)
+    worker: Optional[VideoClassifier] = st.session_state.get(f"{key}_worker")
+    if b2.button("■ Stop", key=f"{key}_stop", use_container_width=True) and worker is not None:
+        worker.stop()
+    if b1.button("▶ Start", key=f"{key}_start", use_container_width=True):
+        if worker is not None:
+            worker.stop()
+        worker = VideoClassifier(model, source, preprocess, smoothing=smoothing)
+        worker.start()
+        st.session_state[f"{key}_worker"] = worker
+    if worker is None:
+        st.info("👆 Choose a video source and press **Start**.")
+        return
+    worker.smoothing = smoothing
+
+    frame_slot = st.empty()
+    m1, m2, m3 = st.columns(3)
+    fps_slot, latency_slot, dropped_slot = m1.empty(), m2.empty(), m3.empty()
+    table_slot = st.empty()
+    seq = 0
+    while True:
+        seq, result = worker.wait(seq)
+        if result is not None:
+            frame_slot.image(result["frame"], caption=f"Frame {result['captured']}", use_container_width=True)
+            fps_slot.metric("Achieved FPS", f"{result['fps']:.1f}")
+            latency_slot.metric("End-to-end latency", f"{result['latency_ms']:.0f} ms",
+                                help="From frame capture to smoothed top-5")
+            dropped_slot.metric("Frames dropped", result["dropped"], f"of {result['captured']}", delta_color="off")
+            table_slot.dataframe(pd.DataFrame({
+                "Label": [labels[c] if labels else f"Class {c}" for c in result["ids"]],
+                "Probability": result["probs"],
+            }), use_container_width=True, hide_index=True)
+        if not worker.running:
+            break
+    if worker.error:
+        st.error(worker.error)
+    else:
+        st.caption("Stopped.")
@@ -0,0 +1,224 @@
+# classify_folder.py
+"""
+Headless top-5 classification of every image under a folder, written to Parquet.
+
+Decoding and preprocessing run in DataLoader worker processes while the model
+works through full batches. Results go to <out>/part-NNNNN.parquet with the same
+columns as the batch-mode CSV (file, rank, class_id, label, probability, error),
+one part per --part-size images, so an interrupted run loses at most one part.
+Running again with the same --out skips every file already in a part.
+
+Memory stays flat on million-image folders: the directory tree is streamed
+(never listed in full), files are spread over workers by path hash, and finished
+files are remembered as sorted 8-byte path hashes (8 MB per million).
+
+    python classify_folder.py photos/ --out predictions/ --workers 4 --batch-size 64
+    python -c "import pandas as pd; print(pd.read_parquet('predictions/'))"
+"""
+import argparse
+import hashlib
+import os
+import time
+from pathlib import Path
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import torch
+from torch.utils.data import DataLoader, IterableDataset, get_worker_info
+
+from classifier import (BACKENDS, NEEDS_CALIBRATION, FastPreprocess, build_backend, calibration_batch,
+                        imagenet_labels, load_resnet18, predict)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".webp"}
+SCHEMA = pa.schema([
+    ("file", pa.string()),
+    ("rank", pa.int8()),
+    ("class_id", pa.int16()),
+    ("label", pa.string()),
+    ("probability", pa.float32()),
+    ("error", pa.string()),
+])
+
+
+# -----------------------------
+# Input: streamed folder walk
+# -----------------------------
+def iter_images(root: Path) -> Iterator[str]:
+    """Paths (relative to `root`, '/'-separated) of image files, without listing the tree up front."""
+    stack = [""]
+    while stack:
+        rel = stack.pop()
+        try:
+            entries = os.scandir(root / rel)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                path = f"{rel}/{entry.name}" if rel else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(path)
+                elif os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES:
+                    yield path
+
+
+def path_key(path: str) -> int:
+    """Signed 64-bit hash of a relative path (resume bookkeeping and worker sharding)."""
+    return int.from_bytes(hashlib.blake2b(path.encode("utf-8"), digest_size=8).digest(), "little", signed=True)
+
+
+def is_done(done: np.ndarray, key: int) -> bool:
+    i = int(np.searchsorted(done, key))
+    return i < len(done) and int(done[i]) == key
+
+
+class FolderDataset(IterableDataset):
+    """(path, [3, 224, 224] tensor or None, error or None) for every unfinished image; each worker takes its share."""
+
+    def __init__(self, root: Path, done: np.ndarray, preprocess: FastPreprocess):
+        self.root = root
+        self.done = done
+        self.preprocess = preprocess
+
+    def __iter__(self):
+        info = get_worker_info()
+        worker, workers = (info.id, info.num_workers) if info is not None else (0, 1)
+        for path in iter_images(self.root):
+            key = path_key(path)
+            if key % workers != worker or is_done(self.done, key):
+                continue
+            try:
+                with open(self.root / path, "rb") as fh:
+                    image = self.preprocess.decode(fh.read())
+                yield path, self.preprocess(image), None
+            except Exception as e:  # unreadable file: recorded in the output, not fatal
+                yield path, None, str(e)
+
+
+def collate(items: Sequence[Tuple[str, Optional[torch.Tensor], Optional[str]]]):
+    """(names, [B, 3, 224, 224] batch, [(name, error)]) like classifier.iter_batches."""
+    names = [name for name, tensor, _ in items if tensor is not None]
+    tensors = [tensor for _, tensor, _ in items if tensor is not None]
+    errors = [(name, error) for name, tensor, error in items if tensor is None]
+    return names, torch.stack(tensors) if tensors else torch.empty(0, 3, 224, 224), errors
+
+
+# -----------------------------
+# Output: Parquet parts
+# -----------------------------
+def finished_keys(out: Path) -> np.ndarray:
+    """Sorted path hashes of every file already present in <out>/part-*.parquet."""
+    keys = []
+    for part in sorted(out.glob("part-*.parquet")):
+        for batch in pq.ParquetFile(part).iter_batches(columns=["file"], batch_size=65536):
+            files = set(batch.column(0).to_pylist())
+            keys.append(np.fromiter((path_key(f) for f in files), dtype=np.int64, count=len(files)))
+    return np.unique(np.concatenate(keys)) if keys else np.empty(0, dtype=np.int64)
+
+
+class PartWriter:
+    """Buffers result rows column-wise and writes them as numbered parts (atomic rename)."""
+
+    def __init__(self, out: Path, labels: Sequence[str]):
+        self.out = out
+        self.labels = labels
+        out.mkdir(parents=True, exist_ok=True)
+        numbers = [int(p.stem.split("-")[1]) for p in out.glob("part-*.parquet")]
+        self.next_part = max(numbers, default=-1) + 1
+        self.files = 0
+        self._reset()
+
+    def _reset(self):
+        self.rows = {name: [] for name in SCHEMA.names}
+        self.pending = 0
+
+    def _row(self, file: str, rank, class_id, label, probability, error):
+        for name, value in zip(SCHEMA.names, (file, rank, class_id, label, probability, error)):
+            self.rows[name].append(value)
+
+    def add(self, names: List[str], top_prob: List[List[float]], top_id: List[List[int]],
+            errors: List[Tuple[str, str]]):
+        for name, error in errors:
+            self._row(name, None, None, None, None, error)
+        for name, probs, ids in zip(names, top_prob, top_id):
+            for rank, (p, c) in enumerate(zip(probs, ids), start=1):
+                self._row(name, rank, c, self.labels[c], p, None)
+        self.pending += len(names) + len(errors)
+
+    def flush(self):
+        if not self.pending:
+            return
+        path = self.out / f"part-{self.next_part:05d}.parquet"
+        tmp = path.with_name(f".{path.name}.tmp")
+        pq.write_table(pa.table(self.rows, schema=SCHEMA), tmp)
+        os.replace(tmp, path)
+        self.next_part += 1
+        self.files += self.pending
+        self._reset()
+
+
+# -----------------------------
+# Job
+# -----------------------------
+def calibration_files(root: Path, limit: int = 64) -> List[Tuple[str, bytes]]:
+    files = []
+    for path in iter_images(root):
+        with open(root / path, "rb") as fh:
+            files.append((path, fh.read()))
+        if len(files) == limit:
+            break
+    return files
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("folder", type=Path)
+    parser.add_argument("--out", type=Path, required=True, help="Directory for part-*.parquet (resumed if present)")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1),
+                        help="Decode/preprocess processes (0 = in the main process)")
+    parser.add_argument("--part-size", type=int, default=10_000, help="Images per Parquet part")
+    parser.add_argument("--backend", choices=BACKENDS, default="Eager FP32")
+    parser.add_argument("--threads", type=int, default=None, help="torch intra-op threads for the model")
+    parser.add_argument("--limit", type=int, default=None, help="Stop after this many images")
+    args = parser.parse_args()
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    done = finished_keys(args.out)
+    print(f"{len(done):,} file(s) already classified in {args.out}")
+    model, _ = load_resnet18()
+    preprocess = FastPreprocess()
+    calibration = None
+    if args.backend in NEEDS_CALIBRATION:
+        calibration = calibration_batch(calibration_files(args.folder), preprocess)
+    model = build_backend(args.backend, model, calibration)
+    writer = PartWriter(args.out, imagenet_labels())
+
+    loader_kwargs = {"prefetch_factor": 2} if args.workers else {}
+    loader = DataLoader(FolderDataset(args.folder, done, preprocess), batch_size=args.batch_size,
+                        num_workers=args.workers, collate_fn=collate, pin_memory=torch.cuda.is_available(),
+                        **loader_kwargs)
+    t0 = time.perf_counter()
+    seen = 0
+    try:
+        for names, batch, errors in loader:
+            top_prob, top_id = predict(model, batch) if names else (torch.empty(0), torch.empty(0))
+            writer.add(names, top_prob.tolist(), top_id.tolist(), errors)
+            seen += len(names) + len(errors)
+            if writer.pending >= args.part_size:
+                writer.flush()
+                elapsed = time.perf_counter() - t0
+                print(f"{seen:,} image(s) in {elapsed:.0f} s ({seen / elapsed:.1f} images/s)")
+            if args.limit and seen >= args.limit:
+                break
+    finally:
+        writer.flush()  # rows are added per complete batch, so this is safe after Ctrl-C too
+    elapsed = time.perf_counter() - t0
+    print(f"done: {seen:,} new image(s) in {elapsed:.1f} s ({seen / max(elapsed, 1e-9):.1f} images/s), "
+          f"{writer.next_part} part(s) in {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,12 @@
+import math
+import time
+from io import BytesIO
+
 import streamlit as st
 import torch
-from torchvision import transforms
+from torchvision.ops import roi_align
+from torchvision.transforms import v2
+from torchvision.transforms.v2 import functional as TF
 from PIL import Image
 import numpy as np
 
@@ -11,7 +17,7 @@ st.set_page_config(
 )
 
 st.title("Simple Image Transform Playground")
-st.write("Using **PyTorch torchvision.transforms** + Streamlit")
+st.write("Using **PyTorch torchvision.transforms.v2** + Streamlit")
 
 # -----------------------------
 # Sidebar: Choose transforms
@@ -32,52 +38,157 @@ else:
     brightness = contrast = saturation = 1.0
     hue = 0.0
 
+st.sidebar.header("Preview Options")
+working_size = st.sidebar.select_slider("Working resolution (longest side)", [256, 384, 512, 768, 1024], 512)
+n_samples = st.sidebar.slider("Augmented samples in grid", 4, 64, 16, 4)
+
 uploaded_file = st.file_uploader("Upload an image (jpg/png)", type=["jpg", "jpeg", "png"])
 
+# -----------------------------
+# Decode once per upload
+# -----------------------------
+@st.cache_data(max_entries=8, show_spinner=False)
+def load_base_image(data: bytes, max_side: int):
+    """
+    Decoded upload, downscaled so its longer side is at most `max_side` (JPEGs are
+    decoded at reduced size directly). Returns (uint8 H x W x 3 array, original size).
+    """
+    image = Image.open(BytesIO(data))
+    original_size = image.size
+    image.draft("RGB", (max_side, max_side))
+    image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), Image.BILINEAR)
+    return np.asarray(image), original_size
+
 # -----------------------------
 # Build transform pipeline
 # -----------------------------
-def build_transform_pipeline():
+@st.cache_resource
+def build_transform_pipeline(do_gray, do_flip, do_random_crop, do_color_jitter,
+                             brightness, contrast, saturation, hue):
+    """v2 pipeline for one uint8 (C, H, W) tensor; built once per combination of options."""
     t_list = []
     if do_gray:
-        t_list.append(transforms.Grayscale(num_output_channels=3))
+        t_list.append(v2.Grayscale(num_output_channels=3))
     if do_flip:
-        t_list.append(transforms.RandomHorizontalFlip(p=1.0))
+        t_list.append(v2.RandomHorizontalFlip(p=1.0))
     if do_random_crop:
-        t_list.append(transforms.RandomResizedCrop(size=224, scale=(0.8, 1.0)))
+        t_list.append(v2.RandomResizedCrop(size=224, scale=(0.8, 1.0), antialias=True))
     else:
-        t_list.append(transforms.Resize((224, 224)))
+        t_list.append(v2.Resize((224, 224), antialias=True))
     if do_color_jitter:
         t_list.append(
-            transforms.ColorJitter(
+            v2.ColorJitter(
                 brightness=brightness,
                 contrast=contrast,
                 saturation=saturation,
                 hue=hue
             )
         )
-    return transforms.Compose(t_list)
+    return v2.Compose(t_list)
+
+# -----------------------------
+# Batched augmentation (one pass for the whole grid)
+# -----------------------------
+# v2 transforms draw one set of random parameters per call, so a batch would get
+# N copies of the same augmentation. The grid instead draws per-sample parameters
+# and applies each step to the whole (N, 3, 224, 224) batch at once.
+def random_crop_boxes(n, height, width, scale=(0.8, 1.0), ratio=(3 / 4, 4 / 3), generator=None):
+    """(n, 5) roi_align boxes [batch index, x1, y1, x2, y2] drawn like RandomResizedCrop."""
+    area = height * width * torch.empty(n).uniform_(*scale, generator=generator)
+    aspect = torch.exp(torch.empty(n).uniform_(math.log(ratio[0]), math.log(ratio[1]), generator=generator))
+    w = torch.sqrt(area * aspect).clamp(max=width)
+    h = torch.sqrt(area / aspect).clamp(max=height)
+    x1 = torch.rand(n, generator=generator) * (width - w)
+    y1 = torch.rand(n, generator=generator) * (height - h)
+    return torch.stack([torch.zeros(n), x1, y1, x1 + w, y1 + h], dim=1)
+
+
+def jitter_factors(n, amount, generator=None):
+    """Per-sample factors in [max(0, 1 - amount), 1 + amount], as ColorJitter draws them."""
+    return torch.empty(n, 1, 1, 1).uniform_(max(0.0, 1.0 - amount), 1.0 + amount, generator=generator)
+
+
+def blend(batch, other, ratio):
+    return (ratio * batch + (1.0 - ratio) * other).clamp_(0.0, 1.0)
+
+
+def augment_batch(base, n, generator=None):
+    """n augmented samples of a uint8 (3, H, W) image as one float (n, 3, 224, 224) batch in [0, 1]."""
+    image = TF.to_dtype(base, torch.float32, scale=True).unsqueeze(0)
+    if do_random_crop:
+        boxes = random_crop_boxes(n, base.shape[-2], base.shape[-1], generator=generator)
+        batch = roi_align(image, boxes, output_size=(224, 224), aligned=True)
+    else:
+        batch = TF.resize(image, [224, 224], antialias=True).expand(n, -1, -1, -1)
+    if do_gray:
+        batch = TF.rgb_to_grayscale(batch, num_output_channels=3)
+    if do_flip:
+        batch = TF.horizontal_flip(batch)
+    if do_color_jitter:
+        if brightness:
+            batch = (batch * jitter_factors(n, brightness, generator)).clamp_(0.0, 1.0)
+        if contrast:
+            mean = TF.rgb_to_grayscale(batch).mean(dim=(-3, -2, -1), keepdim=True)
+            batch = blend(batch, mean, jitter_factors(n, contrast, generator))
+        if saturation:
+            batch = blend(batch, TF.rgb_to_grayscale(batch), jitter_factors(n, saturation, generator))
+        if hue:
+            # adjust_hue takes one factor, so this step alone runs per sample
+            shifts = torch.empty(n).uniform_(-abs(hue), abs(hue), generator=generator)
+            batch = torch.stack([TF.adjust_hue(img, float(s)) for img, s in zip(batch, shifts)])
+    return batch
+
+
+def to_display(batch):
+    """Float (N, 3, H, W) in [0, 1] -> list of uint8 H x W x 3 arrays for st.image."""
+    return list((batch.clamp(0, 1) * 255).round().to(torch.uint8).permute(0, 2, 3, 1).numpy())
+
 
 if uploaded_file is not None:
-    original_image = Image.open(uploaded_file).convert("RGB")
+    base_array, original_size = load_base_image(uploaded_file.getvalue(), working_size)
+    base = torch.from_numpy(base_array.copy()).permute(2, 0, 1)  # uint8 (C, H, W)
 
     st.subheader("Original Image")
-    st.image(original_image, use_container_width=True)
+    st.image(base_array, use_container_width=True)
 
     # Apply transforms
-    transform_pipeline = build_transform_pipeline()
-    transformed = transform_pipeline(original_image)
+    transform_pipeline = build_transform_pipeline(do_gray, do_flip, do_random_crop, do_color_jitter,
+                                                  brightness, contrast, saturation, hue)
+    transformed = transform_pipeline(base)
 
     st.subheader("Transformed Image")
-    st.image(transformed, use_container_width=True)
-
-    # Show tensors shape
-    to_tensor = transforms.ToTensor()
-    original_tensor = to_tensor(original_image)
-    transformed_tensor = to_tensor(transformed)
+    st.image(transformed.permute(1, 2, 0).numpy(), use_container_width=True)
 
     st.write("### Tensor Shapes")
-    st.write(f"Original: {tuple(original_tensor.shape)} (C, H, W)")
-    st.write(f"Transformed: {tuple(transformed_tensor.shape)} (C, H, W)")
+    st.write(f"Original upload: (3, {original_size[1]}, {original_size[0]}) (C, H, W)")
+    st.write(f"Working copy: {tuple(base.shape)} (C, H, W)")
+    st.write(f"Transformed: {tuple(transformed.shape)} (C, H, W)")
+
+    # -----------------------------
+    # Augmentation grid + throughput
+    # -----------------------------
+    st.subheader(f"Augmentation Grid ({n_samples} samples)")
+    if st.button("🔀 New samples"):
+        st.session_state.aug_seed = st.session_state.get("aug_seed", 0) + 1
+    generator = torch.Generator().manual_seed(st.session_state.get("aug_seed", 0))
+
+    t0 = time.perf_counter()
+    batch = augment_batch(base, n_samples, generator)
+    batched_ms = (time.perf_counter() - t0) * 1000 / n_samples
+
+    # Same options through the per-image v2 pipeline, for comparison
+    t0 = time.perf_counter()
+    for _ in range(n_samples):
+        transform_pipeline(base)
+    per_image_ms = (time.perf_counter() - t0) * 1000 / n_samples
+
+    c1, c2 = st.columns(2)
+    c1.metric("Batched", f"{batched_ms:.2f} ms / augmentation")
+    c2.metric("Per-image v2 pipeline", f"{per_image_ms:.2f} ms / augmentation",
+              f"{per_image_ms / batched_ms:.1f}x slower" if batched_ms > 0 else None, delta_color="off")
+    st.caption(f"Batch {tuple(batch.shape)} from a {base.shape[-1]}x{base.shape[-2]} working copy; "
+               f"≈ {1000 / max(batched_ms, 1e-6):,.0f} augmentations/s on this machine.")
+    st.image(to_display(batch), width=150)
 else:
     st.info("👆 Please upload an image to see transforms.")
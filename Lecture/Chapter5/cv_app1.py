@@ -1,11 +1,9 @@
 import streamlit as st
-import torch
-import torch.nn.functional as F
-from torchvision import models, transforms
-from PIL import Image
-import requests
-import json
-from io import BytesIO
+
+from classifier import (FastPreprocess, classify_image, cold_start_caption, imagenet_labels, load_resnet18,
+                        render_backend_selector, render_batch_mode, render_cache_controls, render_cache_stats)
+from embeddings import render_similar_panel
+from inference_server import inference_client, render_remote_model
 
 # -----------------------------
 # 1. Page config
@@ -25,42 +23,54 @@ st.write("Using **PyTorch ResNet-18 (pretrained on ImageNet)** + Streamlit")
 @st.cache_data
 def load_imagenet_labels():
     """
-    Download ImageNet class index (only once, then cached).
+    ImageNet class names bundled with the torchvision weights (no network needed).
     """
-    url = "https://raw.githubusercontent.com/pytorch/hub/master/imagenet_classes.txt"
-    response = requests.get(url)
-    labels = response.text.strip().split("\n")
-    return labels
+    return imagenet_labels()
 
 # -----------------------------
 # 3. Utility: Load model
 # -----------------------------
 @st.cache_resource
 def load_model():
-    model = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
-    model.eval()
-    return model
+    # Weights from the local cache dir, then one warm-up pass; timings shown in the sidebar
+    return load_resnet18()
 
 labels = load_imagenet_labels()
-model = load_model()
+# With CV_INFERENCE_SOCKET set, the shared inference server runs the model and this
+# app is a thin client (no weights loaded here)
+server = inference_client()
+if server is None:
+    model, cold_start = load_model()
+    st.sidebar.caption(cold_start_caption(cold_start))
 
 # -----------------------------
 # 4. Define transforms
 # -----------------------------
-preprocess = transforms.Compose([
-    transforms.Resize(256),
-    transforms.CenterCrop(224),
-    transforms.ToTensor(),
-    # Normalization for ImageNet pretrained models
-    transforms.Normalize(
-        mean=[0.485, 0.456, 0.406],
-        std=[0.229, 0.224, 0.225]
-    )
-])
+# Same steps as Resize(256) -> CenterCrop(224) -> ToTensor -> Normalize, but with
+# JPEG draft decoding, a single resize and an in-place normalize into a buffer
+# kept per session (see bench_preprocess.py for the timings)
+if "preprocess" not in st.session_state:
+    st.session_state.preprocess = FastPreprocess()
+preprocess = st.session_state.preprocess
+
+# -----------------------------
+# 4b. Inference backend (sidebar)
+# -----------------------------
+if server is None:
+    infer = render_backend_selector(model, preprocess)
+else:
+    model = infer = render_remote_model(server)
+# Reruns and repeated uploads of the same image are answered from this cache
+cache, perceptual = render_cache_controls()
 
 # -----------------------------
 # 5. File uploader
 # -----------------------------
+mode = st.radio("Mode", ["Single image", "Batch (multiple images)"], horizontal=True)
+if mode != "Single image":
+    render_batch_mode(infer, labels, preprocess)
+    st.stop()
+
 uploaded_file = st.file_uploader(
     "Upload an image (jpg/png)", 
     type=["jpg", "jpeg", "png"]
@@ -68,26 +78,25 @@ uploaded_file = st.file_uploader(
 
 if uploaded_file is not None:
     # Display original image
-    image = Image.open(uploaded_file).convert("RGB")
-    st.image(image, caption="Uploaded Image", use_container_width=True)
-
-    # Preprocess
-    input_tensor = preprocess(image)
-    input_batch = input_tensor.unsqueeze(0)  # shape: [1, 3, 224, 224]
+    st.image(uploaded_file, caption="Uploaded Image", use_container_width=True)
 
-    # Move to device (CPU only for simplicity)
-    with torch.no_grad():
-        outputs = model(input_batch)
-        probabilities = F.softmax(outputs[0], dim=0)
+    # Nearest images by ResNet-18 features (index built with embeddings.py)
+    if st.toggle("🔎 Find similar images"):
+        render_similar_panel(model, uploaded_file.getvalue(), preprocess)
 
-    # Get top-5 predictions
-    top5_prob, top5_catid = torch.topk(probabilities, 5)
+    # Preprocess + inference (skipped when this image's result is cached)
+    top5_prob, top5_catid, cached = classify_image(
+        infer, uploaded_file.getvalue(), preprocess, cache,
+        namespace=st.session_state["backend_active"], perceptual=perceptual
+    )
+    if cached:
+        st.caption("⚡ Served from the prediction cache")
 
     st.subheader("🔍 Top-5 Predictions")
-    for i in range(top5_prob.size(0)):
+    for prob, catid in zip(top5_prob, top5_catid):
         st.write(
-            f"**{labels[top5_catid[i]]}** — "
-            f"probability: {top5_prob[i].item():.4f}"
+            f"**{labels[catid]}** — "
+            f"probability: {prob:.4f}"
         )
 
     # Show as table
@@ -102,3 +111,5 @@ if uploaded_file is not None:
 
 else:
     st.info("👆 Please upload an image to start.")
+
+render_cache_stats(cache)
@@ -1,9 +1,11 @@
 import streamlit as st
 import torch
 import torch.nn.functional as F
-from torchvision import models, transforms
+from torchvision import transforms
 from PIL import Image
-import requests
+
+from classifier import cold_start_caption, imagenet_labels, load_resnet18, render_backend_selector, render_video_mode
+from inference_server import inference_client, render_remote_model
 
 # -----------------------------
 # Page config
@@ -23,10 +25,10 @@ st.write("Using **PyTorch ResNet-18 (pretrained on ImageNet)** + Streamlit webca
 # -----------------------------
 @st.cache_data
 def load_imagenet_labels():
-    url = "https://raw.githubusercontent.com/pytorch/hub/master/imagenet_classes.txt"
-    r = requests.get(url)
-    labels = r.text.strip().split("\n")
-    return labels
+    """
+    ImageNet class names bundled with the torchvision weights (no network needed).
+    """
+    return imagenet_labels()
 
 
 # -----------------------------
@@ -34,13 +36,16 @@ def load_imagenet_labels():
 # -----------------------------
 @st.cache_resource
 def load_model():
-    model = models.resnet18(weights=models.ResNet18_Weights.DEFAULT)
-    model.eval()
-    return model
+    # Weights from the local cache dir, then one warm-up pass; timings shown in the sidebar
+    return load_resnet18()
 
 
 labels = load_imagenet_labels()
-model = load_model()
+# Thin client when an inference server is configured (CV_INFERENCE_SOCKET)
+server = inference_client()
+if server is None:
+    model, cold_start = load_model()
+    st.sidebar.caption(cold_start_caption(cold_start))
 
 # Preprocess pipeline for ResNet
 preprocess = transforms.Compose([
@@ -53,6 +58,24 @@ preprocess = transforms.Compose([
     ),
 ])
 
+# Inference backend: eager FP32 unless another is picked in the sidebar,
+# or whichever model the inference server is asked for
+if server is None:
+    infer = render_backend_selector(model, preprocess)
+else:
+    infer = render_remote_model(server)
+
+# -----------------------------
+# Real-time video (file or V4L2 device)
+# -----------------------------
+mode = st.radio("Mode", ["Take photo", "Real-time video"], horizontal=True)
+if mode != "Take photo":
+    st.subheader("Real-time Video")
+    st.info("Frames are classified continuously on a background thread; frames arriving faster "
+            "than the model can keep up are skipped.")
+    render_video_mode(infer, labels, preprocess)
+    st.stop()
+
 # -----------------------------
 # Webcam input
 # -----------------------------
@@ -76,7 +99,7 @@ if img_data is not None:
 
     # Inference
     with torch.no_grad():
-        outputs = model(input_batch)
+        outputs = infer(input_batch)
         probs = F.softmax(outputs[0], dim=0)
 
     # Top-5 predictions
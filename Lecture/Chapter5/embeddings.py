@@ -0,0 +1,405 @@
+# embeddings.py
+"""
+Image similarity search on ResNet-18 penultimate features.
+
+An index is a directory:
+- vectors.f16: L2-normalised 512-d float16 rows, appended, read through np.memmap
+- ids.txt: one image path (relative to the indexed folder) per row, same order
+- meta.json: feature size and the indexed folder
+- ivf.npz / pq_codes.npy + pq.npz (optional, from `train`): inverted lists over
+  spherical k-means centroids, and product-quantisation codes for fast scans
+
+Search is cosine top-k: a chunked float16 scan, or with IVF only the `nprobe`
+closest lists; with PQ the candidates are ranked by code lookups first and only
+the best `rerank` are scored exactly.
+
+    python embeddings.py build photos/ --index emb/        # extract features (resumable)
+    python embeddings.py train --index emb/ --nlist 1024 --pq 32
+    python embeddings.py bench --n 1000000                 # ms/query and recall on synthetic vectors
+"""
+import argparse
+import copy
+import json
+import os
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+import pyarrow as pa
+import streamlit as st
+import torch
+from torch.utils.data import DataLoader
+
+from classifier import FastPreprocess, load_image, load_resnet18
+from classify_folder import FolderDataset, collate, path_key
+from inference_server import RemoteModel
+
+DIM = 512
+EMBEDDING_INDEX = Path(os.environ.get("CV_EMBEDDING_INDEX", Path(__file__).with_name(".cache") / "embeddings"))
+# Rows per block when scanning or assigning (16k x 512 float32 = 32 MB)
+CHUNK = 16_384
+
+
+# -----------------------------
+# Features
+# -----------------------------
+def feature_extractor(model: torch.nn.Module) -> torch.nn.Module:
+    """Copy of ResNet-18 that stops after global average pooling: [B, 3, 224, 224] -> [B, 512]."""
+    if isinstance(model, RemoteModel):
+        return RemoteModel(model.client, "resnet18-features")
+    extractor = copy.deepcopy(model)
+    extractor.fc = torch.nn.Identity()
+    return extractor.eval()
+
+
+def embed(extractor: torch.nn.Module, batch: torch.Tensor) -> np.ndarray:
+    with torch.inference_mode():
+        return extractor(batch).float().numpy()
+
+
+def normalize(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    return x / np.maximum(np.linalg.norm(x, axis=-1, keepdims=True), 1e-12)
+
+
+# -----------------------------
+# k-means (IVF lists and PQ codebooks)
+# -----------------------------
+def nearest_centroid(x: np.ndarray, centroids: np.ndarray, cosine: bool = True) -> np.ndarray:
+    """Index of the best centroid per row (max inner product, or min L2 distance), in chunks."""
+    out = np.empty(len(x), dtype=np.int64)
+    c = centroids.astype(np.float32)
+    c_sq = (c * c).sum(1)
+    for start in range(0, len(x), CHUNK):
+        block = np.asarray(x[start:start + CHUNK], dtype=np.float32)
+        scores = block @ c.T
+        out[start:start + len(block)] = scores.argmax(1) if cosine else (c_sq - 2 * scores).argmin(1)
+    return out
+
+
+def kmeans(x: np.ndarray, k: int, iters: int = 10, cosine: bool = True, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; with cosine=True centroids are kept on the unit sphere."""
+    if not 0 < k <= len(x):
+        raise ValueError(f"k-means needs 1 to {len(x)} clusters for {len(x)} points, got {k}")
+    rng = np.random.default_rng(seed)
+    x = np.asarray(x, dtype=np.float32)
+    centroids = x[rng.choice(len(x), k, replace=False)].copy()
+    for _ in range(iters):
+        assign = nearest_centroid(x, centroids, cosine)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=k)
+        starts = np.searchsorted(assign[order], np.arange(k))
+        filled = counts > 0
+        sums = np.add.reduceat(x[order], starts[filled])
+        centroids[filled] = normalize(sums) if cosine else sums / counts[filled, None]
+        empty = np.flatnonzero(~filled)
+        centroids[empty] = x[rng.choice(len(x), len(empty), replace=False)]
+    return centroids
+
+
+def _top(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k largest scores, best first."""
+    if k < len(scores):
+        part = np.argpartition(-scores, k)[:k]
+    else:
+        part = np.arange(len(scores))
+    return part[np.argsort(-scores[part], kind="stable")]
+
+
+# -----------------------------
+# Index
+# -----------------------------
+class EmbeddingIndex:
+    """Append-only embedding store with flat, IVF and PQ cosine search (see module docstring)."""
+
+    def __init__(self, path: Path = EMBEDDING_INDEX, root: Optional[Path] = None, dim: int = DIM):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        meta_path = self.path / "meta.json"
+        meta = json.loads(meta_path.read_text()) if meta_path.exists() else {}
+        if root is not None or not meta:
+            meta = {"dim": meta.get("dim", dim), "root": str(Path(root).resolve()) if root else meta.get("root", "")}
+            meta_path.write_text(json.dumps(meta))
+        self.dim = int(meta["dim"])
+        self.root = Path(meta["root"])
+        self.reload()
+
+    def reload(self):
+        ids_path = self.path / "ids.txt"
+        # A trailing id without its newline is a partial write and does not count
+        lines = ids_path.read_text(encoding="utf-8").split("\n")[:-1] if ids_path.exists() else []
+        vec_path = self.path / "vectors.f16"
+        rows = vec_path.stat().st_size // (2 * self.dim) if vec_path.exists() else 0
+        # An interrupted append may leave one side longer; only complete pairs count
+        self.n = min(len(lines), rows)
+        self.ids = pa.array(lines[:self.n], type=pa.string())
+        del lines
+        self.vectors = (np.memmap(vec_path, dtype=np.float16, mode="r", shape=(self.n, self.dim)) if self.n
+                        else np.empty((0, self.dim), dtype=np.float16))
+        self.ivf = self._load_npz("ivf.npz")
+        self.pq = self._load_npz("pq.npz")
+        self.pq_codes = np.load(self.path / "pq_codes.npy", mmap_mode="r") if self.pq is not None else None
+        self._aligned = False
+
+    def _load_npz(self, name: str) -> Optional[dict]:
+        """Trained structure, or None if missing or built for a different number of rows."""
+        path = self.path / name
+        if not path.exists():
+            return None
+        with np.load(path) as f:
+            data = {key: f[key] for key in f.files}
+        return data if int(data["rows"]) == self.n else None
+
+    def describe(self) -> str:
+        parts = [f"IVF {len(self.ivf['centroids'])} lists" if self.ivf is not None else "flat"]
+        if self.pq is not None:
+            parts.append(f"PQ {self.pq['codebooks'].shape[0]}x8 bit")
+        return " + ".join(parts)
+
+    def id(self, row: int) -> str:
+        return self.ids[int(row)].as_py()
+
+    def _truncate(self):
+        """Cut both files back to the self.n complete pairs, dropping whatever an interrupted append left over."""
+        with open(self.path / "vectors.f16", "ab") as fh:
+            fh.truncate(self.n * 2 * self.dim)
+        ids_path = self.path / "ids.txt"
+        data = np.fromfile(ids_path, dtype=np.uint8) if ids_path.exists() else np.empty(0, np.uint8)
+        newlines = np.flatnonzero(data == ord("\n"))
+        with open(ids_path, "ab") as fh:
+            fh.truncate(int(newlines[self.n - 1]) + 1 if self.n else 0)
+        self._aligned = True
+
+    def add(self, ids: Sequence[str], vectors: np.ndarray):
+        """Append rows (normalised here); call reload() to search them."""
+        if len(ids) != len(vectors):
+            raise ValueError(f"{len(ids)} ids for {len(vectors)} vectors")
+        if not self._aligned:
+            # Otherwise every new vector would land at a different row than its id
+            self._truncate()
+        with open(self.path / "vectors.f16", "ab") as fh:
+            fh.write(normalize(vectors).astype(np.float16).tobytes())
+        with open(self.path / "ids.txt", "a", encoding="utf-8") as fh:
+            fh.write("".join(f"{i}\n" for i in ids))
+
+    def train(self, nlist: int = 0, pq_subspaces: int = 0, sample: int = 100_000, iters: int = 10, seed: int = 0):
+        """Build IVF lists (nlist > 0) and/or PQ codes (pq_subspaces > 0, must divide dim) over all rows."""
+        # Checked before anything is written, so a bad option leaves the index as it was
+        n_train = min(sample, self.n)
+        if nlist and not 0 < nlist <= n_train:
+            raise ValueError(f"--nlist must be between 1 and the {n_train:,} training rows, got {nlist}")
+        if pq_subspaces and self.dim % pq_subspaces:
+            raise ValueError(f"--pq must divide {self.dim}")
+        if pq_subspaces and n_train < 256:
+            raise ValueError(f"--pq trains 256 centroids per subspace, so it needs at least 256 rows, got {n_train}")
+        rng = np.random.default_rng(seed)
+        train_rows = np.sort(rng.choice(self.n, n_train, replace=False))
+        train = self.vectors[train_rows].astype(np.float32)
+        if nlist:
+            centroids = kmeans(train, nlist, iters, cosine=True, seed=seed)
+            assign = nearest_centroid(self.vectors, centroids)
+            order = np.argsort(assign, kind="stable")
+            offsets = np.r_[0, np.cumsum(np.bincount(assign, minlength=nlist))]
+            np.savez(self.path / "ivf.npz", rows=self.n, centroids=centroids, order=order, offsets=offsets)
+        if pq_subspaces:
+            sub = self.dim // pq_subspaces
+            codebooks = np.stack([kmeans(train[:, s * sub:(s + 1) * sub], 256, iters, cosine=False, seed=seed)
+                                  for s in range(pq_subspaces)])
+            codes = np.lib.format.open_memmap(self.path / "pq_codes.npy", mode="w+", dtype=np.uint8,
+                                              shape=(self.n, pq_subspaces))
+            for start in range(0, self.n, CHUNK):
+                block = self.vectors[start:start + CHUNK].astype(np.float32)
+                for s in range(pq_subspaces):
+                    codes[start:start + len(block), s] = nearest_centroid(block[:, s * sub:(s + 1) * sub],
+                                                                         codebooks[s], cosine=False)
+            codes.flush()
+            del codes
+            np.savez(self.path / "pq.npz", rows=self.n, codebooks=codebooks)
+        self.reload()
+
+    def search(self, query: np.ndarray, k: int = 10, nprobe: int = 8, rerank: int = 256,
+               exact: bool = False) -> List[Tuple[str, float]]:
+        """(id, cosine similarity) of the k nearest rows; exact=True ignores IVF/PQ."""
+        if not self.n:
+            return []
+        q = normalize(query).ravel()
+        rows = None
+        if self.ivf is not None and not exact:
+            centroids, order, offsets = self.ivf["centroids"], self.ivf["order"], self.ivf["offsets"]
+            probe = _top(centroids @ q, min(nprobe, len(centroids)))
+            rows = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in probe])
+        if self.pq is not None and not exact and (rows is None or len(rows) > rerank):
+            codebooks = self.pq["codebooks"]
+            m, _, sub = codebooks.shape
+            table = np.einsum("msd,md->ms", codebooks, q.reshape(m, sub))  # [m, 256] partial dot products
+            codes = self.pq_codes if rows is None else self.pq_codes[np.sort(rows)]
+            candidates = np.sort(rows) if rows is not None else None
+            approx = np.zeros(len(codes), dtype=np.float32)
+            for s in range(m):
+                approx += table[s, codes[:, s]]
+            keep = _top(approx, rerank)
+            rows = keep if candidates is None else candidates[keep]
+        if rows is None:
+            best_rows, best_scores = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            for start in range(0, self.n, CHUNK):
+                scores = self.vectors[start:start + CHUNK].astype(np.float32) @ q
+                top = _top(scores, k)
+                best_rows = np.r_[best_rows, start + top]
+                best_scores = np.r_[best_scores, scores[top]]
+            top = _top(best_scores, k)
+            rows, scores = best_rows[top], best_scores[top]
+        else:
+            rows = np.sort(rows)  # sequential reads from the memmap
+            scores = self.vectors[rows].astype(np.float32) @ q
+            top = _top(scores, k)
+            rows, scores = rows[top], scores[top]
+        return [(self.id(r), float(s)) for r, s in zip(rows, scores)]
+
+
+# -----------------------------
+# Streamlit: find similar
+# -----------------------------
+INDEX_FILES = ("ids.txt", "vectors.f16", "ivf.npz", "pq.npz", "pq_codes.npy")
+
+
+def index_mtimes(path: Path) -> Tuple[float, ...]:
+    """Modification time of each file reload() reads (0 if missing), so a build or train changes it."""
+    return tuple((path / name).stat().st_mtime if (path / name).exists() else 0.0 for name in INDEX_FILES)
+
+
+@st.cache_resource(max_entries=2)
+def open_index(path: str, modified: Tuple[float, ...]) -> EmbeddingIndex:
+    """Cached per index directory and index_mtimes (reopened after a rebuild or train)."""
+    return EmbeddingIndex(Path(path))
+
+
+@st.cache_resource
+def _cached_extractor(_model: torch.nn.Module) -> torch.nn.Module:
+    return feature_extractor(_model)
+
+
+def render_similar_panel(model: torch.nn.Module, data: bytes, preprocess=None, index_path: Path = EMBEDDING_INDEX,
+                         k: int = 8, key: str = "similar"):
+    """Nearest images in the embedding index to the uploaded image, as a thumbnail grid."""
+    ids_path = Path(index_path) / "ids.txt"
+    if not ids_path.exists():
+        st.caption(f"No embedding index at `{index_path}`. Build one with "
+                   f"`python embeddings.py build <folder> --index {index_path}`.")
+        return
+    index = open_index(str(index_path), index_mtimes(Path(index_path)))
+    preprocess = preprocess or FastPreprocess()
+    image = getattr(preprocess, "decode", load_image)(data)
+    query = embed(_cached_extractor(model), preprocess(image).unsqueeze(0))[0]
+    exact = st.toggle("Exact search", key=f"{key}_exact", help="Scan every vector instead of IVF/PQ")
+    t0 = time.perf_counter()
+    hits = index.search(query, k, exact=exact)
+    ms = (time.perf_counter() - t0) * 1000
+    st.caption(f"{len(hits)} nearest of {index.n:,} images in {ms:.1f} ms "
+               f"({'exact' if exact else index.describe()})")
+    cols = st.columns(4)
+    for i, (file, score) in enumerate(hits):
+        path = index.root / file
+        with cols[i % 4]:
+            if path.exists():
+                st.image(str(path), use_container_width=True)
+            st.caption(f"{score:.3f} · {file}")
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def build(folder: Path, index_path: Path, batch_size: int = 64, workers: int = 2):
+    model, _ = load_resnet18()
+    extractor = feature_extractor(model)
+    index = EmbeddingIndex(index_path, root=folder)
+    done = np.unique(np.fromiter((path_key(f.as_py()) for f in index.ids), dtype=np.int64, count=index.n))
+    loader_kwargs = {"prefetch_factor": 2} if workers else {}
+    loader = DataLoader(FolderDataset(folder, done, FastPreprocess()), batch_size=batch_size,
+                        num_workers=workers, collate_fn=collate, **loader_kwargs)
+    t0 = time.perf_counter()
+    added = 0
+    for names, batch, errors in loader:
+        for name, error in errors:
+            print(f"skipped {name}: {error}")
+        if names:
+            index.add(names, embed(extractor, batch))
+            added += len(names)
+    elapsed = time.perf_counter() - t0
+    index.reload()
+    print(f"added {added:,} image(s) in {elapsed:.1f} s; index has {index.n:,}")
+
+
+def bench(n: int, queries: int, nlist: int, pq: int, k: int = 10, seed: int = 0):
+    """Clustered synthetic vectors (features are far from uniform), recall@k against exact search."""
+    rng = np.random.default_rng(seed)
+    centers = normalize(rng.standard_normal((max(n // 500, 1), DIM)))
+    with tempfile.TemporaryDirectory() as tmp:
+        index = EmbeddingIndex(Path(tmp))
+        for start in range(0, n, CHUNK * 4):
+            size = min(CHUNK * 4, n - start)
+            vectors = centers[rng.integers(0, len(centers), size)] + 0.05 * rng.standard_normal((size, DIM))
+            index.add([str(i) for i in range(start, start + size)], vectors)
+        index.reload()
+        query_vectors = index.vectors[rng.choice(n, queries, replace=False)].astype(np.float32)
+        query_vectors += 0.02 * rng.standard_normal(query_vectors.shape)
+
+        def run(label: str, **kwargs):
+            t0 = time.perf_counter()
+            results = [{i for i, _ in index.search(q, k, **kwargs)} for q in query_vectors]
+            ms = (time.perf_counter() - t0) * 1000 / queries
+            recall = np.mean([len(r & e) / k for r, e in zip(results, exact)]) if exact else 1.0
+            print(f"{label:<22}{ms:>10.2f}{recall:>10.3f}")
+            return results
+
+        print(f"{n:,} vectors x {DIM} (float16, {index.vectors.nbytes / 2**20:.0f} MB), {queries} queries")
+        print(f"{'search':<22}{'ms/query':>10}{'recall':>10}")
+        exact = None
+        exact = run("exact (flat scan)", exact=True)
+        t0 = time.perf_counter()
+        index.train(nlist=nlist)
+        print(f"  train IVF {nlist}: {time.perf_counter() - t0:.1f} s")
+        run("IVF nprobe=8", nprobe=8)
+        run("IVF nprobe=32", nprobe=32)
+        t0 = time.perf_counter()
+        index.train(nlist=nlist, pq_subspaces=pq)
+        print(f"  train IVF + PQ {pq}: {time.perf_counter() - t0:.1f} s")
+        run("IVF+PQ nprobe=32", nprobe=32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_build = sub.add_parser("build", help="Append features for every new image under a folder")
+    p_build.add_argument("folder", type=Path)
+    p_build.add_argument("--index", type=Path, default=EMBEDDING_INDEX)
+    p_build.add_argument("--batch-size", type=int, default=64)
+    p_build.add_argument("--workers", type=int, default=min(4, os.cpu_count() or 1))
+    p_train = sub.add_parser("train", help="Build IVF lists and/or PQ codes over the whole index")
+    p_train.add_argument("--index", type=Path, default=EMBEDDING_INDEX)
+    p_train.add_argument("--nlist", type=int, default=0, help="Inverted lists (about sqrt(N) is a good start)")
+    p_train.add_argument("--pq", type=int, default=0, help="PQ subspaces (divides 512, e.g. 32 or 64)")
+    p_bench = sub.add_parser("bench", help="Search latency and recall on synthetic vectors")
+    p_bench.add_argument("--n", type=int, default=200_000)
+    p_bench.add_argument("--queries", type=int, default=100)
+    p_bench.add_argument("--nlist", type=int, default=None)
+    p_bench.add_argument("--pq", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.cmd == "build":
+        build(args.folder, args.index, args.batch_size, args.workers)
+    elif args.cmd == "train":
+        index = EmbeddingIndex(args.index)
+        t0 = time.perf_counter()
+        try:
+            index.train(args.nlist, args.pq)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"trained {index.describe()} over {index.n:,} vectors in {time.perf_counter() - t0:.1f} s")
+    else:
+        bench(args.n, args.queries, args.nlist or int(np.sqrt(args.n)), args.pq)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,471 @@
+# inference_server.py
+"""
+Local CPU inference server shared by the classifier apps.
+
+One parent process loads every model once, moves the weights into shared memory
+and forks the worker processes, so all workers (and all app sessions) use a
+single copy of the weights. Workers accept on the same Unix socket; each one
+collects requests into micro-batches (up to --max-batch images or --max-wait-ms,
+whichever comes first) before running the model.
+
+Protocol (per message, both directions): 4-byte big-endian header length, JSON
+header, then `size` bytes of payload. Inference requests carry a float32
+[N, 3, 224, 224] tensor and get the model output back as float32.
+
+With CV_INFERENCE_SOCKET set, cv_app1 / cv_app2 / AILab5 become thin clients:
+they preprocess locally and send tensors here instead of loading weights.
+
+    python inference_server.py serve --socket /tmp/cv_inference.sock --workers 2
+    CV_INFERENCE_SOCKET=/tmp/cv_inference.sock streamlit run cv_app1.py
+    python inference_server.py stats --socket /tmp/cv_inference.sock
+    python inference_server.py bench --socket /tmp/cv_inference.sock --clients 16
+"""
+import argparse
+import asyncio
+import copy
+import gc
+import json
+import multiprocessing as mp
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+import torch
+
+from classifier import load_resnet18
+
+# Upper bounds (ms) of the request latency histogram buckets; the last one is open
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, float("inf"))
+INPUT_SHAPE = (3, 224, 224)
+HEADER = struct.Struct("!I")
+
+
+def load_models() -> Dict[str, torch.nn.Module]:
+    """
+    ResNet-18 (FP32), a variant with a dynamic-INT8 classifier layer and the 512-d
+    pooled features. All three reuse the same convolution modules, so the conv
+    weights exist once.
+    """
+    model, _ = load_resnet18()
+    features = torch.nn.Sequential(*list(model.children())[:-1], torch.nn.Flatten(1)).eval()
+    int8_fc = torch.ao.quantization.quantize_dynamic(torch.nn.Sequential(copy.deepcopy(model.fc)),
+                                                     {torch.nn.Linear}, dtype=torch.qint8)
+    return {
+        "resnet18": model,
+        "resnet18-int8": torch.nn.Sequential(features, int8_fc).eval(),
+        "resnet18-features": features,
+    }
+
+
+# -----------------------------
+# Framing
+# -----------------------------
+def pack(header: Dict[str, Any], payload: bytes = b"") -> bytes:
+    data = json.dumps({**header, "size": len(payload)}).encode("utf-8")
+    return HEADER.pack(len(data)) + data + payload
+
+
+async def read_message(reader: asyncio.StreamReader) -> Tuple[Dict[str, Any], bytes]:
+    (length,) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    header = json.loads(await reader.readexactly(length))
+    return header, await reader.readexactly(header.get("size", 0))
+
+
+def batch_error(header: Dict[str, Any], payload: bytes) -> Optional[str]:
+    """Why an infer request is not a float32 (N, *INPUT_SHAPE) batch, or None. Checked before
+    queueing: one odd tensor would fail torch.cat for the whole micro-batch."""
+    shape = header.get("shape")
+    if (not isinstance(shape, list) or len(shape) != 1 + len(INPUT_SHAPE) or tuple(shape[1:]) != INPUT_SHAPE
+            or not isinstance(shape[0], int) or shape[0] < 1):
+        return f"expected a batch of shape (N, {', '.join(map(str, INPUT_SHAPE))}), got {shape}"
+    if len(payload) != 4 * int(np.prod(shape)):
+        return f"payload is {len(payload)} bytes, shape {shape} needs {4 * int(np.prod(shape))} (float32)"
+    return None
+
+
+def _recv_exactly(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray(n)
+    view = memoryview(buf)
+    while n:
+        got = sock.recv_into(view[len(buf) - n:], n)
+        if not got:
+            raise ConnectionError("inference server closed the connection")
+        n -= got
+    return bytes(buf)
+
+
+# -----------------------------
+# Server
+# -----------------------------
+class ServerStats:
+    """Counters in shared memory, updated by every worker process."""
+
+    def __init__(self, max_batch: int):
+        ctx = mp.get_context("fork")
+        self.latency = ctx.Array("q", len(LATENCY_BUCKETS_MS))
+        # index = images in the forward pass; the last slot also counts anything larger
+        self.batch_size = ctx.Array("q", max_batch + 1)
+        self.totals = ctx.Array("q", 3)  # requests, images, forward passes
+
+    def record_request(self, ms: float):
+        with self.latency.get_lock():
+            self.latency[int(np.searchsorted(LATENCY_BUCKETS_MS, ms))] += 1
+        with self.totals.get_lock():
+            self.totals[0] += 1
+
+    def record_batch(self, images: int):
+        with self.batch_size.get_lock():
+            self.batch_size[min(images, len(self.batch_size) - 1)] += 1
+        with self.totals.get_lock():
+            self.totals[1] += images
+            self.totals[2] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "latency_ms": {"le": [b if np.isfinite(b) else None for b in LATENCY_BUCKETS_MS],
+                           "counts": list(self.latency[:])},
+            "batch_size": {"size": list(range(len(self.batch_size))), "counts": list(self.batch_size[:])},
+            "requests": self.totals[0], "images": self.totals[1], "batches": self.totals[2],
+        }
+
+
+class MicroBatcher:
+    """Queues requests for one model and runs them together (one worker process, one model thread)."""
+
+    def __init__(self, model: torch.nn.Module, max_batch: int, max_wait_ms: float, stats: ServerStats,
+                 executor: ThreadPoolExecutor):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.stats = stats
+        self.executor = executor
+        self.queue: "asyncio.Queue[Tuple[torch.Tensor, asyncio.Future]]" = asyncio.Queue()
+
+    async def submit(self, batch: torch.Tensor) -> Tuple[torch.Tensor, int]:
+        """Model output for `batch` plus the size of the forward pass it ran in."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((batch, future))
+        return await future
+
+    def _forward(self, batch: torch.Tensor) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.model(batch)
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            images = len(items[0][0])
+            deadline = loop.time() + self.max_wait
+            while images < self.max_batch:
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), max(0.0, deadline - loop.time()))
+                except asyncio.TimeoutError:
+                    break
+                items.append(item)
+                images += len(item[0])
+            try:
+                batch = torch.cat([t for t, _ in items]) if len(items) > 1 else items[0][0]
+                out = await loop.run_in_executor(self.executor, self._forward, batch)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self.stats.record_batch(images)
+            start = 0
+            for tensor, future in items:
+                future.set_result((out[start:start + len(tensor)], images))
+                start += len(tensor)
+
+
+class InferenceWorker:
+    """One forked process: asyncio server on the shared socket, a MicroBatcher per model."""
+
+    def __init__(self, models: Dict[str, torch.nn.Module], stats: ServerStats, config: Dict[str, Any]):
+        self.models = models
+        self.stats = stats
+        self.config = config
+
+    def info(self) -> Dict[str, Any]:
+        return {**self.config, "models": {name: self.outputs[name] for name in self.models},
+                **self.stats.snapshot()}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    header, payload = await read_message(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                t0 = time.perf_counter()
+                op = header.get("op")
+                error = batch_error(header, payload) if op == "infer" else None
+                if op == "stats":
+                    writer.write(pack(self.info()))
+                elif error:
+                    writer.write(pack({"error": error}))
+                elif op == "infer" and header.get("model") in self.batchers:
+                    batch = torch.from_numpy(np.frombuffer(payload, dtype=np.float32).copy()).view(header["shape"])
+                    out, batched = await self.batchers[header["model"]].submit(batch)
+                    out = out.float().contiguous().numpy()
+                    ms = (time.perf_counter() - t0) * 1000
+                    writer.write(pack({"shape": list(out.shape), "server_ms": ms, "batch": batched}, out.tobytes()))
+                    self.stats.record_request(ms)
+                else:
+                    writer.write(pack({"error": f"unknown op/model: {op} {header.get('model')}"}))
+                await writer.drain()
+        except Exception as e:  # bad request: report and drop the connection
+            try:
+                writer.write(pack({"error": str(e)}))
+                await writer.drain()
+            except Exception:
+                pass
+        finally:
+            writer.close()
+
+    async def serve(self, sock: socket.socket):
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="model")
+        self.batchers = {name: MicroBatcher(model, self.config["max_batch"], self.config["max_wait_ms"],
+                                            self.stats, executor)
+                         for name, model in self.models.items()}
+        for batcher in self.batchers.values():
+            asyncio.ensure_future(batcher.run())
+        server = await asyncio.start_unix_server(self.handle, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    def run(self, sock: socket.socket, threads: int):
+        torch.set_num_threads(threads)
+        with torch.inference_mode():
+            self.outputs = {name: int(m(torch.zeros(1, *INPUT_SHAPE)).shape[1]) for name, m in self.models.items()}
+        asyncio.run(self.serve(sock))
+
+
+def serve(path: str, workers: int = 2, max_batch: int = 16, max_wait_ms: float = 5.0,
+          threads: Optional[int] = None):
+    """Load the models, share their weights and fork `workers` processes onto one Unix socket."""
+    models = load_models()
+    for model in models.values():
+        model.share_memory()  # weights in shared memory: workers read them, never copy them
+    threads = threads or max(1, (os.cpu_count() or 1) // workers)
+    config = {"workers": workers, "max_batch": max_batch, "max_wait_ms": max_wait_ms, "threads": threads,
+              "pid": os.getpid()}
+    stats = ServerStats(max_batch)
+
+    if os.path.exists(path):
+        os.unlink(path)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.bind(path)
+    sock.listen(256)
+    # Objects that exist now are never collected in the children, so the GC does not
+    # touch (and copy-on-write) their pages
+    gc.freeze()
+    ctx = mp.get_context("fork")
+    procs = [ctx.Process(target=InferenceWorker(models, stats, config).run, args=(sock, threads), daemon=True)
+             for _ in range(workers)]
+    for p in procs:
+        p.start()
+    print(f"serving {', '.join(models)} on {path}: {workers} worker(s) x {threads} thread(s), "
+          f"batches of <= {max_batch} images / {max_wait_ms} ms")
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            p.terminate()
+        sock.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+
+# -----------------------------
+# Client
+# -----------------------------
+class InferenceClient:
+    """Blocking client; one connection per calling thread (Streamlit sessions, video threads)."""
+
+    def __init__(self, path: str, timeout: float = 60.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _socket(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            self._local.sock = sock
+        return sock
+
+    def _call(self, header: Dict[str, Any], payload: bytes = b"") -> Tuple[Dict[str, Any], bytes]:
+        for attempt in range(2):
+            try:
+                sock = self._socket()
+                sock.sendall(pack(header, payload))
+                (length,) = HEADER.unpack(_recv_exactly(sock, HEADER.size))
+                reply = json.loads(_recv_exactly(sock, length))
+                data = _recv_exactly(sock, reply.get("size", 0))
+                break
+            except Exception as e:
+                # Whatever went wrong (timeout, bad reply), the stream position is unknown: a
+                # late reply would be read as the answer to the next request
+                sock, self._local.sock = getattr(self._local, "sock", None), None
+                if sock is not None:
+                    sock.close()
+                if attempt or not isinstance(e, ConnectionError):
+                    raise  # only a dropped connection (server restarted) is retried, once
+        if "error" in reply:
+            raise RuntimeError(reply["error"])
+        return reply, data
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call({"op": "stats"})[0]
+
+    def infer(self, model: str, batch: torch.Tensor) -> torch.Tensor:
+        array = batch.detach().to(torch.float32).contiguous().numpy()
+        reply, data = self._call({"op": "infer", "model": model, "shape": list(array.shape)}, array.tobytes())
+        return torch.from_numpy(np.frombuffer(data, dtype=np.float32).copy()).view(reply["shape"])
+
+
+class RemoteModel:
+    """Callable like the local module (batch in, outputs out), backed by a server model."""
+
+    def __init__(self, client: InferenceClient, name: str):
+        self.client = client
+        self.name = name
+
+    def __call__(self, batch: torch.Tensor) -> torch.Tensor:
+        return self.client.infer(self.name, batch)
+
+    def eval(self) -> "RemoteModel":
+        return self
+
+
+# -----------------------------
+# Streamlit: thin client
+# -----------------------------
+@st.cache_resource
+def _client(path: str) -> InferenceClient:
+    return InferenceClient(path)
+
+
+def inference_client() -> Optional[InferenceClient]:
+    """Client for $CV_INFERENCE_SOCKET, or None when the app should load the model itself."""
+    path = os.environ.get("CV_INFERENCE_SOCKET")
+    return _client(path) if path else None
+
+
+def histogram_frames(info: Dict[str, Any]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """(requests per latency bucket, forward passes per batch size) for display."""
+    bounds = info["latency_ms"]["le"]
+    latency = pd.DataFrame({
+        "latency": [f"≤{b} ms" if b is not None else f">{bounds[-2]} ms" for b in bounds],
+        "requests": info["latency_ms"]["counts"],
+    })
+    sizes = info["batch_size"]["size"]
+    batches = pd.DataFrame({
+        "batch size": [str(s) if s < sizes[-1] else f"≥{s}" for s in sizes],
+        "batches": info["batch_size"]["counts"],
+    }).iloc[1:]
+    return latency, batches
+
+
+def render_remote_model(client: InferenceClient, key: str = "backend") -> RemoteModel:
+    """Sidebar: server model choice plus latency and batch-size histograms. Returns the model to call."""
+    with st.sidebar.expander("🖧 Inference server"):
+        try:
+            info = client.stats()
+        except OSError as e:
+            st.error(f"Inference server not reachable at {client.path}: {e}")
+            st.stop()
+        names = [name for name, outputs in info["models"].items() if outputs == 1000]
+        name = st.selectbox("Model", names, key=f"{key}_remote")
+        st.caption(f"{info['workers']} worker process(es) sharing one copy of the weights; batches of up to "
+                   f"{info['max_batch']} images or {info['max_wait_ms']} ms.")
+        latency, batches = histogram_frames(info)
+        st.caption(f"{info['requests']:,} request(s), {info['images']:,} image(s) in {info['batches']:,} "
+                   f"forward pass(es)")
+        st.bar_chart(latency, x="latency", y="requests", height=180)
+        st.bar_chart(batches, x="batch size", y="batches", height=180)
+    # Same key render_backend_selector sets, so cached predictions stay per model
+    st.session_state[f"{key}_active"] = ("server", name)
+    return RemoteModel(client, name)
+
+
+# -----------------------------
+# CLI
+# -----------------------------
+def bench(path: str, clients: int, requests: int, model: str):
+    """Concurrent single-image requests; client-side latency and the server's batching."""
+    client = InferenceClient(path)
+    before = client.stats()
+    batch = torch.randn(1, *INPUT_SHAPE)
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def run(n: int):
+        for _ in range(n):
+            t0 = time.perf_counter()
+            client.infer(model, batch)
+            with lock:
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    threads = [threading.Thread(target=run, args=(requests // clients,)) for _ in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    after = client.stats()
+    ms = np.array(latencies)
+    passes = after["batches"] - before["batches"]
+    print(f"{len(ms):,} requests, {clients} clients, {elapsed:.2f} s ({len(ms) / elapsed:.1f} images/s)")
+    print(f"latency p50 {np.percentile(ms, 50):.1f} ms  p99 {np.percentile(ms, 99):.1f} ms")
+    print(f"mean batch {(after['images'] - before['images']) / max(passes, 1):.1f} images over {passes} pass(es)")
+
+
+def print_stats(info: Dict[str, Any]):
+    latency, batches = histogram_frames(info)
+    print(f"models: {info['models']}  workers: {info['workers']}  max batch: {info['max_batch']}  "
+          f"max wait: {info['max_wait_ms']} ms")
+    print(latency.to_string(index=False))
+    print(batches[batches["batches"] > 0].to_string(index=False))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--socket", default=os.environ.get("CV_INFERENCE_SOCKET", "/tmp/cv_inference.sock"))
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_serve = sub.add_parser("serve")
+    p_serve.add_argument("--workers", type=int, default=2)
+    p_serve.add_argument("--max-batch", type=int, default=16)
+    p_serve.add_argument("--max-wait-ms", type=float, default=5.0)
+    p_serve.add_argument("--threads", type=int, default=None, help="torch threads per worker")
+    sub.add_parser("stats")
+    p_bench = sub.add_parser("bench")
+    p_bench.add_argument("--clients", type=int, default=16)
+    p_bench.add_argument("--requests", type=int, default=512)
+    p_bench.add_argument("--model", default="resnet18")
+    args = parser.parse_args()
+
+    if args.cmd == "serve":
+        serve(args.socket, args.workers, args.max_batch, args.max_wait_ms, args.threads)
+    elif args.cmd == "stats":
+        print_stats(InferenceClient(args.socket).stats())
+    else:
+        bench(args.socket, args.clients, args.requests, args.model)
+
+
+if __name__ == "__main__":
+    main()